@@ -1,9 +1,8 @@
-import json
-import time
 import os
+import sys
+import asyncio
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
@@ -17,15 +16,13 @@ if not api_key:
 
 client = genai.Client(api_key=api_key)
 
-input_file_path = os.path.join(current_dir, 'raw_faq.json')
+sys.path.append(os.path.join(parent_dir, '04_RAG_ENGINE'))
+from pipeline_utils import arun_preprocess_stage, iter_json_array
+
+LLM_MODEL = 'gemini-2.0-flash-exp'
+LLM_CONFIG = {"response_mime_type": "application/json"}
 
-try:
-    with open(input_file_path, 'r', encoding='utf-8') as f:
-        raw_faqs = json.load(f)
-    print(f" '{input_file_path}' 로드 성공! 총 {len(raw_faqs)}개의 데이터를 찾았습니다.")
-except FileNotFoundError:
-    print(f" 오류: '{input_file_path}' 파일을 찾을 수 없습니다.")
-    raw_faqs = []
+input_file_path = os.path.join(current_dir, 'raw_faq.json')
 
 PROMPT_TEMPLATE = """
 당신은 IELTS 학원의 전문 상담 데이터를 관리하는 AI입니다.
@@ -62,52 +59,28 @@ PROMPT_TEMPLATE = """
 }}
 """
 
-def transform_raw_to_structured(raw_item):
-    prompt = PROMPT_TEMPLATE.format(
+def build_prompt(raw_item):
+    return PROMPT_TEMPLATE.format(
         category=raw_item.get('category', '기타'),
         subject=raw_item.get('subject', '제목없음'),
         contents=raw_item.get('contents', '내용없음')
     )
-    
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-exp',
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type='application/json'
-            )
-        )
-        return json.loads(response.text)
-    except Exception as e:
-        print(f" 변환 실패 (제목: {raw_item.get('subject')}): {e}")
-        return None
 
-if __name__ == "__main__":
-    if not raw_faqs:
-        print("처리할 데이터가 없습니다. 종료합니다.")
-    else:
-        structured_faqs = []
-        total_count = len(raw_faqs)
+def natural_key(raw_item):
+    """적재 단계의 문서 id 가 되는 키. 답변을 고쳐도 질문이 같으면 같은 문서입니다."""
+    return str(raw_item.get('subject', '')).strip() or None
 
-        print(f"🔄 데이터 변환 시작... (안전 모드: 10초 간격)")
-        
-        for idx, item in enumerate(raw_faqs):
-            start_time = time.time() 
-            
-            result = transform_raw_to_structured(item)
-            if result:
-                structured_faqs.append(result)
-                print(f"   [{idx+1}/{total_count}] 성공: {item.get('subject')[:15]}...")
-            
-            wait_time = 10 
-            
-            print(f"      ㄴ ⏳ 다음 요청 대기 중... ({wait_time}초)")
-            time.sleep(wait_time) 
+async def arun(limiter=None):
+    if not os.path.exists(input_file_path):
+        print(f" 오류: '{input_file_path}' 파일을 찾을 수 없습니다.")
+        return
+    await arun_preprocess_stage(
+        client, LLM_MODEL, lambda: iter_json_array(input_file_path),
+        os.path.join(current_dir, 'structured_faq.jsonl'), build_prompt, PROMPT_TEMPLATE,
+        config=LLM_CONFIG, natural_key=natural_key,
+        describe=lambda item: str(item.get('subject', ''))[:15], limiter=limiter
+    )
 
-        output_path = os.path.join(current_dir, 'structured_faq.json')
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(structured_faqs, f, indent=2, ensure_ascii=False)
 
-        print(f"\n 전체 변환 완료! 총 {len(structured_faqs)}건 저장됨.")
-        print(f"파일 위치: {output_path}")
\ No newline at end of file
+if __name__ == "__main__":
+    asyncio.run(arun())
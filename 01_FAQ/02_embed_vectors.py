@@ -1,9 +1,9 @@
 import os
+import sys
 import json
-import time
+import asyncio
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
@@ -17,14 +17,18 @@ if not api_key:
 
 client = genai.Client(api_key=api_key)
 
+sys.path.append(os.path.join(parent_dir, '04_RAG_ENGINE'))
+from pipeline_utils import arun_embed_stage, embed_stage_config, shared_llm_cache
+
 EMBEDDING_MODEL = 'models/text-embedding-004'
 
-INPUT_FILE = os.path.join(current_dir, 'structured_faq.json')
-OUTPUT_FILE = os.path.join(current_dir, 'faq_db_ready.json')
+INPUT_FILE = os.path.join(current_dir, 'structured_faq.jsonl')
+LEGACY_INPUT_FILE = os.path.join(current_dir, 'structured_faq.json')
+OUTPUT_FILE = os.path.join(current_dir, 'faq_db_ready.jsonl')
 
 def create_embedding_payload(structured_json):
     """
-    구조화된 JSON을 받아 ChromaDB에 넣을 [ID, Vector, Metadata] 형태로 변환합니다.
+    구조화된 JSON을 받아 ChromaDB에 넣을 [ID, Metadata, Document] 형태로 변환합니다.
     """
     data = structured_json
     
@@ -50,20 +54,6 @@ def create_embedding_payload(structured_json):
         print(f"⚠️ Text serialization failed: {e}")
         return None
     
-    try:
-        response = client.models.embed_content(
-            model=EMBEDDING_MODEL,
-            contents=text_to_embed,
-            config=types.EmbedContentConfig(
-                task_type="RETRIEVAL_DOCUMENT"
-            )
-        )
-        vector = response.embeddings[0].values
-        
-    except Exception as e:
-        doc_id = data.get('meta_data', {}).get('doc_id', 'Unknown')
-        print(f"⚠️ Error generating embedding for {doc_id}: {e}")
-        return None
     metadata = {
         "category": data['meta_data'].get('category', ''),
         "intent": data['search_criteria'].get('intent', ''),
@@ -73,44 +63,29 @@ def create_embedding_payload(structured_json):
     
     return {
         "id": data['meta_data']['doc_id'],
-        "values": vector,
+        "values": None,
         "metadata": metadata,
         "document": text_to_embed 
     }
 
-def main():
-    # 1. 데이터 로드
-    try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            structured_faqs = json.load(f)
-        print(f"📂 Loaded {len(structured_faqs)} items from {INPUT_FILE}")
-    except FileNotFoundError:
+async def arun(limiter=None):
+    input_file = INPUT_FILE if os.path.exists(INPUT_FILE) else LEGACY_INPUT_FILE
+    if not os.path.exists(input_file):
         print(f"❌ File not found: {INPUT_FILE}")
         print("Please run '01_preprocess_data.py' first.")
         return
+    print(f"📂 Loading items from {input_file}")
 
-    # 2. 전체 데이터 임베딩 처리
-    final_db_data = []
-    
-    print("🚀 Starting embedding process...")
-    for idx, item in enumerate(structured_faqs):
-        payload = create_embedding_payload(item)
-        
-        if payload:
-            final_db_data.append(payload)
-            print(f"   [{idx+1}/{len(structured_faqs)}] Vectorized: {payload['id']}")
-        else:
-            print(f"   [{idx+1}/{len(structured_faqs)}] Skipped (Invalid Data)")
-        
-        # API 속도 제한 고려
-        time.sleep(0.5)
+    counts = await arun_embed_stage(
+        client, EMBEDDING_MODEL, input_file, OUTPUT_FILE, create_embedding_payload,
+        limiter=limiter, cache=shared_llm_cache(), **embed_stage_config()
+    )
 
-    # 3. 결과 저장
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(final_db_data, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n🎉 Successfully saved {len(final_db_data)} vectors to:")
+    print(f"\n🎉 Saved {counts['ok']} new vectors (skipped {counts['skipped']}, failed {counts['failed']}) to:")
     print(f"👉 {OUTPUT_FILE}")
 
+def main():
+    asyncio.run(arun())
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
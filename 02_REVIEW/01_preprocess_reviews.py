@@ -1,11 +1,11 @@
 import json
-import time
 import os
+import sys
+import asyncio
 import re
-import pandas as pd
+from openpyxl import load_workbook
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
 
 
 
@@ -22,6 +22,12 @@ if not api_key:
 
 client = genai.Client(api_key=api_key)
 
+sys.path.append(os.path.join(parent_dir, '04_RAG_ENGINE'))
+from pipeline_utils import arun_preprocess_stage
+
+LLM_MODEL = 'gemini-2.0-flash-exp'
+LLM_CONFIG = {"response_mime_type": "application/json"}
+
 
 
 
@@ -93,10 +99,10 @@ PROMPT_TEMPLATE = """
 }}
 """
 
-def process_review_item(row):
-    
-    title_raw = row.get('Title', '')
-    content_raw = row.get('Content', '')
+def build_prompt(row):
+    """개인정보를 지운 프롬프트를 만듭니다. 본문이 너무 짧으면 None"""
+    title_raw = row.get('Title') or ''
+    content_raw = row.get('Content') or ''
     link_raw = row.get('Link', '') 
 
     
@@ -108,85 +114,73 @@ def process_review_item(row):
         return None
 
     
-    prompt = PROMPT_TEMPLATE.format(
+    return PROMPT_TEMPLATE.format(
         title=title_clean,
         content=content_clean,
-        source_url=str(link_raw) if pd.notna(link_raw) else ""
+        source_url=str(link_raw) if link_raw is not None else ""
     )
-    
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-exp',
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type='application/json'
-            )
-        )
-        
-        
-        parsed_data = json.loads(response.text)
-        
-        
-        
-        
-        if isinstance(parsed_data, list):
-            if len(parsed_data) > 0:
-                parsed_data = parsed_data[0] 
-            else:
-                return None 
-        
-        return parsed_data
-        
-    except Exception as e:
-        print(f"❌ 변환 API 에러: {e}")
+
+
+def natural_key(row):
+    """적재 단계의 문서 id 가 되는 키. 후기 본문이 고쳐져도 게시글 링크가 같으면 같은 문서입니다."""
+    link = row.get('Link')
+    if link is None:
         return None
+    return str(link).strip() or None
 
 
+def parse_review_response(text):
+    """응답이 배열이면 첫 원소를 씁니다. 빈 배열이면 None (스킵)"""
+    parsed_data = json.loads(text)
+    if isinstance(parsed_data, list):
+        return parsed_data[0] if parsed_data else None
+    return parsed_data
 
 
-if __name__ == "__main__":
+def iter_excel_rows(path):
+    """
+    openpyxl read_only 모드로 첫 행을 헤더 삼아 한 행씩 dict 로 읽습니다.
+    시트 전체를 DataFrame 으로 올리지 않으므로 메모리는 행 수와 무관합니다. 빈 셀은 None 입니다.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(c).strip() if c is not None else "" for c in next(rows, ())]
+        for values in rows:
+            if all(v is None for v in values):
+                continue
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+async def arun(limiter=None):
     input_file = os.path.join(current_dir, 'raw_reviews.xlsx')
-    output_file = os.path.join(current_dir, 'structured_reviews.json')
+    output_file = os.path.join(current_dir, 'structured_reviews.jsonl')
     
     try:
         
-        df = pd.read_excel(input_file, engine='openpyxl')
-        print(f"📂 엑셀 로드 성공! 총 {len(df)}건")
+        first_row = next(iter_excel_rows(input_file), {})
+        print(f"📂 엑셀 확인 완료: {input_file}")
         
         
         expected_cols = ['Title', 'MetaInfo', 'Content', 'Link']
-        missing_cols = [col for col in expected_cols if col not in df.columns]
+        missing_cols = [col for col in expected_cols if col not in first_row]
         
         if missing_cols:
             print(f"⚠️ 경고: 다음 컬럼을 찾을 수 없습니다 -> {missing_cols}")
-            print(f"   현재 엑셀 컬럼: {df.columns.tolist()}")
+            print(f"   현재 엑셀 컬럼: {list(first_row)}")
 
     except Exception as e:
         print(f"❌ 엑셀 로드 실패: {e}")
-        exit()
+        return
 
-    structured_data = []
-    
-    target_df = df
-    
-    print(f"🔄 데이터 처리 시작 (상위 {len(target_df)}건)...")
-    
-    for idx, row in target_df.iterrows():
-        print(f"\n--- [{idx+1}/{len(target_df)}] 처리 중 ---")
-        
-        result = process_review_item(row)
-        
-        if result:
-            structured_data.append(result)
-            print(f"✅ 변환 성공 (ID: {result['meta_data']['doc_id']})")
-        else:
-            print(f"🚫 스킵됨 (내용 부족 등)")
-        
-        
-        time.sleep(10)
+    await arun_preprocess_stage(
+        client, LLM_MODEL, lambda: iter_excel_rows(input_file), output_file, build_prompt, PROMPT_TEMPLATE,
+        config=LLM_CONFIG, parse=parse_review_response, natural_key=natural_key,
+        describe=lambda row: str(row.get('Title', ''))[:20], limiter=limiter, label="데이터 처리"
+    )
 
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(structured_data, f, indent=2, ensure_ascii=False)
-        
-    print(f"\n✅ 작업 완료! 결과 파일: {output_file}")
\ No newline at end of file
+
+if __name__ == "__main__":
+    asyncio.run(arun())
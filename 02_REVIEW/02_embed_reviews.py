@@ -1,9 +1,9 @@
 import os
+import sys
 import json
-import time
+import asyncio
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
 
 
 
@@ -20,15 +20,18 @@ if not api_key:
 
 client = genai.Client(api_key=api_key)
 
-EMBEDDING_MODEL = 'models/text-embedding-004'
+sys.path.append(os.path.join(parent_dir, '04_RAG_ENGINE'))
+from pipeline_utils import arun_embed_stage, embed_stage_config, shared_llm_cache
 
+EMBEDDING_MODEL = 'models/text-embedding-004'
 
-INPUT_FILE = os.path.join(current_dir, 'structured_reviews.json')
-OUTPUT_FILE = os.path.join(current_dir, 'review_db_ready.json')
+INPUT_FILE = os.path.join(current_dir, 'structured_reviews.jsonl')
+LEGACY_INPUT_FILE = os.path.join(current_dir, 'structured_reviews.json')
+OUTPUT_FILE = os.path.join(current_dir, 'review_db_ready.jsonl')
 
 def create_embedding_payload(review_data):
     """
-    구조화된 수강후기를 받아 ChromaDB용 [ID, Vector, Metadata]로 변환합니다.
+    구조화된 수강후기를 받아 ChromaDB용 [ID, Metadata, Document]로 변환합니다.
     """
     data = review_data
     
@@ -54,21 +57,6 @@ def create_embedding_payload(review_data):
     태그: {', '.join(display.get('tags', []))}
     """
     
-    try:
-        
-        response = client.models.embed_content(
-            model=EMBEDDING_MODEL,
-            contents=text_to_embed,
-            config=types.EmbedContentConfig(
-                task_type="RETRIEVAL_DOCUMENT"
-            )
-        )
-        vector = response.embeddings[0].values
-        
-    except Exception as e:
-        print(f"⚠️ 임베딩 생성 실패 ({data['meta_data'].get('doc_id')}): {e}")
-        return None
-    
     
     
     
@@ -91,43 +79,29 @@ def create_embedding_payload(review_data):
     
     return {
         "id": data['meta_data']['doc_id'],
-        "values": vector,
+        "values": None,
         "metadata": metadata,
         "document": text_to_embed 
     }
 
-def main():
-    
-    try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            structured_data = json.load(f)
-        print(f"📂 Loaded {len(structured_data)} reviews from {INPUT_FILE}")
-    except FileNotFoundError:
+async def arun(limiter=None):
+    input_file = INPUT_FILE if os.path.exists(INPUT_FILE) else LEGACY_INPUT_FILE
+    if not os.path.exists(input_file):
         print(f"❌ File not found: {INPUT_FILE}")
         print("Please run '01_preprocess_reviews.py' first.")
         return
+    print(f"📂 Loading reviews from {input_file}")
 
-    
-    final_db_data = []
-    
-    print("🚀 Starting embedding process for Reviews...")
-    
-    for idx, item in enumerate(structured_data):
-        payload = create_embedding_payload(item)
-        
-        if payload:
-            final_db_data.append(payload)
-            print(f"   [{idx+1}/{len(structured_data)}] Vectorized: {payload['id']}")
-        
-        
-        time.sleep(0.5)
+    counts = await arun_embed_stage(
+        client, EMBEDDING_MODEL, input_file, OUTPUT_FILE, create_embedding_payload,
+        limiter=limiter, cache=shared_llm_cache(), **embed_stage_config()
+    )
 
-    
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(final_db_data, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n🎉 Successfully saved {len(final_db_data)} vectors to:")
+    print(f"\n🎉 Saved {counts['ok']} new vectors (skipped {counts['skipped']}, failed {counts['failed']}) to:")
     print(f"👉 {OUTPUT_FILE}")
 
+def main():
+    asyncio.run(arun())
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,9 +1,8 @@
-import json
-import time
 import os
+import sys
+import asyncio
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
 
 
 
@@ -29,18 +28,16 @@ if not api_key:
 
 client = genai.Client(api_key=api_key)
 
+sys.path.append(os.path.join(parent_dir, '04_RAG_ENGINE'))
+from pipeline_utils import arun_preprocess_stage, iter_json_array
+
+LLM_MODEL = 'gemini-2.0-flash-exp'
+LLM_CONFIG = {"response_mime_type": "application/json"}
 
 
 
-input_file_path = os.path.join(current_dir, 'raw_timetable.json')
 
-try:
-    with open(input_file_path, 'r', encoding='utf-8') as f:
-        raw_data = json.load(f)
-    print(f"📂 '{input_file_path}' 로드 성공! 총 {len(raw_data)}개의 강의 데이터를 찾았습니다.")
-except FileNotFoundError:
-    print(f"❌ 오류: '{input_file_path}' 파일을 찾을 수 없습니다.")
-    raw_data = []
+input_file_path = os.path.join(current_dir, 'raw_timetable.json')
 
 
 
@@ -102,9 +99,8 @@ PROMPT_TEMPLATE = """
 
 
 
-def transform_timetable_data(raw_item):
-    
-    prompt = PROMPT_TEMPLATE.format(
+def build_prompt(raw_item):
+    return PROMPT_TEMPLATE.format(
         m_jiyuk=raw_item.get('m_jiyuk', 'Unknown'),
         m_name=raw_item.get('m_name', '제목없음'),
         m_yoil=raw_item.get('m_yoil', ''),
@@ -112,52 +108,24 @@ def transform_timetable_data(raw_item):
         m_priceinfo=raw_item.get('m_priceinfo', ''),
         m_cashprice=raw_item.get('m_cashprice', 0)
     )
-    
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-exp',
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type='application/json'
-            )
-        )
-        return json.loads(response.text)
-    except Exception as e:
-        print(f"❌ 변환 실패 (강좌명: {raw_item.get('m_name')}): {e}")
-        return None
 
 
+def natural_key(raw_item):
+    """적재 단계의 문서 id 가 되는 키. 가격/설명이 바뀌어도 지점·강좌명·요일·시간이 같으면 같은 강좌입니다."""
+    return [str(raw_item.get(k, '')).strip() for k in ('m_jiyuk', 'm_name', 'm_yoil', 'm_sigan')]
+
+
+async def arun(limiter=None):
+    if not os.path.exists(input_file_path):
+        print(f"❌ 오류: '{input_file_path}' 파일을 찾을 수 없습니다.")
+        return
+    await arun_preprocess_stage(
+        client, LLM_MODEL, lambda: iter_json_array(input_file_path),
+        os.path.join(current_dir, 'structured_timetable.jsonl'), build_prompt, PROMPT_TEMPLATE,
+        config=LLM_CONFIG, natural_key=natural_key,
+        describe=lambda item: str(item.get('m_name', ''))[:20], limiter=limiter, label="시간표 데이터 구조화"
+    )
 
 
 if __name__ == "__main__":
-    if not raw_data:
-        print("처리할 데이터가 없습니다. 종료합니다.")
-    else:
-        structured_timetable = []
-        total_count = len(raw_data)
-
-        print(f"🔄 시간표 데이터 구조화 시작... (안전 모드: 10초 간격)")
-        
-        for idx, item in enumerate(raw_data):
-            
-            result = transform_timetable_data(item)
-            
-            if result:
-                structured_timetable.append(result)
-                print(f"   [{idx+1}/{total_count}] 성공: {item.get('m_name')[:20]}...")
-            
-            
-            
-            
-            wait_time = 10
-            print(f"      ㄴ ⏳ API 대기 중... ({wait_time}초)")
-            time.sleep(wait_time) 
-
-        
-        output_path = os.path.join(current_dir, 'structured_timetable.json')
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(structured_timetable, f, indent=2, ensure_ascii=False)
-
-        print(f"\n✅ 전체 변환 완료! 총 {len(structured_timetable)}건 저장됨.")
-        print(f"파일 위치: {output_path}")
\ No newline at end of file
+    asyncio.run(arun())
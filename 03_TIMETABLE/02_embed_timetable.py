@@ -1,9 +1,10 @@
 import os
+import sys
 import json
+import asyncio
 import time
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
 
 
 
@@ -29,15 +30,18 @@ if not api_key:
 
 client = genai.Client(api_key=api_key)
 
-EMBEDDING_MODEL = 'models/text-embedding-004'
+sys.path.append(os.path.join(parent_dir, '04_RAG_ENGINE'))
+from pipeline_utils import arun_embed_stage, embed_stage_config, iter_records, shared_llm_cache
 
+EMBEDDING_MODEL = 'models/text-embedding-004'
 
-INPUT_FILE = os.path.join(current_dir, 'structured_timetable.json')
-OUTPUT_FILE = os.path.join(current_dir, 'timetable_db_ready.json')
+INPUT_FILE = os.path.join(current_dir, 'structured_timetable.jsonl')
+LEGACY_INPUT_FILE = os.path.join(current_dir, 'structured_timetable.json')
+OUTPUT_FILE = os.path.join(current_dir, 'timetable_db_ready.jsonl')
 
 def create_embedding_payload(course_data):
     """
-    구조화된 시간표 데이터를 받아 ChromaDB용 [ID, Vector, Metadata]로 변환합니다.
+    구조화된 시간표 데이터를 받아 ChromaDB용 [ID, Metadata, Document]로 변환합니다.
     """
     data = course_data
     
@@ -81,21 +85,6 @@ def create_embedding_payload(course_data):
     요일 및 시간: {days} {time_str} {duration_str}
     """
     
-    try:
-        
-        response = client.models.embed_content(
-            model=EMBEDDING_MODEL,
-            contents=text_to_embed,
-            config=types.EmbedContentConfig(
-                task_type="RETRIEVAL_DOCUMENT"
-            )
-        )
-        vector = response.embeddings[0].values
-        
-    except Exception as e:
-        print(f"⚠️ Error generating embedding for {meta.get('doc_id')}: {e}")
-        return None
-    
     
     
     metadata = {
@@ -103,56 +92,42 @@ def create_embedding_payload(course_data):
         "course_type": meta.get('course_type', ''), 
         "display_json": json.dumps(display, ensure_ascii=False), 
         "price_json": json.dumps(spec.get('price_options', []), ensure_ascii=False), 
+        "schedule_json": json.dumps(schedule, ensure_ascii=False), 
         "keywords_str": ", ".join(keywords) 
     }
     
     return {
         "id": meta.get('doc_id', f"unknown_{int(time.time())}"),
-        "values": vector,
+        "values": None,
         "metadata": metadata,
         "document": text_to_embed 
     }
 
-def main():
-    
-    try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            structured_data = json.load(f)
-        print(f"📂 Loaded {len(structured_data)} courses from {INPUT_FILE}")
-    except FileNotFoundError:
+async def arun(limiter=None):
+    input_file = INPUT_FILE if os.path.exists(INPUT_FILE) else LEGACY_INPUT_FILE
+    if not os.path.exists(input_file):
         print(f"❌ File not found: {INPUT_FILE}")
         print("Please run '01_preprocess_timetable.py' first.")
         return
+    print(f"📂 Loading courses from {input_file}")
 
-    
-    final_db_data = []
-    
-    print("🚀 Starting embedding process for Timetable...")
-    
-    for idx, item in enumerate(structured_data):
-        payload = create_embedding_payload(item)
-        
-        if payload:
-            final_db_data.append(payload)
-            print(f"   [{idx+1}/{len(structured_data)}] Vectorized: {payload['id']}")
-        else:
-            print(f"   [{idx+1}/{len(structured_data)}] Skipped (Invalid Data)")
-        
-        
-        time.sleep(0.5)
+    counts = await arun_embed_stage(
+        client, EMBEDDING_MODEL, input_file, OUTPUT_FILE, create_embedding_payload,
+        limiter=limiter, cache=shared_llm_cache(), **embed_stage_config()
+    )
 
-    
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(final_db_data, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n🎉 Successfully saved {len(final_db_data)} vectors to:")
+    print(f"\n🎉 Saved {counts['ok']} new vectors (skipped {counts['skipped']}, failed {counts['failed']}) to:")
     print(f"👉 {OUTPUT_FILE}")
 
     
-    if final_db_data:
+    sample = next(iter_records(OUTPUT_FILE), None)
+    if sample:
         print("\n--- Sample Metadata Check ---")
-        print(f"Keys: {list(final_db_data[0]['metadata'].keys())}")
-        print(f"Price Info (Serialized): {final_db_data[0]['metadata']['price_json'][:50]}...")
+        print(f"Keys: {list(sample['metadata'].keys())}")
+        print(f"Price Info (Serialized): {sample['metadata']['price_json'][:50]}...")
+
+def main():
+    asyncio.run(arun())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,179 @@
+import os
+import json
+import math
+import time
+import operator
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+# build_vector_db 가 컬렉션 내용을 바꿀 때마다 버전을 올리는 파일. 캐시된 답변은 저장 당시 버전과 다르면 버립니다.
+COLLECTION_VERSIONS_PATH = os.path.join(project_root, 'collection_versions.json')
+
+_versions_lock = threading.Lock()
+
+
+def read_collection_versions(path: str = COLLECTION_VERSIONS_PATH) -> Dict[str, int]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def bump_collection_version(collection_name: str, path: str = COLLECTION_VERSIONS_PATH) -> int:
+    """컬렉션 버전을 1 올립니다. ingest.py 가 컬렉션을 동시에 적재하므로 잠금 + 원자적 교체로 씁니다."""
+    with _versions_lock:
+        versions = read_collection_versions(path)
+        versions[collection_name] = versions.get(collection_name, 0) + 1
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(versions, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return versions[collection_name]
+
+
+def _normalize(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+class CachedAnswer:
+    __slots__ = ("intent", "profile_key", "vector", "answer", "contexts", "collection", "version",
+                 "created_at", "hits")
+
+    def __init__(self, intent: str, profile_key: Tuple, vector: List[float], answer: str,
+                 contexts: List[Tuple[str, str]], collection: str, version: int):
+        self.intent = intent
+        self.profile_key = profile_key
+        self.vector = vector
+        self.answer = answer
+        self.contexts = contexts        # (문서 id, 프롬프트에 들어간 본문)
+        self.collection = collection
+        self.version = version
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class SemanticAnswerCache:
+    """
+    질의 임베딩 기반 답변 캐시입니다.
+    - 키: (의도, 의도별 관련 프로필 값) 버킷 + 질의 임베딩. 같은 버킷에서 코사인 유사도가 threshold 이상이면 적중
+    - 조회는 해당 버킷만 훑고, 버킷마다 max_entries_per_bucket 개까지만 둡니다 (잠금 안 선형 탐색 상한)
+    - 크기 상한(max_entries, LRU), TTL, 컬렉션 버전이 바뀌면(build_vector_db 재적재) 자동 무효화
+    벡터는 정규화해 저장하므로 유사도는 내적 한 번입니다.
+    """
+    def __init__(self, threshold: float = 0.93, ttl_seconds: Optional[float] = 24 * 3600,
+                 max_entries: int = 1000, max_entries_per_bucket: int = 200,
+                 versions_path: str = COLLECTION_VERSIONS_PATH):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_entries_per_bucket = max_entries_per_bucket
+        self.versions_path = versions_path
+        self._buckets = {}              # (의도, 프로필 키) -> OrderedDict(entry id -> CachedAnswer), 버킷 안 LRU 순
+        self._entries = OrderedDict()   # entry id -> 버킷 키 (전체 LRU 순)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._versions_mtime = None
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.expired = 0
+        self.invalidated = 0
+        self.evictions = 0
+
+    def _current_versions(self) -> Dict[str, int]:
+        """버전 파일이 바뀌었을 때만 다시 읽습니다 (조회마다 stat 한 번)."""
+        try:
+            mtime = os.stat(self.versions_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._versions_mtime:
+            self._versions = read_collection_versions(self.versions_path) if mtime is not None else {}
+            self._versions_mtime = mtime
+        return self._versions
+
+    def _is_stale(self, entry: CachedAnswer, now: float, versions: Dict[str, int]) -> Optional[str]:
+        if self.ttl_seconds is not None and now - entry.created_at > self.ttl_seconds:
+            return "expired"
+        if versions.get(entry.collection, 0) != entry.version:
+            return "invalidated"
+        return None
+
+    def _remove(self, entry_id: int):
+        bucket_key = self._entries.pop(entry_id)
+        bucket = self._buckets[bucket_key]
+        del bucket[entry_id]
+        if not bucket:
+            del self._buckets[bucket_key]
+
+    def lookup(self, vector: Sequence[float], intent: str, profile_key: Tuple) -> Optional[CachedAnswer]:
+        """라우팅된 의도의 버킷에서만 찾습니다."""
+        query = _normalize(vector)
+        now = time.time()
+        with self._lock:
+            versions = self._current_versions()
+            best, best_sim, stale = None, self.threshold, []
+            for entry_id, entry in self._buckets.get((intent, profile_key), {}).items():
+                reason = self._is_stale(entry, now, versions)
+                if reason:
+                    stale.append((entry_id, reason))
+                    continue
+                sim = sum(map(operator.mul, query, entry.vector))
+                if sim >= best_sim:
+                    best, best_sim = (entry_id, entry), sim
+            for entry_id, reason in stale:
+                self._remove(entry_id)
+                setattr(self, reason, getattr(self, reason) + 1)
+
+            if best is None:
+                self.misses += 1
+                return None
+            entry_id, entry = best
+            self._buckets[(intent, profile_key)].move_to_end(entry_id)
+            self._entries.move_to_end(entry_id)
+            entry.hits += 1
+            self.hits += 1
+            return entry
+
+    def put(self, vector: Sequence[float], intent: str, profile_key: Tuple, answer: str,
+            contexts: List[Tuple[str, str]], collection: str):
+        bucket_key = (intent, profile_key)
+        with self._lock:
+            version = self._current_versions().get(collection, 0)
+            bucket = self._buckets.setdefault(bucket_key, OrderedDict())
+            bucket[self._next_id] = CachedAnswer(intent, profile_key, _normalize(vector), answer,
+                                                 contexts, collection, version)
+            self._entries[self._next_id] = bucket_key
+            self._next_id += 1
+            self.stores += 1
+            while len(bucket) > self.max_entries_per_bucket:
+                self._remove(next(iter(bucket)))
+                self.evictions += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "buckets": len(self._buckets),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "expired": self.expired,
+            "invalidated": self.invalidated,
+            "evictions": self.evictions,
+        }
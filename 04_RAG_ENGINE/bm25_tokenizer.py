@@ -0,0 +1,140 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# 토큰 규칙(태그 2배 가중 + 2글자 이상 명사)이 바뀌면 올려서 캐시를 무효화합니다.
+TOKENIZER_VERSION = "nouns-v1"
+
+
+def bm25_cache_key(tags, text) -> str:
+    raw = json.dumps([TOKENIZER_VERSION, tags, text], ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def tag_tokens(tags) -> List[str]:
+    """태그는 '#' 을 떼고 두 번 넣어 BM25 가중치를 높입니다."""
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = [tags]
+    clean_tags = [str(t).replace('#', '').strip() for t in tags if t]
+    return clean_tags + clean_tags
+
+
+def noun_tokens(analyzed) -> List[str]:
+    """kiwi.analyze 결과(top-1)에서 2글자 이상 명사만 뽑습니다."""
+    return [token for token, pos, _, _ in analyzed[0][0] if pos.startswith('N') and len(token) > 1]
+
+
+class BM25Tokenizer:
+    """
+    적재용 BM25 토큰화 단계입니다.
+    - 문서 묶음을 kiwi.analyze(리스트) 배치 API 로 보내 Kiwi(num_workers=...) 의 멀티스레드 분석을 씁니다.
+    - (태그, 본문) 내용 해시로 결과를 SQLite 에 캐시해 바뀌지 않은 문서는 다시 분석하지 않습니다.
+    - 분석 실패는 삼키지 않고 건수와 예시를 기록합니다. 실패한 문서는 태그 토큰만 쓰고 캐시하지 않습니다.
+    """
+    def __init__(self, kiwi, cache_path: Optional[str] = None, batch_size: int = 256):
+        self.kiwi = kiwi
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        # ingest.py 는 여러 컬렉션의 tokenize/load 를 스레드에서 동시에 돌리므로 통계도 잠금 아래서 고칩니다.
+        self._stats_lock = threading.Lock()
+
+        self.documents = 0
+        self.cache_hits = 0
+        self.analyzed = 0
+        self.failures = 0
+        self.failure_samples = []
+
+        self._conn = None
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS bm25_tokens (key TEXT PRIMARY KEY, tokens TEXT NOT NULL)")
+            self._conn.commit()
+
+    def _cache_get(self, keys: List[str]) -> Dict[str, str]:
+        if self._conn is None or not keys:
+            return {}
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, tokens FROM bm25_tokens WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def _cache_put(self, entries: List[Tuple[str, str]]):
+        if self._conn is None or not entries:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO bm25_tokens (key, tokens) VALUES (?, ?)", entries)
+            self._conn.commit()
+
+    def _record_failure(self, text: str, error: Exception):
+        with self._stats_lock:
+            self.failures += 1
+            if len(self.failure_samples) < 5:
+                self.failure_samples.append(f"{str(text)[:30]}... ({error})")
+
+    def _analyze(self, texts: List[str]) -> List[Optional[List[str]]]:
+        """명사 토큰 리스트들. 실패한 문서는 None"""
+        nouns = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i:i + self.batch_size]
+            try:
+                # 배치 결과를 다 만든 뒤에만 붙입니다. 중간에 실패했을 때 일부만 붙으면 뒤 문서들과 순서가 어긋나
+                # 다른 문서의 토큰이 엉뚱한 내용 키로 캐시됩니다.
+                batch_nouns = [noun_tokens(r) for r in self.kiwi.analyze(batch)]
+                if len(batch_nouns) != len(batch):
+                    raise ValueError(f"kiwi.analyze returned {len(batch_nouns)} results for {len(batch)} texts")
+                nouns.extend(batch_nouns)
+            except Exception:
+                # 배치 중 어떤 문서가 실패했는지 알 수 없으므로 한 건씩 다시 분석합니다.
+                for text in batch:
+                    try:
+                        nouns.append(noun_tokens(self.kiwi.analyze(text)))
+                    except Exception as e:
+                        self._record_failure(text, e)
+                        nouns.append(None)
+        with self._stats_lock:
+            self.analyzed += len(texts)
+        return nouns
+
+    def tokenize(self, inputs: Sequence[Tuple[List, str]]) -> List[str]:
+        """(tags, content_text) 목록 -> 공백으로 이은 BM25 토큰 문자열 목록"""
+        keys = [bm25_cache_key(tags, text) for tags, text in inputs]
+        cached = self._cache_get(keys)
+        with self._stats_lock:
+            self.documents += len(inputs)
+            self.cache_hits += sum(1 for k in keys if k in cached)
+
+        results = [cached.get(k) for k in keys]
+        todo = [i for i, r in enumerate(results) if r is None and inputs[i][1]]
+        nouns = self._analyze([str(inputs[i][1]) for i in todo])
+
+        new_entries = []
+        for i, noun_list in zip(todo, nouns):
+            results[i] = " ".join(tag_tokens(inputs[i][0]) + (noun_list or []))
+            if noun_list is not None:
+                new_entries.append((keys[i], results[i]))
+        self._cache_put(new_entries)
+
+        # 본문이 없는 문서는 태그만
+        return [r if r is not None else " ".join(tag_tokens(inputs[i][0])) for i, r in enumerate(results)]
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "documents": self.documents,
+                "cache_hits": self.cache_hits,
+                "analyzed": self.analyzed,
+                "failures": self.failures,
+                "failure_samples": list(self.failure_samples),
+            }
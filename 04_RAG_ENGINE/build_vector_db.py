@@ -1,12 +1,19 @@
 import os
 import json
 import time
-from typing import List, Dict, Any
+import asyncio
+import hashlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 from kiwipiepy import Kiwi
 import chromadb
 from google import genai
-from google.genai import types
+from answer_cache import bump_collection_version
+from bm25_tokenizer import BM25Tokenizer
+from timetable_filter import extract_timetable_filters
+from pipeline_utils import (AdaptiveRateLimiter, BatchRetryQueue, VectorReader, aembed_documents, embed_documents,
+                            fingerprint, is_retryable_error, iter_flattened, iter_jsonl, iter_keyed_records,
+                            vector_path_for)
 
 
 
@@ -21,7 +28,9 @@ if not api_key:
     raise ValueError("API Key not found in .env")
 
 client = genai.Client(api_key=api_key)
-kiwi = Kiwi()
+# -1 이면 가용 코어 전부를 Kiwi 배치 분석 스레드로 씁니다. (kiwipiepy 0.21 이상에서 0 은 단일 스레드이고 경고가 납니다)
+KIWI_NUM_WORKERS = int(os.getenv("KIWI_NUM_WORKERS", "-1"))
+kiwi = Kiwi(num_workers=KIWI_NUM_WORKERS)
 
 CHROMA_DB_PATH = os.path.join(project_root, 'chroma_db')
 os.makedirs(CHROMA_DB_PATH, exist_ok=True)
@@ -29,20 +38,16 @@ os.makedirs(CHROMA_DB_PATH, exist_ok=True)
 chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
 EMBEDDING_MODEL = 'models/text-embedding-004'
 
+# upsert 한 번에 넣는 문서 수 (스트리밍 적재 시 메모리 상한도 이 값에 비례)
+INGEST_BATCH_SIZE = 100
 
+# BM25 토큰은 (태그, 본문) 내용 해시로 캐시해 바뀌지 않은 문서는 형태소 분석을 건너뜁니다.
+# 같은 배치를 몇 번 재시도한 뒤 반으로 쪼갤지, 끝내 실패한 문서를 어디에 남길지
+INGEST_MAX_ATTEMPTS = 3
+DEAD_LETTER_DIR = os.path.join(project_root, 'dead_letter')
 
-
-def recursive_flatten(data):
-    if isinstance(data, list):
-        if len(data) == 0:
-            return []
-        if isinstance(data[0], list):
-            flat = []
-            for item in data:
-                flat.extend(recursive_flatten(item))
-            return flat
-        return data
-    return []
+BM25_TOKEN_CACHE_PATH = os.path.join(project_root, 'bm25_token_cache.sqlite3')
+bm25_tokenizer = BM25Tokenizer(kiwi, cache_path=BM25_TOKEN_CACHE_PATH)
 
 
 
@@ -66,218 +71,432 @@ def clean_metadata(meta: Dict) -> Dict:
 
 
 
-def generate_bm25_tokens(tags: List[str], content_text: str) -> str:
-    tokens = []
-    
-    
-    if tags:
-        if isinstance(tags, str):
-            tags = [tags]
-        clean_tags = [str(t).replace('#', '').strip() for t in tags if t]
-        tokens.extend(clean_tags) 
-        tokens.extend(clean_tags) 
-    
-    
-    if content_text:
+def timetable_filters_from_ready_meta(meta: Dict) -> Dict:
+    """02_embed_timetable.py 결과(schedule_json, price_json)에서 필터용 타입 필드를 만듭니다."""
+    def _load(key, default):
         try:
-            result = kiwi.analyze(str(content_text))
-            for token, pos, _, _ in result[0][0]:
-                if pos.startswith('N') and len(token) > 1:
-                    tokens.append(token)
-        except:
-            pass 
+            return json.loads(meta.get(key) or 'null') or default
+        except (TypeError, ValueError):
+            return default
 
-    return " ".join(tokens)
+    return extract_timetable_filters(
+        _load('schedule_json', {}), _load('price_json', []), meta.get('branch'), meta.get('course_type')
+    )
 
 
 
 
-def process_and_insert(collection_name: str, structured_path: str, ready_path: str, type_config: Dict):
-    
-    
-    try:
-        chroma_client.delete_collection(collection_name)
-        print(f"🗑️  기존 컬렉션 삭제 완료: {collection_name}")
-    except:
-        pass
-    
-    collection = chroma_client.create_collection(name=collection_name)
-    
-    
-    
-    
-    if os.path.exists(ready_path):
-        print(f"♻️  [재활용 모드] 벡터 파일 발견! ({os.path.basename(ready_path)}) - API 호출을 생략합니다.")
-        with open(ready_path, 'r', encoding='utf-8') as f:
-            ready_data = json.load(f)
-            ready_data = recursive_flatten(ready_data)
-        
-        print(f"✨ 적재 대상: {len(ready_data)}건")
-        
-        BATCH_SIZE = 100 
-        total_processed = 0
-
-        for i in range(0, len(ready_data), BATCH_SIZE):
-            batch = ready_data[i : i + BATCH_SIZE]
-            
-            ids = []
-            embeddings = []
-            documents = []
-            metadatas = []
-            
-            for idx_in_batch, item in enumerate(batch):
-                try:
-                    if not isinstance(item, dict): continue
-
-                    
-                    raw_id = item.get('id', 'unknown')
-                    unique_doc_id = f"{raw_id}_{total_processed + idx_in_batch}"
-
-                    vector = item.get('values')
-                    meta = item.get('metadata', {})
-                    text_content = item.get('document', '')
-                    
-                    
-                    tags = []
-                    if 'display_json' in meta:
-                        try:
-                            display_obj = json.loads(meta['display_json'])
-                            tags = display_obj.get('tags', [])
-                        except:
-                            pass
-                    
-                    bm25_text = generate_bm25_tokens(tags, text_content)
-                    meta['bm25_tokens'] = bm25_text 
-                    
-                    
-                    clean_meta = clean_metadata(meta)
-
-                    ids.append(unique_doc_id)
-                    embeddings.append(vector)
-                    documents.append(text_content)
-                    metadatas.append(clean_meta) 
-                    
-                except Exception as e:
-                    print(f"⚠️ 데이터 처리 에러: {e}")
-                    continue
-            
-            if ids:
-                try:
-                    collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
-                    total_processed += len(ids)
-                    print(f"   Saved {total_processed} items (No API calls)")
-                except Exception as e:
-                    print(f"❌ DB 저장 실패: {e}")
-                
-        return 
-
-    
-    
-    
-    print(f"🆕 [신규 생성 모드] 벡터 파일이 없습니다. {os.path.basename(structured_path)}에서 임베딩을 생성합니다.")
-    
-    if not os.path.exists(structured_path):
-        print(f"❌ 파일 없음: {structured_path}")
-        return
+def stable_doc_id(doc_type: str, source_key: Any, source_fp: str, index: int = 0) -> str:
+    """
+    원본 행의 자연 키(FAQ 질문, 후기 링크, 시간표 지점+강좌명+일정)로 문서 id 를 만듭니다: '{type}_{키 해시 앞 20자}'.
+    내용을 고쳐도 같은 행은 같은 id 이므로 수정은 추가+삭제가 아니라 변경으로 적재되고, 본문이 같으면 벡터도 재사용합니다.
+    키가 없는 예전 산출물은 원본 행 지문으로 id 를 만듭니다.
+    한 행의 결과가 여러 문서(배열)면 두 번째부터 '_1', '_2' 를 붙입니다.
+    """
+    doc_id = f"{doc_type}_{(fingerprint(source_key) if source_key is not None else source_fp)[:20]}"
+    return doc_id if index == 0 else f"{doc_id}_{index}"
 
-    with open(structured_path, 'r', encoding='utf-8') as f:
-        raw_data = json.load(f)
-        data_list = recursive_flatten(raw_data)
 
-    print(f"✨ 적재 대상: {len(data_list)}건")
-    BATCH_SIZE = 50
-    total_processed = 0
+def compute_hash(*parts) -> str:
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
-    for i in range(0, len(data_list), BATCH_SIZE):
-        batch = data_list[i : i + BATCH_SIZE]
-        ids, documents, metadatas, texts_for_embedding = [], [], [], []
 
-        for idx_in_batch, item in enumerate(batch):
-            try:
-                if not isinstance(item, dict): continue
-                
-                meta = item.get('meta_data', {})
-                raw_id = meta.get('doc_id', 'unknown')
-                unique_doc_id = f"{raw_id}_{total_processed + idx_in_batch}"
-                
-                if type_config['type'] == 'faq':
-                    tags = item.get('search_criteria', {}).get('keywords', [])
-                    details = item.get('faq_details', {})
-                    content_for_noun = f"{details.get('question_summary', '')} {details.get('answer_summary', '')}"
-                    text_to_embed = f"Q: {details.get('question_summary', '')}\nA: {details.get('answer_summary', '')}"
-                    metadata_payload = {"category": str(meta.get('category', 'General')), "source": "faq"}
-
-                elif type_config['type'] == 'review':
-                    tags = item.get('display_info', {}).get('tags', [])
-                    criteria = item.get('search_criteria', {})
-                    content_for_noun = f"{criteria.get('pain_point', '')} {criteria.get('outcome', '')}"
-                    text_to_embed = f"상황: {criteria.get('status')}, 고민: {criteria.get('pain_point')}, 해결: {criteria.get('outcome')}"
-                    metadata_payload = {"status": str(criteria.get('status', '')), "score": str(item.get('fact_sheet', {}).get('scores', '')), "source_url": str(meta.get('source_url', '')), "source": "review", "display_json": json.dumps(item.get('display_info', {}), ensure_ascii=False)}
-
-                elif type_config['type'] == 'timetable':
-                    tags = item.get('search_keywords', [])
-                    display = item.get('display_info', {})
-                    content_for_noun = f"{display.get('title_main', '')} {display.get('title_sub', '')}"
-                    text_to_embed = f"{display.get('title_main')} - {display.get('title_sub')}"
-                    metadata_payload = {"day": "Unknown", "level": "Unknown", "full_json": json.dumps(item, ensure_ascii=False), "source": "timetable"}
-
-                bm25_text = generate_bm25_tokens(tags, content_for_noun)
-                metadata_payload['bm25_tokens'] = bm25_text
-
-                
-                clean_meta = clean_metadata(metadata_payload)
-
-                ids.append(unique_doc_id)
-                documents.append(text_to_embed)
-                metadatas.append(clean_meta)
-                texts_for_embedding.append(text_to_embed)
-            except: continue
-
-        if texts_for_embedding:
+def build_record_from_ready(item: Dict, type_config: Dict, vectors: Optional[VectorReader] = None):
+    """
+    *_db_ready 항목 -> 적재 레코드 (벡터 포함)
+    벡터는 .f32 사이드카(vector_offset/dim)에서 mmap 으로 읽고, 예전 형식이면 항목의 'values' 를 씁니다.
+    """
+    meta = dict(item.get('metadata', {}) or {})
+    tags = []
+    if 'display_json' in meta:
+        try:
+            tags = json.loads(meta['display_json']).get('tags', [])
+        except (TypeError, ValueError, AttributeError):
+            pass
+
+    if type_config['type'] == 'timetable':
+        meta.update(timetable_filters_from_ready_meta(meta))
+
+    values = item.get('values')
+    if values is None and vectors is not None and 'vector_offset' in item:
+        values = vectors.get(item['vector_offset'], item['dim'])
+
+    text_content = item.get('document', '')
+    return {
+        "document": text_content,
+        "metadata": meta,
+        "bm25_input": (tags, text_content),
+        "values": values,
+    }
+
+
+def build_record_from_structured(item: Dict, type_config: Dict):
+    """structured_*.json 항목 -> 적재 레코드 (벡터는 임베딩 단계에서 채움)"""
+    meta = item.get('meta_data', {})
+
+    if type_config['type'] == 'faq':
+        tags = item.get('search_criteria', {}).get('keywords', [])
+        details = item.get('faq_details', {})
+        content_for_noun = f"{details.get('question_summary', '')} {details.get('answer_summary', '')}"
+        text_to_embed = f"Q: {details.get('question_summary', '')}\nA: {details.get('answer_summary', '')}"
+        metadata_payload = {"category": str(meta.get('category', 'General')), "source": "faq"}
+
+    elif type_config['type'] == 'review':
+        tags = item.get('display_info', {}).get('tags', [])
+        criteria = item.get('search_criteria', {})
+        content_for_noun = f"{criteria.get('pain_point', '')} {criteria.get('outcome', '')}"
+        text_to_embed = f"상황: {criteria.get('status')}, 고민: {criteria.get('pain_point')}, 해결: {criteria.get('outcome')}"
+        metadata_payload = {"status": str(criteria.get('status', '')), "score": str(item.get('fact_sheet', {}).get('scores', '')), "source_url": str(meta.get('source_url', '')), "source": "review", "display_json": json.dumps(item.get('display_info', {}), ensure_ascii=False)}
+
+    elif type_config['type'] == 'timetable':
+        tags = item.get('search_keywords', [])
+        display = item.get('display_info', {})
+        content_for_noun = f"{display.get('title_main', '')} {display.get('title_sub', '')}"
+        text_to_embed = f"{display.get('title_main')} - {display.get('title_sub')}"
+        spec = item.get('course_spec', {}) or {}
+        metadata_payload = {"level": "Unknown", "full_json": json.dumps(item, ensure_ascii=False), "source": "timetable"}
+        metadata_payload.update(extract_timetable_filters(
+            spec.get('schedule'), spec.get('price_options'), meta.get('branch'), meta.get('course_type')
+        ))
+
+    return {
+        "document": text_to_embed,
+        "metadata": metadata_payload,
+        "bm25_input": (tags, content_for_noun),
+        "values": None,
+    }
+
+
+def resolve_stage_path(path: str) -> str:
+    """*.jsonl 산출물이 없고 예전 형식(*.json)만 있으면 그 경로를 씁니다."""
+    if not os.path.exists(path) and path.endswith('.jsonl') and os.path.exists(path[:-1]):
+        return path[:-1]
+    return path
+
+
+def iter_ingest_records(structured_path: str, ready_path: str, type_config: Dict,
+                        failed_ids: Optional[set] = None,
+                        bad_lines: Optional[List[Tuple[str, int]]] = None) -> Iterator[Dict]:
+    """
+    ready 파일이 있으면 저장된 벡터를 재활용하고, 없으면 structured 파일에서 레코드를 만듭니다.
+    파일 전체를 읽지 않고 항목을 하나씩 스트리밍합니다.
+    레코드를 만들지 못한 항목의 문서 id 는 failed_ids 에 넣습니다 (적재 단계가 그 문서를 지우지 않도록).
+    깨져서 읽지 못한 줄은 문서 id 조차 알 수 없으므로 bad_lines 에 (경로, 줄 번호) 로 넣습니다.
+    """
+    structured_path = resolve_stage_path(structured_path)
+    ready_path = resolve_stage_path(ready_path)
+    if os.path.exists(ready_path):
+        print(f"♻️  [재활용 모드] 벡터 파일 발견! ({os.path.basename(ready_path)}) - 저장된 벡터를 사용합니다.")
+        vector_path = vector_path_for(ready_path)
+        vectors = VectorReader(vector_path) if os.path.exists(vector_path) else None
+        source_path, builder = ready_path, lambda item, config: build_record_from_ready(item, config, vectors)
+    elif os.path.exists(structured_path):
+        print(f"🆕 [신규 생성 모드] 벡터 파일이 없습니다. {os.path.basename(structured_path)}에서 변경분만 임베딩합니다.")
+        source_path, builder = structured_path, build_record_from_structured
+    else:
+        print(f"❌ 파일 없음: {structured_path}")
+        return
+
+    used_ids = set()
+    for fp, key, row in iter_keyed_records(source_path, bad_lines):
+        items = [x for x in iter_flattened([row]) if isinstance(x, dict)]
+        for index, item in enumerate(items):
+            # ready 항목은 embed 단계가 남긴 원본 행 키/지문을, structured 항목은 체크포인트 줄의 키/지문을 씁니다.
+            source_fp = item.get('source_fingerprint') or fp
+            source_key = item.get('source_key', key)
+            doc_id = stable_doc_id(type_config['type'], source_key, source_fp, index)
+            if doc_id in used_ids:
+                # 자연 키가 겹치는 원본 행(같은 질문이 두 번 등)은 덮어쓰지 않도록 지문 id 로 적재합니다.
+                print(f"⚠️ 자연 키 중복 ({doc_id}): {source_key} - 원본 행 지문으로 id 를 만듭니다.")
+                doc_id = stable_doc_id(type_config['type'], None, source_fp, index)
+            used_ids.add(doc_id)
             try:
-                response = client.models.embed_content(
-                    model=EMBEDDING_MODEL, contents=texts_for_embedding,
-                    config=types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT")
-                )
-                embeddings = [e.values for e in response.embeddings]
-                collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
-                total_processed += len(ids)
-                print(f"   Generated & Saved {total_processed} items...")
+                record = builder(item, type_config)
             except Exception as e:
-                print(f"❌ API 에러: {e}")
-                time.sleep(10)
+                print(f"⚠️ 데이터 처리 에러 ({doc_id}): {e}")
+                if failed_ids is not None:
+                    failed_ids.add(doc_id)
+                continue
+            record['id'] = doc_id
+            # 적재 내용 전체(원본 행 지문 + 본문 + 메타데이터 + BM25 입력)의 해시와, 임베딩 대상 텍스트만의 해시
+            record['content_hash'] = compute_hash(source_fp, record['document'], record['metadata'], record['bm25_input'])
+            record['text_hash'] = compute_hash(EMBEDDING_MODEL, record['document'])
+            yield record
+
+
+def fetch_existing_hashes(collection, page_size: int = 1000) -> Dict[str, Dict]:
+    """컬렉션에 이미 있는 문서의 id -> {content_hash, text_hash}"""
+    existing = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        for doc_id, meta in zip(page['ids'], page['metadatas']):
+            meta = meta or {}
+            existing[doc_id] = {"content_hash": meta.get('content_hash'), "text_hash": meta.get('text_hash')}
+        if len(page['ids']) < page_size:
+            return existing
+        offset += page_size
+
+
+def reuse_existing_embeddings(collection, records: List[Dict], existing: Dict[str, Dict]):
+    """본문(임베딩 대상 텍스트)이 그대로인 변경 문서는 컬렉션에 저장된 벡터를 다시 씁니다."""
+    reusable = [r for r in records if r['values'] is None
+                and existing.get(r['id'], {}).get('text_hash') == r['text_hash']]
+    by_id = {r['id']: r for r in reusable}
+    for i in range(0, len(reusable), 100):
+        batch_ids = [r['id'] for r in reusable[i:i + 100]]
+        fetched = collection.get(ids=batch_ids, include=["embeddings"])
+        for doc_id, vector in zip(fetched['ids'], fetched['embeddings']):
+            by_id[doc_id]['values'] = list(vector)
+
+
+class EmbeddingFailed(Exception):
+    """임베딩 API 가 재시도 후에도 벡터를 주지 못한 문서 (일시 오류로 보고 다시 시도합니다)"""
+
+
+def is_retryable_ingest_error(e: Exception) -> bool:
+    return isinstance(e, EmbeddingFailed) or is_retryable_error(e)
+
+
+def embed_for_load(texts: List[str], limiter: Optional[AdaptiveRateLimiter] = None,
+                   loop: Optional[asyncio.AbstractEventLoop] = None) -> List[Optional[List[float]]]:
+    """
+    적재 단계의 문서 임베딩. loop 가 주어지면(ingest.py 가 스레드에서 적재를 돌릴 때) 공유 limiter 가 속한
+    그 이벤트 루프에서 임베딩해, 다른 컬렉션의 API 단계와 같은 속도 예산을 씁니다.
+    배치 단위 재시도는 BatchRetryQueue 가 하므로 여기서는 짧게만 재시도합니다.
+    """
+    if loop is None:
+        return embed_documents(client, EMBEDDING_MODEL, texts, task_type="RETRIEVAL_DOCUMENT",
+                               limiter=limiter, max_retries=2)
+    coro = aembed_documents(client, EMBEDDING_MODEL, texts, task_type="RETRIEVAL_DOCUMENT",
+                            limiter=limiter, max_retries=2)
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
 
 
+def upsert_batch(collection, batch: List[Dict], existing: Dict[str, Dict],
+                 embed_limiter: Optional[AdaptiveRateLimiter] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> List[Tuple[Dict, Exception]]:
+    """
+    추가/변경 레코드 한 배치를 임베딩(필요한 것만) 후 upsert 합니다.
+    실패한 (레코드, 예외) 목록을 반환하며, 재시도/분할/dead-letter 는 BatchRetryQueue 가 맡습니다.
+    """
+    reuse_existing_embeddings(collection, batch, existing)
+    to_embed = [r for r in batch if r['values'] is None]
+    if to_embed:
+        vectors = embed_for_load([r['document'] for r in to_embed], embed_limiter, loop)
+        for record, vector in zip(to_embed, vectors):
+            record['values'] = vector
+
+    failures = [(r, EmbeddingFailed(f"embedding failed: {r['id']}")) for r in batch if r['values'] is None]
+    ready = [r for r in batch if r['values'] is not None]
+    if not ready:
+        return failures
+    metadatas = []
+    bm25_tokens = bm25_tokenizer.tokenize([r['bm25_input'] for r in ready])
+    for r, tokens in zip(ready, bm25_tokens):
+        meta = dict(r['metadata'])
+        meta['bm25_tokens'] = tokens
+        meta['content_hash'] = r['content_hash']
+        meta['text_hash'] = r['text_hash']
+        metadatas.append(clean_metadata(meta))
+    try:
+        collection.upsert(
+            ids=[r['id'] for r in ready],
+            # mmap 슬라이스(memoryview)는 배치 단위로만 리스트로 풉니다.
+            embeddings=[r['values'].tolist() if isinstance(r['values'], memoryview) else r['values'] for r in ready],
+            documents=[r['document'] for r in ready],
+            metadatas=metadatas
+        )
+    except Exception as e:
+        print(f"⚠️ DB 저장 실패 ({len(ready)}건, 재시도 예정): {e}")
+        failures.extend((r, e) for r in ready)
+    return failures
+
+
+def dead_letter_path(collection_name: str) -> str:
+    return os.path.join(DEAD_LETTER_DIR, f"{collection_name}.jsonl")
+
+
+def load_dead_letters(collection_name: str) -> List[Dict]:
+    path = dead_letter_path(collection_name)
+    return list(iter_jsonl(path)) if os.path.exists(path) else []
+
+
+def write_dead_letters(collection_name: str, entries: List[Dict]):
+    """이번 실행에서도 실패한 문서만 남깁니다. 모두 성공하면 파일을 지웁니다."""
+    path = dead_letter_path(collection_name)
+    if not entries:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(DEAD_LETTER_DIR, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def process_and_insert(collection_name: str, structured_path: str, ready_path: str, type_config: Dict,
+                       embed_limiter: Optional[AdaptiveRateLimiter] = None,
+                       loop: Optional[asyncio.AbstractEventLoop] = None):
+    """
+    컬렉션을 지우고 다시 만드는 대신, 문서별 content_hash 로 기존 컬렉션과 비교해
+    추가/변경 문서만 upsert 하고 사라진 문서는 delete 합니다.
+    입력은 스트리밍으로 읽어 INGEST_BATCH_SIZE 단위로 바로 upsert 하므로, 메모리는 코퍼스가 아니라 배치 크기에 비례합니다.
+    임베딩은 새 문서이거나 본문이 바뀐 문서에 대해서만 생성합니다.
+    실패한 배치는 BatchRetryQueue 로 백오프 재시도/분할하고, 끝내 실패한 문서는 dead-letter 파일에 남깁니다.
+    embed_limiter / loop 는 ingest.py 의 공유 임베딩 속도 예산입니다 (embed_for_load).
+    """
+    collection = chroma_client.get_or_create_collection(name=collection_name)
+    existing = fetch_existing_hashes(collection)
+
+    # 이전 실행의 dead-letter 문서는 content_hash 가 같아 보여도(저장은 됐지만 응답이 실패한 경우 등)
+    # 다시 upsert 큐에 넣습니다. 임베딩은 text_hash 가 같으면 재사용하므로 추가 API 호출은 거의 없습니다.
+    previous_dead_ids = {entry['id'] for entry in load_dead_letters(collection_name)}
+
+    counts = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0, "retried": 0, "failed": 0}
+    seen_ids = set()
+    build_failed_ids = set()
+    bad_lines = []
+    pending = []
+    processed = 0
+    dead_entries = []
+
+    def _dead_letter(record: Dict, error: Exception):
+        print(f"❌ [{collection_name}] 적재 포기: {record['id']} ({error})")
+        dead_entries.append({"id": record['id'], "content_hash": record['content_hash'],
+                             "error": str(error), "failed_at": time.strftime("%Y-%m-%d %H:%M:%S")})
+
+    retry_queue = BatchRetryQueue(lambda batch: upsert_batch(collection, batch, existing, embed_limiter, loop),
+                                  _dead_letter,
+                                  max_attempts=INGEST_MAX_ATTEMPTS, retryable=is_retryable_ingest_error)
+
+    for record in iter_ingest_records(structured_path, ready_path, type_config, failed_ids=build_failed_ids,
+                                      bad_lines=bad_lines):
+        seen_ids.add(record['id'])
+        previous = existing.get(record['id'])
+        if previous is None:
+            counts["added"] += 1
+        elif previous['content_hash'] != record['content_hash']:
+            counts["changed"] += 1
+        elif record['id'] in previous_dead_ids:
+            counts["retried"] += 1
+        else:
+            counts["unchanged"] += 1
+            continue
+
+        pending.append(record)
+        if len(pending) >= INGEST_BATCH_SIZE:
+            retry_queue.submit(pending)
+            processed += len(pending)
+            pending = []
+            print(f"   Upserted {processed} items (재시도 대기 {len(retry_queue)}배치)")
+
+    if pending:
+        retry_queue.submit(pending)
+        processed += len(pending)
+        print(f"   Upserted {processed} items (재시도 대기 {len(retry_queue)}배치)")
+    retry_queue.drain()
+
+    # 입력 파일이 없거나 한 건도 읽지 못했으면 컬렉션을 비우지 않도록 삭제 단계를 건너뜁니다.
+    # 레코드를 만들지 못한 문서는 실패로 세고, 기존 문서를 그대로 둡니다.
+    # 깨진 줄이 하나라도 있으면 그 줄이 어떤 문서였는지 알 수 없으므로 삭제 단계 전체를 건너뜁니다.
+    removed = []
+    if bad_lines:
+        print(f"⚠️ [{collection_name}] 입력에서 읽지 못한 줄 {len(bad_lines)}건이 있어 삭제 단계를 건너뜁니다. "
+              f"(산출물을 고치거나 해당 단계를 다시 실행하세요)")
+    elif seen_ids or build_failed_ids:
+        removed = [doc_id for doc_id in existing if doc_id not in seen_ids and doc_id not in build_failed_ids]
+    elif existing:
+        print(f"⚠️ [{collection_name}] 읽은 문서가 없어 기존 문서 {len(existing)}건 삭제를 건너뜁니다.")
+    for i in range(0, len(removed), INGEST_BATCH_SIZE):
+        collection.delete(ids=removed[i : i + INGEST_BATCH_SIZE])
+    counts["removed"] = len(removed)
+    counts["failed"] = len(dead_entries) + len(build_failed_ids) + len(bad_lines)
+    write_dead_letters(collection_name, dead_entries)
+    if counts["added"] or counts["changed"] or counts["removed"]:
+        # 챗봇의 의미 기반 답변 캐시가 이 컬렉션에서 만든 답변을 버리도록 버전을 올립니다.
+        bump_collection_version(collection_name)
+
+    queue_stats = retry_queue.stats()
+    print(f"📊 [{collection_name}] 추가 {counts['added']} / 변경 {counts['changed']} / 삭제 {counts['removed']}"
+          f" / 유지 {counts['unchanged']}" + (f" / 실패 {counts['failed']}" if counts['failed'] else ""))
+    retried_dead = previous_dead_ids & seen_ids
+    if retried_dead:
+        print(f"   ♻️ 이전 실행의 dead-letter {len(retried_dead)}건 다시 시도 "
+              f"(그중 {len(retried_dead & {e['id'] for e in dead_entries})}건 다시 실패)")
+    if queue_stats["retries"] or queue_stats["splits"]:
+        print(f"   🔁 재시도 {queue_stats['retries']}회 / 배치 분할 {queue_stats['splits']}회")
+    if dead_entries:
+        print(f"   📮 dead-letter: {dead_letter_path(collection_name)}")
+    return counts
+
+
+
+
+def prepare_bm25_tokens(collection_name: str, structured_path: str, ready_path: str, type_config: Dict) -> Dict:
+    """
+    토큰화 단계만 따로 실행합니다. 컬렉션과 content_hash 가 다른(추가/변경) 문서의 BM25 토큰을
+    미리 만들어 캐시에 채워 두면, 적재 단계는 캐시에서 바로 읽습니다.
+    """
+    collection = chroma_client.get_or_create_collection(name=collection_name)
+    existing = fetch_existing_hashes(collection)
+    pending = []
+    tokenized = 0
+    for record in iter_ingest_records(structured_path, ready_path, type_config):
+        if existing.get(record['id'], {}).get('content_hash') == record['content_hash']:
+            continue
+        pending.append(record['bm25_input'])
+        if len(pending) >= INGEST_BATCH_SIZE:
+            bm25_tokenizer.tokenize(pending)
+            tokenized += len(pending)
+            pending = []
+    if pending:
+        bm25_tokenizer.tokenize(pending)
+        tokenized += len(pending)
+    print(f"🔤 [{collection_name}] BM25 토큰 준비 {tokenized}건")
+    return {"tokenized": tokenized}
+
+
+def print_tokenizer_stats():
+    stats = bm25_tokenizer.stats()
+    print(f"\n🔤 BM25 토큰화: {stats['documents']}건 (캐시 {stats['cache_hits']} / 분석 {stats['analyzed']}"
+          f" / 실패 {stats['failures']})")
+    for sample in stats['failure_samples']:
+        print(f"   ⚠️ 형태소 분석 실패: {sample}")
+
+
+
+
+# 컬렉션 이름 -> (structured 경로, ready 경로, type_config)
+COLLECTION_SOURCES = {
+    'faq': (
+        os.path.join(project_root, '01_FAQ', 'structured_faq.jsonl'),
+        os.path.join(project_root, '01_FAQ', 'faq_db_ready.jsonl'),
+        {'type': 'faq'},
+    ),
+    'review': (
+        os.path.join(project_root, '02_REVIEW', 'structured_reviews.jsonl'),
+        os.path.join(project_root, '02_REVIEW', 'review_db_ready.jsonl'),
+        {'type': 'review'},
+    ),
+    'timetable': (
+        os.path.join(project_root, '03_TIMETABLE', 'structured_timetable.jsonl'),
+        os.path.join(project_root, '03_TIMETABLE', 'timetable_db_ready.jsonl'),
+        {'type': 'timetable'},
+    ),
+}
 
 
 def main():
-    print("🚀 RAG Vector DB 구축 시작 (Null Cleaning Applied)")
-
-    
-    process_and_insert(
-        'faq', 
-        os.path.join(project_root, '01_FAQ', 'structured_faq.json'),
-        os.path.join(project_root, '01_FAQ', 'faq_db_ready.json'), 
-        {'type': 'faq'}
-    )
+    print("🚀 RAG Vector DB 구축 시작 (증분 적재: content hash 비교)")
 
-    
-    process_and_insert(
-        'review', 
-        os.path.join(project_root, '02_REVIEW', 'structured_reviews.json'),
-        os.path.join(project_root, '02_REVIEW', 'review_db_ready.json'),
-        {'type': 'review'}
-    )
+    for name, (structured_path, ready_path, type_config) in COLLECTION_SOURCES.items():
+        process_and_insert(name, structured_path, ready_path, type_config)
 
-    
-    process_and_insert(
-        'timetable', 
-        os.path.join(project_root, '03_TIMETABLE', 'structured_timetable.json'),
-        os.path.join(project_root, '03_TIMETABLE', 'timetable_db_ready.json'),
-        {'type': 'timetable'}
-    )
+    print_tokenizer_stats()
 
     print("\n🎉 모든 데이터 적재 완료! (./chroma_db)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
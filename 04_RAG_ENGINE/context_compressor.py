@@ -0,0 +1,133 @@
+import re
+import math
+from typing import Dict, List, Optional, Sequence
+
+
+# 컬렉션별로 답변에 쓸모 있는 필드 순서 (embed 스크립트의 text_to_embed 라벨 기준).
+# 목록에 없는 라벨은 뒤에 붙이고, 예산이 모자라면 뒤에서부터 버립니다.
+FIELD_PRIORITY = {
+    "faq": ["질문", "핵심답변", "상세내용", "의도", "대상", "키워드"],
+    "review": ["상황(페르소나)", "점수 변화", "기간", "수강 강좌", "달성 결과", "가장 큰 고민", "태그"],
+    "timetable": ["지점", "강좌명", "요일 및 시간", "특징", "키워드"],
+}
+
+# 항목 한 줄이 이보다 길면 잘라서 다른 필드에 예산을 남깁니다.
+MAX_FIELD_CHARS = 400
+MIN_CLIPPED_VALUE_CHARS = 40
+
+FIELD_PATTERN = re.compile(r"^\s*([^:\n]{1,20}):\s*(.*)$")
+
+
+def cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+def _text_similarity(a: str, b: str) -> float:
+    """임베딩이 없는 문서끼리 비교할 때 쓰는 어절 Jaccard 유사도"""
+    wa, wb = set(a.split()), set(b.split())
+    return len(wa & wb) / len(wa | wb) if wa and wb else 0.0
+
+
+def mmr_select(ids: List[str], relevance: Dict[str, float], embeddings: Dict[str, Sequence[float]],
+               k: int, mmr_lambda: float = 0.7) -> List[str]:
+    """
+    Maximal Marginal Relevance: lambda * 관련도 - (1 - lambda) * 이미 고른 문서와의 최대 유사도.
+    임베딩이 없는 문서는 다른 문서와의 유사도를 0 으로 봅니다.
+    """
+    selected = []
+    remaining = list(ids)
+    max_sim = {doc_id: 0.0 for doc_id in ids}
+    while remaining and len(selected) < k:
+        best = max(remaining, key=lambda d: mmr_lambda * relevance.get(d, 0.0) - (1 - mmr_lambda) * max_sim[d])
+        selected.append(best)
+        remaining.remove(best)
+        chosen = embeddings.get(best)
+        if chosen is None:
+            continue
+        for doc_id in remaining:
+            other = embeddings.get(doc_id)
+            if other is not None:
+                max_sim[doc_id] = max(max_sim[doc_id], cosine(chosen, other))
+    return selected
+
+
+def collapse_near_duplicates(ids: List[str], embeddings: Dict[str, Sequence[float]], texts: Dict[str, str],
+                             threshold: float = 0.97) -> List[str]:
+    """순서대로 보며 앞서 남긴 문서와 거의 같은 문서(같은 강좌의 다른 기수, 복사된 후기 등)를 버립니다."""
+    kept = []
+    for doc_id in ids:
+        vec = embeddings.get(doc_id)
+        duplicate = False
+        for other in kept:
+            if vec is not None and embeddings.get(other) is not None:
+                sim = cosine(vec, embeddings[other])
+            else:
+                sim = _text_similarity(texts.get(doc_id, ""), texts.get(other, ""))
+            if sim >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(doc_id)
+    return kept
+
+
+def rank_relevance(ids: List[str]) -> Dict[str, float]:
+    """쿼리 임베딩이 없을 때(BM25 단독 등) 검색 순위를 0~1 관련도로 씁니다."""
+    n = len(ids)
+    return {doc_id: 1.0 - i / n for i, doc_id in enumerate(ids)}
+
+
+def diversify(ids: List[str], texts: Dict[str, str], embeddings: Dict[str, Sequence[float]],
+              query_embedding: Optional[Sequence[float]], top_n: int, mmr_lambda: float = 0.7,
+              duplicate_threshold: float = 0.97) -> List[str]:
+    """검색 순위 목록 -> 중복을 접고 MMR 로 top_n 개를 고른 id 목록"""
+    ids = collapse_near_duplicates(ids, embeddings, texts, duplicate_threshold)
+    if query_embedding is not None and embeddings:
+        relevance = {d: cosine(query_embedding, embeddings[d]) if d in embeddings else 0.0 for d in ids}
+    else:
+        relevance = rank_relevance(ids)
+    return mmr_select(ids, relevance, embeddings, top_n, mmr_lambda)
+
+
+def compress_document(text: str, collection_name: str, max_chars: int) -> str:
+    """
+    'label: value' 줄로 된 문서 본문에서 빈 필드를 버리고, 컬렉션별 우선순위대로 max_chars 까지만 남깁니다.
+    라벨 형식이 아닌 본문은 앞부분을 자릅니다.
+    """
+    fields = []
+    loose = []
+    for line in str(text).splitlines():
+        match = FIELD_PATTERN.match(line)
+        if match:
+            label, value = match.group(1).strip(), " ".join(match.group(2).split())
+            if value:
+                fields.append((label, value))
+        elif line.strip():
+            loose.append(" ".join(line.split()))
+    if not fields:
+        body = " ".join(loose)
+        return body if len(body) <= max_chars else body[:max_chars] + "…"
+
+    priority = FIELD_PRIORITY.get(collection_name, [])
+    order = {label: i for i, label in enumerate(priority)}
+    fields.sort(key=lambda f: order.get(f[0], len(priority)))
+
+    lines = []
+    used = 0
+    for label, value in fields:
+        if len(value) > MAX_FIELD_CHARS:
+            value = value[:MAX_FIELD_CHARS] + "…"
+        line = f"{label}: {value}"
+        room = max_chars - used
+        if len(line) > room:
+            # 남은 예산이 의미 있는 만큼이면 잘라서 넣고 멈춥니다. 아니면 더 짧은 다음 필드를 시도합니다.
+            if room >= len(label) + MIN_CLIPPED_VALUE_CHARS:
+                lines.append(line[:room] + "…")
+                break
+            continue
+        lines.append(line)
+        used += len(line) + 1
+    return "\n".join(lines)
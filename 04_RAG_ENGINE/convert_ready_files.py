@@ -0,0 +1,102 @@
+"""
+예전 형식의 *_db_ready.json (벡터를 JSON float 배열로 저장) 을
+JSONL(id/메타데이터/본문) + .f32 벡터 사이드카 형식으로 변환합니다.
+
+사용법:
+    python convert_ready_files.py                      # 01_FAQ / 02_REVIEW / 03_TIMETABLE 기본 파일 변환
+    python convert_ready_files.py SRC.json DST.jsonl [STRUCTURED]
+"""
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from pipeline_utils import (JsonlCheckpoint, VectorWriter, fingerprint, iter_flattened,
+                            iter_keyed_records, iter_json_array, vector_path_for)
+
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+DEFAULT_TARGETS = [
+    ('01_FAQ', 'faq_db_ready', 'structured_faq'),
+    ('02_REVIEW', 'review_db_ready', 'structured_reviews'),
+    ('03_TIMETABLE', 'timetable_db_ready', 'structured_timetable'),
+]
+
+
+
+
+def structured_fingerprints(structured_path: Optional[str]) -> Dict[str, List[Tuple[str, str, Any]]]:
+    """
+    doc_id -> (구조화 행 지문, 원본 행 지문, 원본 행 자연 키) 목록(등장 순서).
+    변환 결과를 embed 스크립트의 체크포인트와 같은 지문으로 기록해야 재실행 시 다시 임베딩하지 않고,
+    원본 행 키/지문을 남겨야 적재 단계가 embed 스크립트 결과와 같은 문서 id 를 씁니다.
+    """
+    fingerprints = {}
+    if not structured_path or not os.path.exists(structured_path):
+        return fingerprints
+    for source_fp, source_key, item in iter_keyed_records(structured_path):
+        data = item[0] if isinstance(item, list) and item else item
+        if not isinstance(data, dict):
+            continue
+        doc_id = (data.get('meta_data') or {}).get('doc_id')
+        fingerprints.setdefault(str(doc_id), []).append((fingerprint(item), source_fp, source_key))
+    return fingerprints
+
+
+def convert_ready_file(src_path: str, dst_path: str, structured_path: Optional[str] = None) -> Dict:
+    vector_path = vector_path_for(dst_path)
+    if os.path.exists(dst_path) or os.path.exists(vector_path):
+        print(f"⏭️  이미 변환된 파일이 있어 건너뜁니다: {os.path.basename(dst_path)}")
+        return {}
+
+    fingerprints = structured_fingerprints(structured_path)
+    counts = {"converted": 0, "skipped": 0, "unmatched": 0}
+    with JsonlCheckpoint(dst_path) as checkpoint, VectorWriter(vector_path) as writer:
+        for item in iter_flattened(iter_json_array(src_path)):
+            values = item.pop('values', None) if isinstance(item, dict) else None
+            if not values:
+                counts["skipped"] += 1
+                continue
+            item['vector_offset'] = writer.append(values)
+            item['dim'] = len(values)
+
+            queue = fingerprints.get(str(item.get('id')))
+            if queue:
+                fp, item['source_fingerprint'], source_key = queue.pop(0)
+                if source_key is not None:
+                    item['source_key'] = source_key
+            else:
+                fp = fingerprint(item)
+                counts["unmatched"] += 1
+            checkpoint.record(fp, item)
+            counts["converted"] += 1
+
+    src_size = os.path.getsize(src_path)
+    dst_size = os.path.getsize(dst_path) + os.path.getsize(vector_path)
+    print(f"✅ {os.path.basename(src_path)} -> {os.path.basename(dst_path)} + {os.path.basename(vector_path)} "
+          f"({counts['converted']}건, {src_size / 1e6:.1f}MB -> {dst_size / 1e6:.1f}MB)")
+    if counts["unmatched"]:
+        print(f"   ⚠️ 구조화 데이터와 매칭되지 않은 문서 {counts['unmatched']}건 "
+              f"(embed 스크립트를 다시 실행하면 이 문서들은 새로 임베딩됩니다)")
+    return counts
+
+
+def main():
+    if len(sys.argv) >= 3:
+        convert_ready_file(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        return
+
+    for folder, ready_name, structured_name in DEFAULT_TARGETS:
+        src_path = os.path.join(project_root, folder, f"{ready_name}.json")
+        if not os.path.exists(src_path):
+            print(f"➖ 변환할 파일 없음: {folder}/{ready_name}.json")
+            continue
+        structured_path = os.path.join(project_root, folder, f"{structured_name}.jsonl")
+        if not os.path.exists(structured_path):
+            structured_path = structured_path[:-1]
+        convert_ready_file(src_path, os.path.join(project_root, folder, f"{ready_name}.jsonl"), structured_path)
+
+
+if __name__ == "__main__":
+    main()
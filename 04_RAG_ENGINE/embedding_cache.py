@@ -0,0 +1,177 @@
+import os
+import re
+import time
+import array
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+
+def normalize_query(text: str) -> str:
+    """캐시 키용 정규화: NFKC, 소문자, 공백 하나로 압축"""
+    text = unicodedata.normalize("NFKC", str(text)).strip().lower()
+    return re.sub(r"\s+", " ", text)
+
+
+def make_cache_key(text: str, model: str, task_type: str) -> str:
+    raw = f"{model}\x1f{task_type}\x1f{normalize_query(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array.array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vec = array.array("f")
+    vec.frombytes(blob)
+    return vec.tolist()
+
+
+class EmbeddingCache:
+    """
+    질의 임베딩 2단 캐시입니다.
+    1차: 프로세스 메모리 LRU (OrderedDict)
+    2차: SQLite 파일 (프로세스 재시작 후에도 유지)
+    키는 정규화된 질의 + 임베딩 모델 + task_type 입니다.
+    디스크 적중 시 last_access 갱신은 바로 쓰지 않고 모아 두었다가 put() 이나 access_flush_every 건마다
+    한 번에 커밋합니다 (조회가 이벤트 루프에서 매번 쓰기/커밋을 하지 않도록).
+    """
+    def __init__(self, db_path: Optional[str] = None, max_memory_items: int = 2048,
+                 max_disk_items: int = 100000, ttl_seconds: Optional[float] = 30 * 24 * 3600,
+                 access_flush_every: int = 64):
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.ttl_seconds = ttl_seconds
+        self.access_flush_every = access_flush_every
+        self._memory = OrderedDict()  # key -> (created_at, vector)
+        self._pending_access = {}     # key -> last_access (아직 디스크에 쓰지 않은 갱신)
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, vector BLOB NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, created_at: float, vector: List[float]):
+        self._memory[key] = (created_at, vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, text: str, model: str, task_type: str) -> Optional[List[float]]:
+        vector = self.get_memory(text, model, task_type)
+        return vector if vector is not None else self.get_disk(text, model, task_type)
+
+    def get_memory(self, text: str, model: str, task_type: str) -> Optional[List[float]]:
+        """1차(메모리) 캐시만 봅니다. 디스크를 건드리지 않으므로 이벤트 루프에서 바로 불러도 됩니다. 없으면 None (미스로 세지 않음)"""
+        key = make_cache_key(text, model, task_type)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[1]
+                del self._memory[key]
+            return None
+
+    def get_disk(self, text: str, model: str, task_type: str) -> Optional[List[float]]:
+        """2차(SQLite) 캐시를 봅니다. 적중하면 메모리에도 올립니다. 블로킹 I/O 이므로 비동기 경로에서는 스레드에서 부릅니다."""
+        key = make_cache_key(text, model, task_type)
+        with self._lock:
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1]):
+                        vector = _unpack(row[0])
+                        self._pending_access[key] = time.time()
+                        if len(self._pending_access) >= self.access_flush_every:
+                            self._flush_access()
+                            self._conn.commit()
+                        self._remember(key, row[1], vector)
+                        self.disk_hits += 1
+                        return vector
+                    self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, text: str, model: str, task_type: str, vector: List[float]):
+        key = make_cache_key(text, model, task_type)
+        now = time.time()
+        vector = list(vector)
+        with self._lock:
+            self._remember(key, now, vector)
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, _pack(vector), now, now)
+            )
+            self._flush_access()
+            self._evict_disk(now)
+            self._conn.commit()
+
+    def flush(self):
+        """모아 둔 last_access 갱신을 디스크에 씁니다."""
+        if self._conn is None:
+            return
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+
+    def _flush_access(self):
+        if self._pending_access:
+            self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                   [(t, k) for k, t in self._pending_access.items()])
+            self._pending_access.clear()
+
+    def _evict_disk(self, now: float):
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM embeddings WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_disk_items
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)", (overflow,)
+            )
+            self.evictions += overflow
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        disk_items = 0
+        if self._conn is not None:
+            with self._lock:
+                disk_items = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_items": len(self._memory),
+            "disk_items": disk_items,
+        }
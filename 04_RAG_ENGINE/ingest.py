@@ -0,0 +1,165 @@
+"""
+전체 적재 파이프라인 단일 진입점입니다.
+
+컬렉션마다 preprocess -> embed -> tokenize -> load 순서의 의존 그래프를 따르고,
+서로 독립인 컬렉션(faq / review / timetable)은 동시에 실행합니다.
+LLM 구조화와 임베딩 호출은 컬렉션 간에 하나의 속도 예산(limiter)을 공유하므로,
+동시에 돌려도 쿼터를 넘지 않고 전체 시간은 가장 느린 컬렉션에 가까워집니다.
+
+사용법:
+    python ingest.py                                  # 전체 컬렉션, 전체 단계
+    python ingest.py --collections timetable          # 한 컬렉션만
+    python ingest.py --stages load                    # 한 단계만 (앞 단계 산출물을 그대로 사용)
+    python ingest.py --collections faq,review --stages embed,tokenize,load
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import importlib.util
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+from pipeline_utils import AdaptiveRateLimiter, TokenBucketLimiter, llm_stage_config
+
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+# RateBudget 이 LLM_RPM / LLM_TPM 을 읽기 전에 프로젝트 .env 를 불러옵니다 (단계 스크립트는 import 시점에야 부릅니다).
+load_dotenv(os.path.join(project_root, '.env'))
+
+STAGES = ["preprocess", "embed", "tokenize", "load"]
+
+# 컬렉션별 단계 스크립트 (01_*, 02_* 는 각 폴더의 기존 스크립트를 그대로 씁니다)
+PIPELINES = {
+    "faq": {"dir": "01_FAQ", "preprocess": "01_preprocess_data.py", "embed": "02_embed_vectors.py"},
+    "review": {"dir": "02_REVIEW", "preprocess": "01_preprocess_reviews.py", "embed": "02_embed_reviews.py"},
+    "timetable": {"dir": "03_TIMETABLE", "preprocess": "01_preprocess_timetable.py", "embed": "02_embed_timetable.py"},
+}
+
+# (컬렉션, 단계) -> 로드한 단계 스크립트 모듈. 같은 실행 안에서 스크립트를 다시 실행하지 않습니다.
+_SCRIPT_MODULES = {}
+
+
+class RateBudget:
+    """모든 컬렉션이 공유하는 limiter 묶음. 같은 이벤트 루프 안에서만 사용합니다."""
+    def __init__(self):
+        config = llm_stage_config()
+        self.llm = TokenBucketLimiter(config["rpm"], config["tpm"])
+        self.embed = AdaptiveRateLimiter()
+
+
+def load_script(collection: str, stage: str):
+    """'01_preprocess_data.py' 처럼 숫자로 시작하는 스크립트는 import 문으로 못 불러오므로 경로로 로드합니다.
+
+    모듈 실행(dotenv, genai 클라이언트 생성)이 블로킹이므로 이벤트 루프에서는 aload_script 로 부릅니다.
+    """
+    key = (collection, stage)
+    if key in _SCRIPT_MODULES:
+        return _SCRIPT_MODULES[key]
+    spec = PIPELINES[collection]
+    path = os.path.join(project_root, spec["dir"], spec[stage])
+    module_spec = importlib.util.spec_from_file_location(f"{collection}_{stage}", path)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    _SCRIPT_MODULES[key] = module
+    return module
+
+
+async def aload_script(collection: str, stage: str):
+    if (collection, stage) in _SCRIPT_MODULES:
+        return _SCRIPT_MODULES[(collection, stage)]
+    return await asyncio.to_thread(load_script, collection, stage)
+
+
+def _build_vector_db():
+    # Chroma / Kiwi 초기화가 무거우므로 tokenize/load 단계가 있을 때만 import 합니다.
+    # 처음 import 는 arun 이 스레드에서 미리 해 두므로, 이벤트 루프에서 부를 때는 이미 로드된 모듈을 돌려줍니다.
+    import build_vector_db
+    return build_vector_db
+
+
+async def run_stage(collection: str, stage: str, budget: RateBudget):
+    if stage == "preprocess":
+        await (await aload_script(collection, stage)).arun(limiter=budget.llm)
+    elif stage == "embed":
+        await (await aload_script(collection, stage)).arun(limiter=budget.embed)
+    else:
+        db = _build_vector_db()
+        structured_path, ready_path, type_config = db.COLLECTION_SOURCES[collection]
+        # Chroma / Kiwi 호출은 블로킹이므로 스레드에서 실행해 다른 컬렉션의 API 단계와 겹치게 합니다.
+        if stage == "tokenize":
+            await asyncio.to_thread(db.prepare_bm25_tokens, collection, structured_path, ready_path, type_config)
+        else:
+            # 적재 단계의 임베딩도 이 루프로 돌아와 embed 단계와 같은 limiter 를 씁니다.
+            await asyncio.to_thread(db.process_and_insert, collection, structured_path, ready_path, type_config,
+                                    budget.embed, asyncio.get_running_loop())
+
+
+async def run_collection(collection: str, stages: List[str], budget: RateBudget) -> Dict[str, float]:
+    """한 컬렉션의 단계를 의존 순서대로 실행하고 단계별 소요 시간(초)을 반환합니다."""
+    timings = {}
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        print(f"▶️  [{collection}] {stage} 시작")
+        started = time.monotonic()
+        await run_stage(collection, stage, budget)
+        timings[stage] = time.monotonic() - started
+        print(f"✅ [{collection}] {stage} 완료 ({timings[stage]:.1f}초)")
+    return timings
+
+
+async def arun(collections: List[str], stages: List[str]):
+    budget = RateBudget()
+    started = time.monotonic()
+    if any(s in stages for s in ("tokenize", "load")):
+        # dotenv / genai / Kiwi / Chroma / 토큰 캐시 초기화가 루프를 막으면 다른 컬렉션의 API 단계가 겹치지 못합니다.
+        await asyncio.to_thread(_build_vector_db)
+    results = await asyncio.gather(
+        *(run_collection(c, stages, budget) for c in collections), return_exceptions=True
+    )
+    wall = time.monotonic() - started
+
+    print("\n📊 적재 파이프라인 요약")
+    for collection, result in zip(collections, results):
+        if isinstance(result, Exception):
+            print(f"   ❌ {collection}: {result}")
+        else:
+            detail = ", ".join(f"{stage} {sec:.1f}s" for stage, sec in result.items())
+            print(f"   {collection}: 합계 {sum(result.values()):.1f}s ({detail})")
+    print(f"   ⏱️ 전체 소요 {wall:.1f}s")
+
+    if any(s in stages for s in ("tokenize", "load")):
+        _build_vector_db().print_tokenizer_stats()
+    return results
+
+
+def parse_list(value: str, allowed: List[str], label: str) -> List[str]:
+    items = [v.strip() for v in value.split(",") if v.strip()]
+    unknown = [v for v in items if v not in allowed]
+    if unknown:
+        raise SystemExit(f"알 수 없는 {label}: {unknown} (가능: {', '.join(allowed)})")
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IELTS RAG 적재 파이프라인")
+    parser.add_argument("--collections", default=",".join(PIPELINES),
+                        help=f"쉼표로 구분 ({', '.join(PIPELINES)})")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"쉼표로 구분 ({', '.join(STAGES)}), 지정한 단계만 의존 순서대로 실행")
+    args = parser.parse_args()
+
+    collections = parse_list(args.collections, list(PIPELINES), "컬렉션")
+    stages = parse_list(args.stages, STAGES, "단계")
+    print(f"🚀 적재 파이프라인 시작: 컬렉션 {collections} / 단계 {stages}")
+    results = asyncio.run(arun(collections, stages))
+    if any(isinstance(r, Exception) for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,907 @@
+"""
+전처리/임베딩 스크립트(01_FAQ, 02_REVIEW, 03_TIMETABLE)가 공유하는 유틸리티입니다.
+각 스크립트는 04_RAG_ENGINE 을 sys.path 에 추가한 뒤 import 합니다.
+"""
+import os
+import json
+import mmap
+import time
+import random
+import asyncio
+import heapq
+import hashlib
+from array import array
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from response_cache import ResponseCache, make_response_key
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 전처리 LLM 응답과 문서 임베딩을 함께 저장하는 캐시 파일
+LLM_CACHE_PATH = os.path.join(PROJECT_ROOT, 'llm_cache.sqlite3')
+
+_shared_llm_cache = None
+
+
+def llm_stage_config() -> Dict:
+    """
+    전처리 LLM 단계의 속도 예산과 동시 워커 수. 모델 쿼터에 맞춰 LLM_RPM / LLM_TPM / LLM_CONCURRENCY 로 조절합니다.
+    .env 를 읽은 뒤 값을 보도록 호출 시점에 환경 변수를 읽습니다.
+    """
+    return {
+        "rpm": int(os.getenv("LLM_RPM", "15")),
+        "tpm": int(os.getenv("LLM_TPM", "1000000")),
+        "concurrency": int(os.getenv("LLM_CONCURRENCY", "8")),
+    }
+
+
+def embed_stage_config() -> Dict:
+    """02_embed_* 단계의 arun_embed_stage 인자. embed_content 는 리스트를 받으므로 batch_size 개를 한 요청으로 보냅니다."""
+    return {
+        "batch_size": int(os.getenv("EMBED_BATCH_SIZE", "100")),
+        "concurrency": int(os.getenv("EMBED_CONCURRENCY", "4")),
+    }
+
+
+def shared_llm_cache() -> ResponseCache:
+    """
+    프로세스에서 하나만 여는 ResponseCache. 프롬프트/모델/설정이 같은 LLM 응답과 본문이 같은 문서의 임베딩은
+    체크포인트를 지우고 다시 돌려도 API 를 호출하지 않습니다.
+    """
+    global _shared_llm_cache
+    if _shared_llm_cache is None:
+        _shared_llm_cache = ResponseCache(LLM_CACHE_PATH)
+    return _shared_llm_cache
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    code = getattr(e, 'code', None) or getattr(e, 'status_code', None)
+    text = str(e)
+    return code == 429 or "429" in text or "RESOURCE_EXHAUSTED" in text or "quota" in text.lower()
+
+
+def is_retryable_error(e: Exception) -> bool:
+    """429 와 일시적인 서버 오류(500/503)는 재시도 대상입니다."""
+    text = str(e)
+    return is_rate_limit_error(e) or any(k in text for k in ("500", "503", "UNAVAILABLE", "INTERNAL", "DEADLINE"))
+
+
+def estimate_tokens(text: str) -> int:
+    """한국어 위주 텍스트의 대략적인 토큰 수 (TPM 예산 계산용)"""
+    return max(1, len(text) // 2)
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 60.0) -> float:
+    """지수 백오프 + full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+
+
+class AdaptiveRateLimiter:
+    """
+    AIMD 방식의 요청 간격 조절기입니다.
+    성공할 때마다 초당 요청 수를 조금씩 올리고, 429 를 받으면 절반으로 줄입니다.
+    고정 sleep 대신 쿼터가 허용하는 만큼만 빠르게 보냅니다.
+    """
+    def __init__(self, rate: float = 2.0, min_rate: float = 0.1, max_rate: float = 50.0,
+                 increase: float = 0.2, decrease: float = 0.5):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_time = max(now, self._next_time) + 1.0 / self.rate
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+
+
+
+
+class TokenBucketLimiter:
+    """
+    분당 요청 수(RPM)와 분당 토큰 수(TPM) 두 개의 버킷으로 호출 속도를 제한합니다.
+    429 를 받으면 요청 버킷을 비워 다른 워커도 잠시 멈추게 합니다.
+    """
+    def __init__(self, rpm: float, tpm: Optional[float] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm) if tpm else 0.0
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens: int = 0):
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        async with self._lock:
+            while True:
+                self._refill()
+                need_requests = 1 - self._requests
+                need_tokens = tokens - self._tokens if self.tpm else 0
+                if need_requests <= 0 and need_tokens <= 0:
+                    self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return
+                wait = need_requests * 60.0 / self.rpm if need_requests > 0 else 0.0
+                if need_tokens > 0:
+                    wait = max(wait, need_tokens * 60.0 / self.tpm)
+                await asyncio.sleep(wait)
+
+    def on_throttle(self):
+        self._requests = min(self._requests, 0.0)
+
+
+
+
+class ProgressReporter:
+    """처리 건수, 처리량(건/초), 남은 시간(ETA)을 출력합니다."""
+    def __init__(self, total: int, label: str = "", every: int = 1):
+        self.total = total
+        self.label = label
+        self.every = max(1, every)
+        self.done = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def update(self, ok: bool, note: str = ""):
+        self.done += 1
+        if ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        if self.done % self.every == 0 or self.done == self.total:
+            print(self.format_line(note))
+
+    def format_line(self, note: str = "") -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        throughput = self.done / elapsed
+        if self.total:
+            remaining = (self.total - self.done) / throughput if throughput else 0
+            eta = f"{int(remaining // 60)}분 {int(remaining % 60)}초"
+        else:
+            eta = "?"
+        line = (f"   {self.label}[{self.done}/{self.total or '?'}] 성공 {self.succeeded} / 실패 {self.failed}"
+                f" | {throughput:.2f}건/s | ETA {eta}")
+        return f"{line} | {note}" if note else line
+
+
+
+
+async def arun_llm_stage(items: Iterable[Any], worker: Callable[[Any], Awaitable[Any]],
+                         limiter: TokenBucketLimiter, concurrency: int = 8, max_retries: int = 5,
+                         token_estimator: Callable[[Any], int] = None, label: str = "",
+                         describe: Callable[[Any], str] = None,
+                         on_result: Callable[[Any, Any, Optional[str]], None] = None,
+                         total: Optional[int] = None,
+                         is_cached: Callable[[Any], bool] = None) -> Optional[List[Any]]:
+    """
+    items 를 worker(item) 로 동시에 처리하는 공용 LLM 구조화 단계입니다.
+    - concurrency 개의 워커가 items 이터레이터에서 하나씩 꺼내 처리하고, 호출 속도는 limiter(RPM/TPM)가 제한합니다.
+    - 429/일시 오류는 지수 백오프 + jitter 로 재시도하고, 그 외 오류는 즉시 실패 처리합니다.
+    - worker 가 None 을 반환하면 스킵(실패 아님)으로 봅니다.
+    - is_cached(item) 이 True 인 항목(응답 캐시 적중)은 limiter 를 거치지 않아, 재실행이 RPM 에 묶이지 않습니다.
+    on_result(item, result, error) 가 주어지면 결과를 모으지 않고 끝나는 즉시 넘기며(체크포인트 기록용) None 을 반환합니다.
+    아니면 items 와 같은 순서의 결과 리스트(실패/스킵은 None)를 반환합니다.
+    """
+    if total is None and hasattr(items, '__len__'):
+        total = len(items)
+    iterator = enumerate(items)
+    progress = ProgressReporter(total, label)
+    results = {} if on_result is None else None
+
+    async def _process(item: Any, name: str):
+        for attempt in range(max_retries):
+            if attempt > 0 or is_cached is None or not is_cached(item):
+                await limiter.acquire(token_estimator(item) if token_estimator else 0)
+            try:
+                result = await worker(item)
+                progress.update(True, f"{'성공' if result is not None else '스킵'}: {name}")
+                return result, None
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    limiter.on_throttle()
+                if not is_retryable_error(e) or attempt == max_retries - 1:
+                    progress.update(False, f"변환 실패 ({name}): {e}")
+                    return None, str(e)
+                await asyncio.sleep(backoff_delay(attempt))
+
+    async def _worker():
+        # 이벤트 루프는 단일 스레드이므로 워커들이 같은 이터레이터를 공유해도 안전합니다.
+        for idx, item in iterator:
+            result, error = await _process(item, describe(item) if describe else str(idx))
+            if on_result is not None:
+                on_result(item, result, error)
+            else:
+                results[idx] = result
+
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    if results is None:
+        return None
+    return [results[i] for i in range(len(results))]
+
+
+def run_llm_stage(items: Iterable[Any], worker: Callable[[Any], Awaitable[Any]], **kwargs) -> Optional[List[Any]]:
+    """arun_llm_stage 의 동기 래퍼"""
+    return asyncio.run(arun_llm_stage(items, worker, **kwargs))
+
+
+
+
+class BatchRetryQueue:
+    """
+    실패한 배치를 다시 시도하는 큐입니다. process(items) 는 실패한 (item, 예외) 목록을 반환합니다.
+    - 재시도 가능한 오류(429/5xx): 실패분만 지수 백오프(+jitter) 후 다시 시도합니다. 대기 중에도 다른 배치는 계속 처리됩니다.
+      max_attempts 번 실패하면 쪼개지 않고 전부 dead_letter 로 넘깁니다 (장애 중 분할은 호출 수만 늘립니다).
+    - 재시도해도 소용없는 오류(문서 자체 문제)면 배치를 반으로 쪼개 다시 넣어 문제 문서를 좁힙니다.
+    - 한 건짜리 배치까지 실패하면 dead_letter(item, 예외) 로 넘깁니다.
+    """
+    def __init__(self, process: Callable[[List[Any]], List[Tuple[Any, Exception]]],
+                 dead_letter: Callable[[Any, Exception], None], max_attempts: int = 3,
+                 retryable: Callable[[Exception], bool] = is_retryable_error):
+        self.process = process
+        self.dead_letter = dead_letter
+        self.max_attempts = max_attempts
+        self.retryable = retryable
+        self._heap = []  # (ready_at, seq, items, attempt)
+        self._seq = 0
+
+        self.retries = 0
+        self.splits = 0
+        self.dead = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _push(self, items: List[Any], attempt: int, delay: float = 0.0):
+        self._seq += 1
+        heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, items, attempt))
+
+    def submit(self, items: List[Any]):
+        """새 배치를 처리하고, 그 사이 대기 시간이 지난 재시도 배치도 함께 처리합니다."""
+        self._run(items, 0)
+        self.poll()
+
+    def _run(self, items: List[Any], attempt: int):
+        try:
+            failures = self.process(items)
+        except Exception as e:
+            failures = [(item, e) for item in items]
+        if not failures:
+            return
+
+        failed = [item for item, _ in failures]
+        error = failures[0][1]
+        if self.retryable(error):
+            if attempt + 1 < self.max_attempts:
+                self.retries += 1
+                self._push(failed, attempt + 1, backoff_delay(attempt))
+            else:
+                self.dead += len(failed)
+                for item, item_error in failures:
+                    self.dead_letter(item, item_error)
+        elif len(failed) > 1:
+            # 한 문서 때문에 나머지까지 버려지지 않도록 반으로 나눕니다.
+            self.splits += 1
+            mid = len(failed) // 2
+            self._push(failed[:mid], 0)
+            self._push(failed[mid:], 0)
+        else:
+            self.dead += 1
+            self.dead_letter(failed[0], error)
+
+    def poll(self):
+        while self._heap and self._heap[0][0] <= time.monotonic():
+            _, _, items, attempt = heapq.heappop(self._heap)
+            self._run(items, attempt)
+
+    def drain(self):
+        """남은 재시도를 모두 끝냅니다. 다음 배치의 대기 시간만큼만 기다립니다."""
+        while self._heap:
+            wait = self._heap[0][0] - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.poll()
+
+    def stats(self) -> Dict:
+        return {"retries": self.retries, "splits": self.splits, "dead": self.dead}
+
+
+
+
+def fingerprint(row: Any) -> str:
+    """원본 행(dict 등)의 지문. 체크포인트에서 이미 처리한 행인지 판단하는 키입니다."""
+    payload = json.dumps(row, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def iter_jsonl(path: str, bad_lines: Optional[List[Tuple[str, int]]] = None) -> Iterator[Dict]:
+    """
+    JSONL 을 한 줄씩 읽습니다. 중단으로 잘린 마지막 줄 등 깨진 줄은 건너뛰고,
+    bad_lines 를 넘기면 (경로, 줄 번호) 를 넣어 호출자가 읽지 못한 줄이 있었는지 알 수 있게 합니다.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                print(f"⚠️ 깨진 JSONL 줄 건너뜀 ({os.path.basename(path)}:{line_no})")
+                if bad_lines is not None:
+                    bad_lines.append((path, line_no))
+
+
+def iter_records(path: str) -> Iterator[Dict]:
+    """
+    단계 산출물을 읽습니다.
+    - .jsonl: JsonlCheckpoint 형식이면 status 가 ok 인 줄의 data 만, 아니면 줄 그대로
+    - .json: 예전 형식(배열). iter_json_array 로 원소 단위로 스트리밍
+    """
+    for _, data in iter_fingerprinted_records(path):
+        yield data
+
+
+def iter_fingerprinted_records(path: str) -> Iterator[Tuple[str, Any]]:
+    """
+    iter_records 와 같지만 (지문, data) 를 내보냅니다.
+    JsonlCheckpoint 형식이면 기록된 지문(= 이 결과를 만든 입력 행의 지문), 아니면 항목 자체의 지문입니다.
+    """
+    for fp, _, data in iter_keyed_records(path):
+        yield fp, data
+
+
+def iter_keyed_records(path: str, bad_lines: Optional[List[Tuple[str, int]]] = None) -> Iterator[Tuple[str, Any, Any]]:
+    """
+    iter_fingerprinted_records 에 JsonlCheckpoint 줄의 자연 키를 더해 (지문, 키, data) 를 내보냅니다. 키가 없으면 None
+    bad_lines 는 iter_jsonl 과 같습니다.
+    """
+    if path.endswith('.jsonl'):
+        for record in iter_jsonl(path, bad_lines):
+            if 'fingerprint' not in record:
+                yield fingerprint(record), None, record
+            elif record.get('status') == 'ok':
+                yield record['fingerprint'], record.get('key'), record['data']
+    else:
+        for item in iter_json_array(path):
+            yield fingerprint(item), None, item
+
+
+def iter_flattened(items: Iterable[Any]) -> Iterator[Any]:
+    """[[...], [...]] 처럼 중첩된 배열을 풀어 원소를 하나씩 내보냅니다."""
+    for item in items:
+        if isinstance(item, list):
+            yield from iter_flattened(item)
+        else:
+            yield item
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    최상위 JSON 배열의 원소를 하나씩 yield 하는 증분 파서입니다.
+    파일을 chunk_size 씩 읽고 JSONDecoder.raw_decode 로 원소 단위로 잘라내므로,
+    버퍼는 (chunk_size + 원소 하나) 크기를 넘지 않습니다. 배열이 아니면 값 하나를 yield 합니다.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf, pos, eof = "", 0, False
+        started = False
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ',')):
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    return
+                buf, pos = f.read(chunk_size), 0
+                eof = not buf
+                continue
+
+            if not started:
+                if buf[pos] != '[':
+                    yield json.loads(buf[pos:] + f.read())
+                    return
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # 원소 뒤에 구분자(',' / ']' / 공백)가 보여야 완결입니다. 버퍼 경계에서 잘린 숫자('-1.5' 등)는 더 읽습니다.
+                complete = eof or (end < len(buf) and (buf[end] in ",]" or buf[end].isspace()))
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield value
+            pos = end
+
+
+
+
+class JsonlCheckpoint:
+    """
+    단계 결과를 JSONL 에 한 줄씩 바로 append 하는 체크포인트입니다.
+    각 줄: {"fingerprint": 원본 행 지문, "status": "ok" | "skipped" | "failed", "data": 결과, "error": 메시지,
+            "key": 원본 행의 자연 키(선택)}
+    key 는 내용이 바뀌어도 같은 행을 가리키는 값(FAQ 질문, 후기 링크 등)으로, 적재 단계의 문서 id 가 됩니다.
+    재시작하면 ok/skipped 로 기록된 행은 건너뛰고, failed 로 끝난 행만 다시 시도합니다.
+    live 에 현재 입력의 지문 집합을 넘기면, 먼저 입력에 없는 지문(수정/삭제된 원본 행)의 줄을 지우고
+    지문마다 마지막 결과 한 줄만 남기도록 파일을 다시 씁니다.
+    vector_path 에 .f32 사이드카를 넘기면 정리할 때 남는 줄의 벡터만 새 사이드카로 옮기고
+    vector_offset 을 새 위치로 고쳐 씁니다 (버린 줄의 벡터가 고아로 쌓이지 않음).
+    메모리에는 지문 집합만 둡니다.
+    """
+    def __init__(self, path: str, live: Optional[set] = None, vector_path: Optional[str] = None):
+        self.path = path
+        self.vector_path = vector_path
+        self.done = set()
+        self.failed = set()
+        self.counts = {"ok": 0, "skipped": 0, "failed": 0}
+        self.compacted = 0
+        if vector_path:
+            self._recover_vectors()
+        if live is not None and os.path.exists(path):
+            self.compacted = self._compact(live)
+        if os.path.exists(path):
+            for record in iter_jsonl(path):
+                fp = record.get('fingerprint')
+                if record.get('status') == 'failed':
+                    if fp not in self.done:
+                        self.failed.add(fp)
+                else:
+                    self.done.add(fp)
+                    self.failed.discard(fp)
+        self._file = None
+
+    def _recover_vectors(self):
+        """
+        정리는 JSONL 임시 파일 -> 사이드카 임시 파일 순으로 만들고, JSONL -> 사이드카 순으로 교체합니다.
+        JSONL 임시 파일 없이 사이드카 임시 파일만 남았다면 두 교체 사이에 중단된 것이므로 교체를 마저 하고,
+        둘 다 남았다면 교체 전에 중단된 것이므로 임시 파일을 버립니다.
+        """
+        tmp_path, vector_tmp_path = f"{self.path}.tmp", f"{self.vector_path}.tmp"
+        if not os.path.exists(vector_tmp_path):
+            return
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+            os.remove(vector_tmp_path)
+        else:
+            os.replace(vector_tmp_path, self.vector_path)
+
+    def _compact(self, live: set) -> int:
+        """
+        지문마다 남길 줄을 고릅니다 (마지막 ok/skipped, 없으면 마지막 failed). 버릴 줄이 있으면
+        임시 파일에 남길 줄만 옮겨 쓴 뒤 원자적으로 교체하고, 버린 줄 수를 반환합니다.
+        사이드카가 있으면 남는 줄이 가리키지 않는 벡터가 있을 때도 함께 다시 씁니다.
+        """
+        keep = {}
+        keep_done = set()
+        keep_floats = {}
+        total = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f):
+                if not line.strip():
+                    continue
+                total += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                fp = record.get('fingerprint')
+                if fp not in live:
+                    continue
+                if record.get('status') != 'failed':
+                    keep[fp] = line_no
+                    keep_done.add(fp)
+                    data = record.get('data')
+                    keep_floats[fp] = data.get('dim', 0) if isinstance(data, dict) else 0
+                elif fp not in keep_done:
+                    keep[fp] = line_no
+        dropped = total - len(keep)
+        vectors = self.vector_path if self.vector_path and os.path.exists(self.vector_path) else None
+        orphan_floats = os.path.getsize(vectors) // 4 - sum(keep_floats.values()) if vectors else 0
+        if not dropped and orphan_floats <= 0:
+            return 0
+
+        keep_lines = set(keep.values())
+        tmp_path = f"{self.path}.tmp"
+        with open(self.path, 'r', encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+            if vectors:
+                dropped += self._compact_vectors(src, dst, keep_lines, vectors)
+            else:
+                for line_no, line in enumerate(src):
+                    if line_no in keep_lines:
+                        dst.write(line if line.endswith("\n") else line + "\n")
+        os.replace(tmp_path, self.path)
+        if vectors:
+            os.replace(f"{vectors}.tmp", vectors)
+        notes = [f"현재 입력에 없거나 덮어쓴 줄 {dropped}건 정리"] if dropped else []
+        if orphan_floats > 0:
+            notes.append(f"고아 벡터 {orphan_floats * 4 / 1024:.0f}KB 회수")
+        print(f"🧹 {os.path.basename(self.path)}: {', '.join(notes)}")
+        return dropped
+
+    def _compact_vectors(self, src, dst, keep_lines: set, vector_path: str) -> int:
+        """남길 줄의 벡터만 새 사이드카(.tmp)에 순서대로 옮기고 vector_offset 을 고쳐 씁니다. 벡터가 잘린 줄은 버립니다."""
+        broken = 0
+        with open(vector_path, 'rb') as vsrc, open(f"{vector_path}.tmp", 'wb') as vdst:
+            for line_no, line in enumerate(src):
+                if line_no not in keep_lines:
+                    continue
+                record = json.loads(line)
+                data = record.get('data')
+                if isinstance(data, dict) and 'vector_offset' in data:
+                    vsrc.seek(data['vector_offset'] * 4)
+                    buf = vsrc.read(data['dim'] * 4)
+                    if len(buf) != data['dim'] * 4:
+                        # 중단으로 벡터가 잘린 줄은 버려 다시 임베딩되게 합니다.
+                        broken += 1
+                        continue
+                    data['vector_offset'] = vdst.tell() // 4
+                    vdst.write(buf)
+                    line = json.dumps(record, ensure_ascii=False)
+                dst.write(line if line.endswith("\n") else line + "\n")
+        return broken
+
+    def __enter__(self):
+        needs_newline = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if needs_newline:
+            # 중단으로 잘린 마지막 줄 뒤에 이어 쓰지 않도록 줄을 바꿉니다.
+            self._file.write("\n")
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def is_done(self, fp: str) -> bool:
+        return fp in self.done
+
+    def record(self, fp: str, data: Any = None, error: Optional[str] = None, key: Any = None):
+        status = "failed" if error else ("ok" if data is not None else "skipped")
+        line = {"fingerprint": fp, "status": status}
+        if key is not None:
+            line["key"] = key
+        if data is not None:
+            line["data"] = data
+        if error:
+            line["error"] = error
+        self._file.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+        self.counts[status] += 1
+        if status == "failed":
+            self.failed.add(fp)
+        else:
+            self.done.add(fp)
+            self.failed.discard(fp)
+
+
+
+
+def vector_path_for(jsonl_path: str) -> str:
+    """faq_db_ready.jsonl -> faq_db_ready.f32 (벡터 사이드카)"""
+    return os.path.splitext(jsonl_path)[0] + ".f32"
+
+
+class VectorWriter:
+    """
+    임베딩 벡터를 float32 원시 버퍼 파일(.f32)에 이어 씁니다.
+    JSONL 레코드에는 벡터 대신 vector_offset(float 단위 위치)과 dim 만 기록합니다.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'ab')
+        # 중단으로 잘린 마지막 벡터가 있으면 4바이트 경계를 맞춥니다. (그 벡터는 어떤 레코드도 가리키지 않음)
+        remainder = self._file.tell() % 4
+        if remainder:
+            self._file.write(b"\0" * (4 - remainder))
+        return self
+
+    def __exit__(self, *exc):
+        self._file.close()
+        self._file = None
+
+    def append(self, vector: List[float]) -> int:
+        offset = self._file.tell() // 4
+        self._file.write(array('f', vector).tobytes())
+        self._file.flush()
+        return offset
+
+
+class VectorReader:
+    """.f32 파일을 mmap 으로 열어 벡터를 복사 없이(memoryview 슬라이스) 꺼냅니다."""
+    def __init__(self, path: str):
+        self.path = path
+        size = os.path.getsize(path)
+        self._floats = memoryview(b"").cast('f')
+        if size >= 4:
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._floats = memoryview(self._mmap)[:size - size % 4].cast('f')
+
+    def __len__(self):
+        return len(self._floats)
+
+    def get(self, offset: int, dim: int) -> memoryview:
+        if offset < 0 or offset + dim > len(self._floats):
+            raise IndexError(f"vector out of range: offset={offset}, dim={dim}")
+        return self._floats[offset:offset + dim]
+
+
+
+
+def is_generate_cached(cache: Optional[ResponseCache], model: str, prompt: str, template: str = "",
+                       config: Optional[Dict] = None) -> bool:
+    """agenerate_cached 가 API 를 부르지 않고 캐시에서 답할지 (arun_llm_stage 의 is_cached 용)"""
+    if cache is None:
+        return False
+    return cache.contains(make_response_key("generate", model, template, prompt, config or {}))
+
+
+async def agenerate_cached(client, model: str, prompt: str, template: str = "", config: Optional[Dict] = None,
+                           cache: Optional[ResponseCache] = None, validate: Callable[[str], Any] = None) -> str:
+    """
+    client.aio.models.generate_content 를 ResponseCache 로 감쌉니다. 응답 텍스트를 반환합니다.
+    키는 (모델, 프롬프트 템플릿, 렌더링된 프롬프트, 설정) 해시이고, validate(text) 를 통과한 응답만 저장합니다.
+    """
+    from google.genai import types
+
+    config = config or {}
+    key = make_response_key("generate", model, template, prompt, config)
+    if cache is not None:
+        cached = cache.get_text(key)
+        if cached is not None:
+            return cached
+
+    response = await client.aio.models.generate_content(
+        model=model,
+        contents=prompt,
+        config=types.GenerateContentConfig(**config)
+    )
+    text = response.text
+    if validate is not None:
+        validate(text)
+    if cache is not None:
+        cache.put_text(key, "generate", text)
+    return text
+
+
+async def arun_preprocess_stage(client, model: str, iter_rows: Callable[[], Iterable[Dict]], output_path: str,
+                                build_prompt: Callable[[Dict], Optional[str]], template: str,
+                                config: Optional[Dict] = None, parse: Callable[[str], Any] = json.loads,
+                                natural_key: Optional[Callable[[Dict], Any]] = None,
+                                describe: Optional[Callable[[Dict], str]] = None,
+                                limiter: Optional[TokenBucketLimiter] = None, label: str = "데이터 변환") -> Dict:
+    """
+    01_preprocess_* 단계의 공용 실행기입니다. 원본 행마다 build_prompt(row) 로 LLM 을 호출해 parse(응답) 결과를
+    output_path(JsonlCheckpoint)에 원본 행 지문/자연 키와 함께 한 줄씩 기록합니다.
+    - iter_rows() 는 원본 행을 스트리밍하는 이터레이터를 새로 만듭니다. 지문을 모을 때 한 번, 처리할 때 한 번 읽으므로
+      메모리에는 원본 행이 아니라 지문 집합만 남습니다.
+    - 중단 후 다시 실행하면 남은 행과 실패한 행만 처리하고, 원본에서 수정/삭제된 행의 결과는 시작할 때 지웁니다.
+    - build_prompt 가 None 을 반환한 행(내용 부족 등)과 parse 가 None 을 반환한 행은 스킵으로 기록합니다.
+    - 응답은 shared_llm_cache 에 저장되며, 캐시 적중 행은 limiter(RPM/TPM)를 쓰지 않습니다.
+    limiter 를 넘기면(ingest.py) 다른 컬렉션과 같은 속도 예산을 씁니다. 이번 실행의 기록 건수를 반환합니다.
+    """
+    stage_config = llm_stage_config()
+    cache = shared_llm_cache()
+    # 캐시는 다른 컬렉션의 단계와 공유하므로 이 단계의 적중/호출 수는 따로 셉니다.
+    cache_counts = {"hits": 0, "calls": 0}
+
+    async def _transform(row):
+        prompt = build_prompt(row)
+        if prompt is None:
+            return None
+        cache_counts["hits" if is_generate_cached(cache, model, prompt, template, config) else "calls"] += 1
+        text = await agenerate_cached(client, model, prompt, template, config, cache=cache, validate=parse)
+        return parse(text)
+
+    def _is_cached(row):
+        prompt = build_prompt(row)
+        return prompt is None or is_generate_cached(cache, model, prompt, template, config)
+
+    live = {fingerprint(row) for row in iter_rows()}
+    with JsonlCheckpoint(output_path, live=live) as checkpoint:
+        total = len(live - checkpoint.done)
+        pending = (row for row in iter_rows() if not checkpoint.is_done(fingerprint(row)))
+        print(f"🔄 {label} 시작... (대상 {total}건, 완료분 {len(live) - total}건 건너뜀, "
+              f"RPM {stage_config['rpm']}, TPM {stage_config['tpm']}, 동시 {stage_config['concurrency']})")
+
+        await arun_llm_stage(
+            pending, _transform, total=total,
+            limiter=limiter or TokenBucketLimiter(stage_config['rpm'], stage_config['tpm']),
+            concurrency=stage_config['concurrency'],
+            token_estimator=lambda row: estimate_tokens(build_prompt(row) or "") * 2,
+            is_cached=_is_cached,
+            describe=describe,
+            on_result=lambda row, result, error: checkpoint.record(
+                fingerprint(row), result, error, key=natural_key(row) if natural_key else None)
+        )
+        counts = dict(checkpoint.counts)
+
+    print(f"\n✅ {label} 완료! 이번 실행 저장 {counts['ok']}건 / 스킵 {counts['skipped']}건 / 실패 {counts['failed']}건.")
+    print(f"💾 LLM 응답 캐시: 적중 {cache_counts['hits']}건 / 호출 {cache_counts['calls']}건")
+    print(f"파일 위치: {output_path}")
+    return counts
+
+
+async def aembed_documents(client, model: str, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT",
+                           batch_size: int = 100, concurrency: int = 4,
+                           limiter: Optional[AdaptiveRateLimiter] = None,
+                           max_retries: int = 5, cache: Optional[ResponseCache] = None) -> List[Optional[List[float]]]:
+    """
+    texts 를 batch_size 개씩 묶어 embed_content 로 보내고, 최대 concurrency 개 배치를 동시에 처리합니다.
+    cache 가 있으면 (모델, task_type, 본문) 키로 이미 임베딩한 문서는 API 에 보내지 않습니다.
+    반환 리스트는 texts 와 같은 순서이며, 끝내 실패한 문서는 None 입니다.
+    """
+    from google.genai import types
+
+    limiter = limiter or AdaptiveRateLimiter()
+    semaphore = asyncio.Semaphore(concurrency)
+    vectors = [None] * len(texts)
+    keys = [None] * len(texts)
+    todo = list(range(len(texts)))
+    if cache is not None:
+        todo = []
+        for i, text in enumerate(texts):
+            keys[i] = make_response_key("embed", model, task_type, text)
+            blob = cache.get(keys[i])
+            if blob is None:
+                todo.append(i)
+            else:
+                vector = array('f')
+                vector.frombytes(blob)
+                vectors[i] = vector.tolist()
+        if len(todo) < len(texts):
+            print(f"   💾 임베딩 캐시 적중 {len(texts) - len(todo)}건 (API 호출 대상 {len(todo)}건)")
+
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    done = 0
+
+    async def _run_batch(indices: List[int]):
+        nonlocal done
+        batch = [texts[i] for i in indices]
+        async with semaphore:
+            for attempt in range(max_retries):
+                await limiter.acquire()
+                try:
+                    response = await client.aio.models.embed_content(
+                        model=model,
+                        contents=batch,
+                        config=types.EmbedContentConfig(task_type=task_type)
+                    )
+                    for idx, e in zip(indices, response.embeddings):
+                        vectors[idx] = e.values
+                        if cache is not None:
+                            cache.put(keys[idx], "embed", array('f', e.values).tobytes())
+                    limiter.on_success()
+                    break
+                except Exception as e:
+                    if is_rate_limit_error(e):
+                        limiter.on_throttle()
+                    if attempt == max_retries - 1:
+                        print(f"❌ 임베딩 배치 포기 ({len(batch)}건): {e}")
+                        break
+                    delay = backoff_delay(attempt)
+                    print(f"⚠️ 임베딩 배치 실패 (시도 {attempt + 1}/{max_retries}, {delay:.1f}초 후 재시도): {e}")
+                    await asyncio.sleep(delay)
+            done += len(batch)
+            print(f"   [{done}/{len(todo)}] Vectorized (rate: {limiter.rate:.1f} req/s)")
+
+    await asyncio.gather(*(_run_batch(indices) for indices in batches))
+    return vectors
+
+
+def embed_documents(client, model: str, texts: List[str], **kwargs) -> List[Optional[List[float]]]:
+    """aembed_documents 의 동기 래퍼"""
+    return asyncio.run(aembed_documents(client, model, texts, **kwargs))
+
+
+
+async def arun_embed_stage(client, model: str, input_path: str, output_path: str,
+                           make_payload: Callable[[Dict], Optional[Dict]], batch_size: int = 100,
+                           concurrency: int = 4, chunk_size: int = 1000,
+                           limiter: Optional[AdaptiveRateLimiter] = None,
+                           cache: Optional[ResponseCache] = None) -> Dict:
+    """
+    input_path 의 구조화 데이터를 chunk_size 개씩 읽어 임베딩하고, 결과를 바로 append 합니다.
+    - 벡터: output_path 옆의 .f32 사이드카 (float32 원시 버퍼)
+    - id/메타데이터/본문: output_path(JSONL), 벡터 위치는 vector_offset/dim 으로 기록
+    이미 임베딩된 행은 건너뛰고 실패했던 행만 다시 시도하므로 중단 후 재실행해도 비용이 중복되지 않습니다.
+    입력에 더 이상 없는 행의 결과는 시작할 때 output_path 에서 지웁니다 (JsonlCheckpoint live).
+    limiter 를 넘기면 다른 컬렉션의 임베딩 단계와 같은 속도 예산을 공유하고,
+    cache 를 넘기면 체크포인트를 지우고 다시 돌려도 본문이 같은 문서는 API 를 호출하지 않습니다.
+    """
+    limiter = limiter or AdaptiveRateLimiter()
+    # 입력에서 사라진 구조화 행(원본 수정/삭제)의 결과는 산출물에서 지우고, 그 벡터도 .f32 에서 함께 회수합니다.
+    live = {fingerprint(item) for item in iter_records(input_path)}
+    with JsonlCheckpoint(output_path, live=live, vector_path=vector_path_for(output_path)) as checkpoint, \
+            VectorWriter(vector_path_for(output_path)) as writer:
+        skipped = len(checkpoint.done)
+        retrying = len(checkpoint.failed)
+        print(f"🚀 임베딩 시작 (batch: {batch_size}, concurrency: {concurrency}) - "
+              f"완료분 {skipped}건 건너뜀, 이전 실패 {retrying}건 재시도")
+
+        async def _flush(chunk):
+            vectors = await aembed_documents(client, model, [p['document'] for _, p in chunk],
+                                             task_type="RETRIEVAL_DOCUMENT", batch_size=batch_size,
+                                             concurrency=concurrency, limiter=limiter, cache=cache)
+            for (fp, payload), vector in zip(chunk, vectors):
+                if vector is None:
+                    checkpoint.record(fp, error=f"embedding failed ({payload['id']})")
+                    continue
+                payload.pop('values', None)
+                # 벡터를 먼저 쓰고 레코드를 남깁니다. 그 사이에 중단되면 벡터만 고아로 남고(다음 실행 때 회수) 행은 재시도됩니다.
+                payload['vector_offset'] = writer.append(vector)
+                payload['dim'] = len(vector)
+                checkpoint.record(fp, payload)
+
+        chunk = []
+        for source_fp, source_key, item in iter_keyed_records(input_path):
+            fp = fingerprint(item)
+            if checkpoint.is_done(fp):
+                continue
+            payload = make_payload(item)
+            if payload is None:
+                checkpoint.record(fp)
+                continue
+            # 적재 단계는 LLM 이 만든 doc_id 대신 원본 행의 자연 키로 문서 id 를, 원본 행 지문으로 변경 여부를 정합니다.
+            payload['source_fingerprint'] = source_fp
+            if source_key is not None:
+                payload['source_key'] = source_key
+            chunk.append((fp, payload))
+            if len(chunk) >= chunk_size:
+                await _flush(chunk)
+                chunk = []
+        if chunk:
+            await _flush(chunk)
+
+        return dict(checkpoint.counts)
+
+
+def run_embed_stage(client, model: str, input_path: str, output_path: str,
+                    make_payload: Callable[[Dict], Optional[Dict]], **kwargs) -> Dict:
+    """arun_embed_stage 의 동기 래퍼"""
+    return asyncio.run(arun_embed_stage(client, model, input_path, output_path, make_payload, **kwargs))
@@ -0,0 +1,163 @@
+import re
+import math
+from typing import Callable, Dict, List, Optional
+
+
+# 의도별 키워드. TIMETABLE 키워드는 충돌 감지용으로만 쓰이며(슬롯 추출은 LLM 라우터 담당),
+# 기본 설정에서 TIMETABLE 은 로컬에서 확정하지 않습니다.
+INTENT_KEYWORDS = {
+    "FAQ": ["환불", "주차", "로그인", "비밀번호", "아이디", "결제", "카드", "할부", "영수증", "위치", "주소",
+            "오시는", "찾아가", "셔틀", "수강증", "증명서", "휴강", "양도", "수강 연기"],
+    "REVIEW": ["후기", "리뷰", "성공 사례", "성공사례", "합격", "경험담", "효과 있", "효과있", "받으신 분", "점수 올린"],
+    "TIMETABLE": ["시간표", "수업 시간", "개강", "수강료", "가격", "커리큘럼", "주말반", "평일반", "저녁반",
+                  "새벽반", "오전반", "반 있", "강의 추천", "수업 추천"],
+}
+
+# 단독으로는 의도를 확정할 수 없는 키워드 ('합격하려면 뭐 들어야 돼요' 는 시간표 질문입니다).
+# 이 키워드만 있는 발화는 single_keyword_intents 에 속해도 min_keyword_hits 를 채워야 합니다.
+AMBIGUOUS_KEYWORDS = {"합격"}
+
+# 점수·시간·반 단서. 이런 발화는 키워드가 FAQ/REVIEW 로 보여도 시간표 질문이거나 슬롯을 담고 있는 경우가 많아
+# ("7.0 합격하려면 어떤 반", "환불하고 다른 반으로") 로컬에서 확정하지 않고 LLM 라우터로 넘깁니다.
+SLOT_CUE_PATTERN = re.compile(r"\d|반(?!갑|가워)|수업|강의|시간|오전|오후|저녁|새벽|아침|주말|평일|요일|목표|개월")
+
+GREETING_PATTERN = re.compile(
+    r"^\s*(안녕|안녕하세요|안녕하십니까|하이|hi|hello|반가워요|반갑습니다|감사합니다|고마워요|고맙습니다)[\s!~.?]*$",
+    re.IGNORECASE,
+)
+
+# 최근접 중심(nearest-centroid) 분류용 라벨 예문
+EXAMPLE_UTTERANCES = {
+    "FAQ": ["환불 규정이 어떻게 되나요", "주차 가능한가요", "학원 위치가 어디예요", "로그인이 안 돼요",
+            "수강 연기 할 수 있나요", "카드 할부 되나요"],
+    "REVIEW": ["수강 후기 보여주세요", "직장인 합격 사례 있나요", "라이팅 점수 올린 후기 궁금해요",
+               "여기 다니면 효과 있나요", "6.5 받은 사람 있나요"],
+    "TIMETABLE": ["주말반 시간표 알려주세요", "평일 저녁 수업 있나요", "수강료가 얼마예요",
+                  "7.0 목표인데 어떤 반 들어야 해요", "다음달 개강 일정 알려주세요"],
+    "CHIT_CHAT": ["안녕하세요", "맛집 추천해줘", "너 사람이야?", "오늘 날씨 어때", "주식 뭐 사야돼"],
+}
+
+DEFAULT_CONFIG = {
+    "min_keyword_hits": 2,        # 로컬 확정에 필요한 서로 다른 키워드 수
+    "single_keyword_intents": ["FAQ", "REVIEW"],  # 단서 없는 발화에서 모호하지 않은 키워드 하나로도 확정할 의도
+    "keyword_margin": 1,          # 1위 의도 키워드 수가 다른 의도 키워드 합보다 이만큼 많아야 합니다.
+    "centroid_threshold": 0.80,   # 최근접 중심 코사인 유사도 하한
+    "centroid_margin": 0.05,      # 1위와 2위 유사도 차이 하한
+    "max_chars": 40,              # 이보다 긴 입력은 슬롯/문맥이 섞여 있을 가능성이 높아 LLM에 넘깁니다.
+    "local_intents": ["FAQ", "REVIEW", "CHIT_CHAT"],
+    "use_centroid": False,
+}
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+class LocalPreRouter:
+    """
+    SemanticRouter 앞단의 로컬 분류기입니다.
+    1단계: 키워드 매칭 (인사말 정규식 + 의도별 키워드 정규식, 점수·시간·반 단서가 있으면 건너뜀)
+           FAQ/REVIEW 는 모호하지 않은 키워드 하나로도 확정합니다 ('주차 되나요', '후기 보여주세요').
+    2단계(선택): 라벨 예문 임베딩의 의도별 중심과의 코사인 유사도
+    확신할 때만 LLM 라우터와 동일한 형식의 dict 를 반환하고, 아니면 None 을 반환합니다.
+    """
+    def __init__(self, embed_fn: Optional[Callable[[str], List[float]]] = None, config: Optional[Dict] = None):
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.embed_fn = embed_fn
+        self.patterns = {
+            intent: re.compile("|".join(re.escape(k) for k in sorted(words, key=len, reverse=True)))
+            for intent, words in INTENT_KEYWORDS.items()
+        }
+        self._centroids = None
+
+        self.total = 0
+        self.fallthrough = 0
+        self.local_hits = {}
+
+    def _result(self, intent: str, user_input: str, reason: str) -> Dict:
+        self.local_hits[intent] = self.local_hits.get(intent, 0) + 1
+        return {
+            "intent": intent,
+            "reason": f"local:{reason}",
+            "slots_to_update": {},
+            "missing_slots": [],
+            "search_query": user_input,
+            "router": "local",
+        }
+
+    def _keyword_stage(self, user_input: str):
+        matches = {}
+        for intent, pattern in self.patterns.items():
+            found = set(pattern.findall(user_input))
+            if found:
+                matches[intent] = found
+        if not matches:
+            return None, ""
+
+        best = max(matches, key=lambda i: len(matches[i]))
+        hits = len(matches[best])
+        others = sum(len(v) for k, v in matches.items() if k != best)
+        min_hits = self.config["min_keyword_hits"]
+        if best in self.config["single_keyword_intents"] and not matches[best] & AMBIGUOUS_KEYWORDS:
+            min_hits = 1
+        if hits < min_hits or hits - others < self.config["keyword_margin"]:
+            return None, ""
+        return best, f"keyword({','.join(sorted(matches[best]))})"
+
+    def _get_centroids(self) -> Dict[str, List[float]]:
+        if self._centroids is None:
+            centroids = {}
+            for intent, examples in EXAMPLE_UTTERANCES.items():
+                vectors = [self.embed_fn(e) for e in examples]
+                dim = len(vectors[0])
+                centroids[intent] = [sum(v[d] for v in vectors) / len(vectors) for d in range(dim)]
+            self._centroids = centroids
+        return self._centroids
+
+    def _centroid_stage(self, user_input: str):
+        vector = self.embed_fn(user_input)
+        sims = sorted(
+            ((_cosine(vector, c), intent) for intent, c in self._get_centroids().items()),
+            reverse=True,
+        )
+        (top_sim, top_intent), (second_sim, _) = sims[0], sims[1]
+        if top_sim >= self.config["centroid_threshold"] and top_sim - second_sim >= self.config["centroid_margin"]:
+            return top_intent, top_sim
+        return None, top_sim
+
+    def classify(self, user_input: str) -> Optional[Dict]:
+        self.total += 1
+        text = user_input.strip()
+        local_intents = self.config["local_intents"]
+
+        if len(text) <= self.config["max_chars"]:
+            if GREETING_PATTERN.match(text):
+                return self._result("CHIT_CHAT", user_input, "greeting")
+
+            if not SLOT_CUE_PATTERN.search(text):
+                intent, reason = self._keyword_stage(text)
+                if intent in local_intents:
+                    return self._result(intent, user_input, reason)
+
+                if self.config["use_centroid"] and self.embed_fn is not None:
+                    try:
+                        intent, sim = self._centroid_stage(text)
+                        if intent in local_intents:
+                            return self._result(intent, user_input, f"centroid({sim:.2f})")
+                    except Exception as e:
+                        print(f"⚠️ Pre-router embedding error: {e}")
+
+        self.fallthrough += 1
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "total": self.total,
+            "local": self.total - self.fallthrough,
+            "fallthrough": self.fallthrough,
+            "fallthrough_rate": self.fallthrough / self.total if self.total else 0.0,
+            "local_by_intent": dict(self.local_hits),
+        }
@@ -1,100 +1,783 @@
 import os
+import sys
 import json
-from typing import List, Dict, Any
-from dotenv import load_dotenv
-import chromadb
-from google import genai
-from google.genai import types
-from kiwipiepy import Kiwi
-from langchain.schema import SystemMessage, HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
+import math
+import time
+import heapq
+import asyncio
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from answer_cache import CachedAnswer, SemanticAnswerCache
+from context_compressor import compress_document, diversify
+from embedding_cache import EmbeddingCache
+from pipeline_utils import estimate_tokens
+from pre_router import LocalPreRouter
+from session_store import SessionStore
+from slot_extractor import SlotExtractor
+from slot_questions import REQUIRED_TIMETABLE_SLOTS, compose_ask_more, slots_to_ask
+from timetable_filter import WEEKEND, TimetableFilterIndex, build_filters, build_where
 
 
+# 이 모듈은 import 시 부수효과가 없습니다.
+# dotenv/genai/chromadb/kiwipiepy/langchain 은 처음 쓰일 때 로드되며, warmup() 으로 미리 올릴 수 있습니다.
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
-load_dotenv(os.path.join(project_root, '.env'))
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=GEMINI_API_KEY)
+GEMINI_API_KEY = None
+_env_loaded = False
 
 
 CHROMA_DB_PATH = os.path.join(project_root, 'chroma_db')
+QUERY_CACHE_PATH = os.path.join(project_root, 'query_cache.sqlite3')
 
 MODEL_NAME = "gemini-2.0-flash"
 
+# 로컬 pre-router 설정 (pre_router.DEFAULT_CONFIG 를 덮어씁니다)
+PRE_ROUTER_CONFIG = {
+    "min_keyword_hits": 2,
+    "single_keyword_intents": ["FAQ", "REVIEW"],
+    "keyword_margin": 1,
+    "use_centroid": False,
+}
+
+# Chroma/Kiwi 같은 블로킹 호출을 돌릴 스레드 수 (이벤트 루프 하나가 여러 상담을 동시에 처리)
+BLOCKING_POOL_SIZE = 8
+
+DEFAULT_SESSION_ID = "default"
+
+SESSION_STORE_CONFIG = {
+    "max_sessions": 10000,
+    "idle_ttl_seconds": 30 * 60,
+    "max_total_bytes": 256 * 1024 * 1024,
+}
+
+# 대화 메모리 (get_context_string 이 라우터/답변 프롬프트에 넣는 분량)
+MEMORY_TOKEN_BUDGET = 1500          # 요약 + 대화 창 합계 상한 (프로필 섹션 제외)
+MEMORY_SUMMARY_TOKENS = 300         # 창에서 밀려난 턴의 요약 상한
+MEMORY_MAX_TURNS = 10
+MEMORY_MAX_TURN_TOKENS = 300        # 메시지 하나당 프롬프트에 넣는 상한
+MEMORY_SUMMARY_LINE_TOKENS = 40
+# 창 밖으로 밀려나도 답변 제약 판단에 쓰는 키워드
+MEMORY_TRACKED_KEYWORDS = ("직장인",)
+
+# 로컬 슬롯 추출기 확신도가 이 이상인 슬롯은 라우팅 결과가 TIMETABLE 이면 프로필에 반영하고,
+# 추출된 슬롯이 모두 이 이상이면 라우터에는 의도(+ 아직 빈 슬롯)만 묻는 짧은 프롬프트를 씁니다.
+SLOT_CONFIDENCE_THRESHOLD = 0.8
+# 되물은 직후의 답이 이 비율 이상 슬롯 표현이면('평일 저녁이요, 5.5점') 라우터 없이 TIMETABLE 로 이어갑니다.
+SLOT_REPLY_MIN_COVERAGE = 0.3
+SLOT_REPLY_MAX_CHARS = 40
+
+# 의미 기반 답변 캐시: 세션 첫 턴의 표현만 다른 FAQ/후기 질문은 검색/생성 없이 저장된 답변을 돌려줍니다.
+# 환경변수/.env 의 ANSWER_CACHE=0 으로 끕니다 (ConsultantAgent 생성 시 읽음).
+ANSWER_CACHE_DEFAULT = True
+ANSWER_CACHE_CONFIG = {"threshold": 0.93, "ttl_seconds": 24 * 3600, "max_entries": 1000}
+# 캐시할 의도 -> 답변에 영향을 주는 프로필 필드 (같은 값일 때만 적중).
+# TIMETABLE 은 프로필 조건마다 답이 달라 기본 제외하며, 필요하면 여기에 추가합니다.
+ANSWER_CACHE_INTENTS = {"FAQ": (), "REVIEW": ("current_score", "target_score")}
+
+# 되묻기 문장은 템플릿으로 만들고, ASK_MORE_LLM_POLISH=1 이면 LLM 으로 한 번 다듬습니다 (API 호출 1회 추가).
+ASK_MORE_LLM_POLISH_DEFAULT = False
+
+# LLM 라우터가 도는 동안 미리 검색해 둘 컬렉션 (라우팅 결과와 맞으면 그대로 사용)
+SPECULATIVE_COLLECTIONS = ("faq", "review")
+
+# Chroma 거리(기본 l2 제곱거리)가 이 값보다 큰 문서는 관련 없는 것으로 보고 프롬프트에서 제외합니다.
+# 정규화된 임베딩 기준 2 - 2*cos 이므로 1.0 은 코사인 유사도 0.5 에 해당합니다.
+MAX_RELEVANT_DISTANCE = 1.0
+
+FALLBACK_QUERY = "아이엘츠 온라인 강의 인강 추천"
+
+# 검색 후처리: 중복 접기 -> MMR 로 top_n 선택 -> 필드 우선순위대로 본문을 max_chars(전체 합계) 안으로 압축
+CONTEXT_BUDGETS = {
+    "faq": {"top_n": 4, "mmr_lambda": 0.7, "max_chars": 1600},
+    "review": {"top_n": 4, "mmr_lambda": 0.5, "max_chars": 1800},
+    "timetable": {"top_n": 6, "mmr_lambda": 0.6, "max_chars": 2400},
+}
+# 저장된 임베딩 코사인 유사도가 이 이상이면 같은 문서로 보고 하나만 남깁니다.
+NEAR_DUPLICATE_SIMILARITY = 0.97
+# 최근 검색의 쿼리 임베딩을 이만큼 기억해 두고 MMR 에서 다시 씁니다 (임베딩 캐시 재조회/통계 중복 방지).
+SEARCH_VECTOR_MEMO_SIZE = 64
+
+COLLECTION_MAP = {
+    "TIMETABLE": "timetable",
+    "REVIEW": "review",
+    "FAQ": "faq"
+}
+
+
+
+
+# 의존성/엔진별 최초 로드 소요 시간(초). startup_report() 로 확인합니다.
+STARTUP_TIMINGS = {}
+
+_engines = {}
+_engines_lock = threading.RLock()
+
+
+def _timed_import(module_name: str):
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    STARTUP_TIMINGS.setdefault(f"import {module_name}", time.perf_counter() - start)
+    return module
+
+
+def _shared_engine(name: str, factory):
+    """프로세스 전역에서 한 번만 생성되는 엔진(client, retriever, router, llm)을 반환합니다."""
+    engine = _engines.get(name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(name)
+            if engine is None:
+                start = time.perf_counter()
+                engine = _engines[name] = factory()
+                STARTUP_TIMINGS.setdefault(f"init {name}", time.perf_counter() - start)
+    return engine
+
+
+def load_env():
+    """프로젝트 루트의 .env 를 한 번만 읽습니다."""
+    global _env_loaded
+    if not _env_loaded:
+        _timed_import("dotenv").load_dotenv(os.path.join(project_root, '.env'))
+        _env_loaded = True
 
 
+def get_api_key() -> str:
+    global GEMINI_API_KEY
+    if GEMINI_API_KEY is None:
+        load_env()
+        GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    return GEMINI_API_KEY
+
+
+def env_flag(name: str, default: bool) -> bool:
+    """.env 를 읽은 뒤 '1'/'0' 플래그를 읽습니다. import 시점에 읽으면 .env 에 둔 값이 무시됩니다."""
+    load_env()
+    value = os.getenv(name)
+    return default if value is None else value == "1"
+
+
+def get_client():
+    return _shared_engine("client", lambda: _timed_import("google.genai").Client(api_key=get_api_key()))
+
+
+def genai_types():
+    return _timed_import("google.genai.types")
+
+
+def run_sync(coro):
+    """
+    동기 코드(REPL, 평가 스크립트)에서 코루틴을 실행합니다.
+    공유 엔진의 async 클라이언트(genai aio, LangChain)는 처음 쓰인 이벤트 루프에 묶이므로,
+    턴마다 asyncio.run 으로 새 루프를 만들지 않고 프로세스 전역 루프 하나를 계속 씁니다.
+    (asyncio.Runner 는 3.11 부터라 3.10 에서도 도는 new_event_loop + run_until_complete 를 씁니다.)
+    """
+    return _shared_engine("event_loop", asyncio.new_event_loop).run_until_complete(coro)
+
 
 class ChatMemory:
-    def __init__(self):
-        self.history = []  
+    """
+    대화 기록 + 사용자 프로필. get_context_string() 은 턴마다 여러 번 불리므로
+    섹션(요약/대화/프로필)별로 렌더링 결과를 캐시하고, 메모리가 바뀔 때만 다시 만듭니다.
+    - 대화 창은 MEMORY_MAX_TURNS 턴 / 토큰 예산 안에서 유지하고, 밀려난 턴은 한 줄 요약으로 접어 둡니다.
+    - 한 메시지는 MEMORY_MAX_TURN_TOKENS 까지만 프롬프트에 넣습니다 (긴 메시지가 매 프롬프트를 키우지 않도록).
+    """
+    def __init__(self, token_budget: int = None, summary_budget: int = None):
+        self.token_budget = token_budget or MEMORY_TOKEN_BUDGET
+        self.summary_budget = summary_budget or MEMORY_SUMMARY_TOKENS
+        self.history = []           # {"role", "content", "line", "tokens"}
+        self.summary = []           # (요약 줄, 토큰 수), 오래된 순
+        self.mentioned = set()      # MEMORY_TRACKED_KEYWORDS 중 대화에 한 번이라도 나온 것
+        self.pending_slots = []     # 직전 턴에 되물은 슬롯 (다음 발화의 슬롯 추출 힌트)
+        self.last_search_query = None
         self.user_profile = {
             "current_score": None, 
             "target_score": None,  
             "target_period": None, 
-            "preferred_time": None 
+            "preferred_time": None,
+            "budget": None
         }
+        self._history_tokens = 0
+        self._summary_tokens = 0
+        self._sections = {}
+        self._context = None
+
+    def _invalidate(self, *sections: str):
+        for section in sections:
+            self._sections.pop(section, None)
+        self._context = None
 
     def add_turn(self, role: str, content: str):
-        self.history.append({"role": role, "content": content})
-        if len(self.history) > 10:
-            self.history = self.history[-10:]
+        content = str(content)
+        line = f"{role}: {truncate_to_tokens(content, MEMORY_MAX_TURN_TOKENS)}\n"
+        tokens = estimate_tokens(line)
+        self.history.append({"role": role, "content": content, "line": line, "tokens": tokens})
+        self._history_tokens += tokens
+        self.mentioned.update(k for k in MEMORY_TRACKED_KEYWORDS if k in content)
+        self._invalidate("history")
+
+        # 요약 예산을 뺀 나머지를 대화 창에 씁니다. 가장 최근 턴 하나는 예산을 넘어도 남깁니다.
+        window_budget = self.token_budget - self.summary_budget
+        while len(self.history) > 1 and (len(self.history) > MEMORY_MAX_TURNS or self._history_tokens > window_budget):
+            oldest = self.history.pop(0)
+            self._history_tokens -= oldest["tokens"]
+            self._fold_into_summary(oldest)
+
+    def _fold_into_summary(self, msg: Dict):
+        """
+        창에서 밀려난 사용자 턴을 앞부분만 남긴 한 줄로 요약에 붙이고, 요약 예산을 넘으면 가장 오래된 줄부터 버립니다.
+        상담원 답변은 검색 결과에서 다시 만들어지므로 요약에 남기지 않습니다.
+        """
+        if msg["role"] != "user":
+            return
+        text = " ".join(msg["content"].split())
+        line = f"- {msg['role']}: {truncate_to_tokens(text, MEMORY_SUMMARY_LINE_TOKENS)}\n"
+        tokens = estimate_tokens(line)
+        self.summary.append((line, tokens))
+        self._summary_tokens += tokens
+        while self.summary and self._summary_tokens > self.summary_budget:
+            _, dropped = self.summary.pop(0)
+            self._summary_tokens -= dropped
+        self._invalidate("summary")
 
     def update_profile(self, new_slots: Dict):
+        changed = False
         for k, v in new_slots.items():
-            if v is not None and v != "":
+            if v is not None and v != "" and self.user_profile.get(k) != v:
                 self.user_profile[k] = v
+                changed = True
+                self.mentioned.update(word for word in MEMORY_TRACKED_KEYWORDS if word in str(v))
+        if changed:
+            self._invalidate("profile")
+
+    def mentions(self, keyword: str) -> bool:
+        """MEMORY_TRACKED_KEYWORDS 의 키워드가 대화/프로필에 나온 적 있는지 (요약으로 밀려난 턴 포함)"""
+        return keyword in self.mentioned
+
+    def approx_bytes(self) -> int:
+        """세션 저장소 메모리 상한 계산용 추정 크기"""
+        size = sum(len(m['content'].encode('utf-8')) + len(m['line'].encode('utf-8')) + 96 for m in self.history)
+        size += sum(len(line.encode('utf-8')) + 64 for line, _ in self.summary)
+        size += sum(len(str(v).encode('utf-8')) for v in self.user_profile.values() if v)
+        return size + 256
+
+    def _render(self, section: str) -> str:
+        rendered = self._sections.get(section)
+        if rendered is not None:
+            return rendered
+        if section == "summary":
+            rendered = "--- [Earlier Conversation (Summary)] ---\n" + "".join(line for line, _ in self.summary) + "\n" if self.summary else ""
+        elif section == "history":
+            rendered = "--- [Conversation History] ---\n" + "".join(m["line"] for m in self.history)
+        else:
+            rendered = "\n--- [User Profile (Known Info)] ---\n" + "".join(
+                f"- {k}: {v if v else '(Unknown)'}\n" for k, v in self.user_profile.items()
+            )
+        self._sections[section] = rendered
+        return rendered
 
     def get_context_string(self) -> str:
-        context = "--- [Conversation History] ---\n"
-        for msg in self.history:
-            context += f"{msg['role']}: {msg['content']}\n"
-        
-        context += "\n--- [User Profile (Known Info)] ---\n"
-        for k, v in self.user_profile.items():
-            val = v if v else "(Unknown)"
-            context += f"- {k}: {val}\n"
-        return context
+        if self._context is None:
+            self._context = self._render("summary") + self._render("history") + self._render("profile")
+        return self._context
+
+    def context_tokens(self) -> int:
+        return estimate_tokens(self.get_context_string())
+
+
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """estimate_tokens 기준으로 max_tokens 를 넘으면 뒷부분을 잘라 '…' 를 붙입니다."""
+    max_chars = max_tokens * 2
+    return text if len(text) <= max_chars else text[:max_chars] + "…"
+
 
+def extract_noun_tokens(kiwi, text: str) -> List[str]:
+    """적재 시 bm25_tokenizer 와 동일한 규칙(2글자 이상 명사)으로 토큰을 뽑습니다."""
+    tokens = []
+    if not text:
+        return tokens
+    result = kiwi.analyze(str(text))
+    for token, pos, _, _ in result[0][0]:
+        if pos.startswith('N') and len(token) > 1:
+            tokens.append(token)
+    return tokens
 
 
+class SearchResult:
+    """
+    검색 결과 한 건. distance 는 벡터 검색에서 온 경우에만 채워지고,
+    score 는 BM25 점수 또는 RRF 융합 점수입니다.
+    """
+    __slots__ = ("id", "document", "metadata", "distance", "score")
+
+    def __init__(self, id: str, document: str, metadata: Dict, distance: float = None, score: float = None):
+        self.id = id
+        self.document = document
+        self.metadata = metadata or {}
+        self.distance = distance
+        self.score = score
+
+    @property
+    def source(self) -> str:
+        return self.metadata.get('source', 'unknown')
+
+    def __repr__(self):
+        return f"SearchResult(id={self.id!r}, distance={self.distance}, score={self.score})"
+
+
+def format_search_results(results: List[SearchResult]) -> str:
+    """프롬프트에 넣을 텍스트로 렌더링합니다."""
+    if not results:
+        return "검색 결과가 없습니다."
+    formatted_results = ""
+    for i, r in enumerate(results):
+        formatted_results += f"[Result {i+1}]\nContent: {r.document}\nSource: {r.source}\n\n"
+    return formatted_results
+
+
+def filter_relevant(results: List[SearchResult], max_distance: float = MAX_RELEVANT_DISTANCE) -> List[SearchResult]:
+    """거리가 임계값을 넘는 벡터 결과를 버립니다. 거리가 없는(키워드/구조화 필터) 결과는 유지합니다."""
+    return [r for r in results if r.distance is None or r.distance <= max_distance]
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[str]], k: int = 60) -> List[tuple]:
+    """여러 랭킹(문서 id 리스트)을 RRF 점수로 합쳐 (id, score) 내림차순으로 반환합니다."""
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+
+class BM25Index:
+    """
+    컬렉션 하나에 대한 in-process 역색인입니다.
+    적재 시 저장된 metadata['bm25_tokens'] (공백 구분 토큰)를 그대로 사용하며,
+    요청마다 Chroma에서 다시 읽지 않도록 문서 본문과 경량 메타데이터(bm25_tokens 제외)도 함께 보관합니다.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # token -> {doc_idx: tf}
+        self.doc_lens = []
+        self.ids = []
+        self.positions = {}  # doc_id -> doc_idx
+        self.documents = []
+        self.metadatas = []
+        self.avgdl = 0.0
+
+    @classmethod
+    def from_collection(cls, collection, page_size: int = 1000) -> "BM25Index":
+        index = cls()
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page['ids']:
+                break
+            for doc_id, doc, meta in zip(page['ids'], page['documents'], page['metadatas']):
+                meta = dict(meta or {})
+                tokens = str(meta.pop('bm25_tokens', '')).split()
+                index.add(doc_id, tokens, doc, meta)
+            offset += len(page['ids'])
+        index.finalize()
+        return index
+
+    def add(self, doc_id: str, tokens: List[str], document: str, metadata: Dict):
+        doc_idx = len(self.ids)
+        self.ids.append(doc_id)
+        self.positions[doc_id] = doc_idx
+        self.documents.append(document)
+        self.metadatas.append(metadata)
+        self.doc_lens.append(len(tokens))
+        for token in tokens:
+            posting = self.postings.setdefault(token, {})
+            posting[doc_idx] = posting.get(doc_idx, 0) + 1
+
+    def finalize(self):
+        self.avgdl = (sum(self.doc_lens) / len(self.doc_lens)) if self.doc_lens else 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self.postings
+
+    def get(self, doc_id: str):
+        """(document, metadata) 를 반환합니다. 색인에 없으면 None."""
+        doc_idx = self.positions.get(doc_id)
+        if doc_idx is None:
+            return None
+        return self.documents[doc_idx], self.metadatas[doc_idx]
+
+    def stats(self) -> Dict:
+        return {
+            "documents": len(self.ids),
+            "vocab_size": len(self.postings),
+            "postings": sum(len(p) for p in self.postings.values()),
+            "avg_doc_tokens": round(self.avgdl, 2),
+        }
+
+    def search(self, query_tokens: List[str], top_k: int = 10, allowed: set = None) -> List[tuple]:
+        """(doc_idx, score) 리스트를 점수 내림차순으로 반환합니다. allowed 가 주어지면 그 doc_idx 만 채점합니다."""
+        n_docs = len(self.ids)
+        if n_docs == 0 or not query_tokens:
+            return []
+
+        scores = {}
+        for token in set(query_tokens):
+            posting = self.postings.get(token)
+            if not posting:
+                continue
+            df = len(posting)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_idx, tf in posting.items():
+                if allowed is not None and doc_idx not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc_idx] / (self.avgdl or 1.0))
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+
 
 class HybridRetriever:
-    def __init__(self):
-        self.chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-        self.kiwi = Kiwi()
+    SEARCH_MODES = ("hybrid", "vector", "lexical")
+    COLLECTIONS = ("faq", "review", "timetable")
+
+    def __init__(self, mode: str = "hybrid", keyword_shortcut: bool = True, strict: bool = False):
+        if mode not in self.SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        self.chroma_client = _timed_import("chromadb").PersistentClient(path=CHROMA_DB_PATH)
+        self._kiwi = None
         self.embedding_model = 'models/text-embedding-004'
+        self.mode = mode
+        # 'hybrid' 모드에서 키워드 1~2개짜리 질의가 모두 색인에 있으면 임베딩 호출을 생략합니다.
+        self.keyword_shortcut = keyword_shortcut
+        self.query_task_type = "RETRIEVAL_QUERY"
+        self.embedding_cache = EmbeddingCache(db_path=QUERY_CACHE_PATH)
+        self._pending_embeddings = {}   # 질의 -> 진행 중인 임베딩 요청 (aembed_query 동시 호출 합치기)
+        self._search_vectors = {}       # 최근 검색 질의 -> 쿼리 임베딩 (diversify 가 재사용, 삽입 순)
+        self._search_vectors_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE)
+        # 컬렉션 핸들과 문서/메타데이터는 생성 시 한 번만 읽어두고, 요청 시에는 ANN 질의만 수행합니다.
+        self.collections = {}
+        self.bm25_indexes = {}
+        self.load_errors = {}
+        for name in self.COLLECTIONS:
+            try:
+                collection = self.chroma_client.get_collection(name)
+                index = BM25Index.from_collection(collection)
+                if len(index) == 0:
+                    raise ValueError("컬렉션이 비어 있습니다")
+                self.collections[name] = collection
+                self.bm25_indexes[name] = index
+            except Exception as e:
+                self.load_errors[name] = str(e)
+                print(f"⚠️ 컬렉션 로드 실패 ({name}): {e}")
+        if strict and self.load_errors:
+            raise RuntimeError(f"필수 컬렉션 로드 실패: {self.load_errors}")
 
-    def search(self, collection_name: str, query: str, top_k: int = 10) -> str:
-        try:
+        # 시간표는 요일/시간/가격 조건을 정확히 거를 수 있도록 열 단위 필터 색인을 따로 둡니다.
+        self.timetable_filter = None
+        self.timetable_where_ready = False
+        timetable_index = self.bm25_indexes.get("timetable")
+        if timetable_index is not None:
+            self.timetable_filter = TimetableFilterIndex.from_metadatas(timetable_index.ids, timetable_index.metadatas)
+            # 예전 적재본(타입 메타데이터 없음)은 Chroma where 대신 id 후처리로 거릅니다.
+            self.timetable_where_ready = all("start_min" in m for m in timetable_index.metadatas)
+
+    @property
+    def kiwi(self):
+        # Kiwi 모델 로드는 수백 ms 가 걸리므로 첫 질의(또는 warmup) 때 생성합니다.
+        if self._kiwi is None:
+            with _engines_lock:
+                if self._kiwi is None:
+                    start = time.perf_counter()
+                    self._kiwi = _timed_import("kiwipiepy").Kiwi()
+                    STARTUP_TIMINGS.setdefault("init kiwi", time.perf_counter() - start)
+        return self._kiwi
+
+    def health(self) -> Dict:
+        """컬렉션별 로드 여부, 문서 수, BM25 색인 크기를 반환합니다."""
+        report = {}
+        for name in self.COLLECTIONS:
+            if name in self.collections:
+                report[name] = {"loaded": True, "count": self.collections[name].count(), **self.bm25_indexes[name].stats()}
+                if name == "timetable" and self.timetable_filter is not None:
+                    report[name]["filter_index"] = self.timetable_filter.stats()
+            else:
+                report[name] = {"loaded": False, "error": self.load_errors.get(name, "")}
+        report["ok"] = not self.load_errors
+        return report
+
+    def _get_collection(self, collection_name: str):
+        collection = self.collections.get(collection_name)
+        if collection is None:
             collection = self.chroma_client.get_collection(collection_name)
-            
-            resp = client.models.embed_content(
-                model=self.embedding_model,
-                contents=query,
-                config=types.EmbedContentConfig(task_type="RETRIEVAL_QUERY")
-            )
-            query_embedding = resp.embeddings[0].values
+            self.collections[collection_name] = collection
+        return collection
+
+    def _query_tokens(self, query: str) -> List[str]:
+        tokens = extract_noun_tokens(self.kiwi, query)
+        # 태그는 '주말반'처럼 통째로 색인되어 있으므로 어절 자체도 함께 조회합니다.
+        for word in query.split():
+            word = word.strip('#.,!?')
+            if len(word) > 1:
+                tokens.append(word)
+        return tokens
+
+    def _lexical_search(self, collection_name: str, query: str, top_k: int, allowed_ids: List[str] = None) -> List[SearchResult]:
+        index = self.bm25_indexes.get(collection_name)
+        if index is None:
+            return []
+        allowed = None
+        if allowed_ids is not None:
+            allowed = {index.positions[d] for d in allowed_ids if d in index.positions}
+        hits = index.search(self._query_tokens(query), top_k, allowed=allowed)
+        return [SearchResult(index.ids[i], index.documents[i], index.metadatas[i], score=score) for i, score in hits]
+
+    def _filter_ids(self, collection_name: str, filters: Dict = None) -> List[str]:
+        """구조화 필터에 맞는 문서 id. 필터를 적용하지 않으면 None."""
+        if not filters or collection_name != "timetable" or self.timetable_filter is None:
+            return None
+        return self.timetable_filter.filter(filters)
+
+    def _exact_hits(self, collection_name: str, query: str, allowed_ids: List[str]) -> List[SearchResult]:
+        """필터 결과가 top_k 이하이면 ANN 없이 전부 반환합니다 (BM25 점수가 있는 문서를 앞에)."""
+        index = self.bm25_indexes[collection_name]
+        ranked = self._lexical_search(collection_name, query, len(allowed_ids), allowed_ids)
+        seen = {r.id for r in ranked}
+        return ranked + [SearchResult(d, *index.get(d)) for d in allowed_ids if d not in seen]
+
+    def embed_query(self, query: str) -> List[float]:
+        cached = self.embedding_cache.get(query, self.embedding_model, self.query_task_type)
+        if cached is not None:
+            return cached
+
+        resp = get_client().models.embed_content(
+            model=self.embedding_model,
+            contents=query,
+            config=genai_types().EmbedContentConfig(task_type=self.query_task_type)
+        )
+        query_embedding = resp.embeddings[0].values
+        self.embedding_cache.put(query, self.embedding_model, self.query_task_type, query_embedding)
+        return query_embedding
+
+    async def aembed_query(self, query: str) -> List[float]:
+        # 메모리 캐시만 루프에서 바로 보고, SQLite 조회는 _aembed_uncached 가 스레드에서 합니다.
+        cached = self.embedding_cache.get_memory(query, self.embedding_model, self.query_task_type)
+        if cached is not None:
+            return cached
 
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k
+        # 같은 질의를 동시에 임베딩하면(투기 검색 + 답변 캐시 조회) 디스크 조회/API 요청 하나를 같이 기다립니다.
+        # 기다리던 쪽이 취소돼도 요청은 끝까지 돌아 임베딩 캐시에 남습니다.
+        pending = self._pending_embeddings.get(query)
+        if pending is None:
+            pending = asyncio.ensure_future(self._aembed_uncached(query))
+            self._pending_embeddings[query] = pending
+            pending.add_done_callback(lambda f: self._pending_embeddings.pop(query, None))
+            pending.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return await asyncio.shield(pending)
+
+    async def _aembed_uncached(self, query: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(
+            self.executor, self.embedding_cache.get_disk, query, self.embedding_model, self.query_task_type
+        )
+        if cached is not None:
+            return cached
+
+        resp = await get_client().aio.models.embed_content(
+            model=self.embedding_model,
+            contents=query,
+            config=genai_types().EmbedContentConfig(task_type=self.query_task_type)
+        )
+        query_embedding = resp.embeddings[0].values
+        # put 은 SQLite 쓰기/커밋이므로 이벤트 루프 밖에서 실행합니다.
+        await loop.run_in_executor(
+            self.executor, self.embedding_cache.put, query, self.embedding_model, self.query_task_type, query_embedding
+        )
+        return query_embedding
+
+    def _vector_search(self, collection_name: str, query_embedding: List[float], top_k: int,
+                       filters: Dict = None, allowed_ids: List[str] = None) -> List[SearchResult]:
+        collection = self._get_collection(collection_name)
+        index = self.bm25_indexes.get(collection_name)
+
+        query_kwargs = {}
+        n_results = top_k
+        if allowed_ids is not None:
+            if self.timetable_where_ready:
+                # Chroma where 로 후보를 먼저 줄인 뒤 ANN 을 수행합니다.
+                query_kwargs["where"] = build_where(filters)
+            else:
+                n_results = min(len(index) if index is not None else top_k * 4, top_k * 4)
+
+        # 색인에 올라온 문서는 메모리에서 본문을 가져오므로 id만 받습니다.
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            include=["distances"] if index is not None else ["documents", "metadatas", "distances"],
+            **query_kwargs
+        )
+        if not results['ids'] or not results['ids'][0]:
+            return []
+
+        allowed = set(allowed_ids) if allowed_ids is not None else None
+        hits = []
+        distances = (results.get('distances') or [[]])[0]
+        for i, doc_id in enumerate(results['ids'][0]):
+            if allowed is not None and doc_id not in allowed:
+                continue
+            stored = index.get(doc_id) if index is not None else None
+            if stored is None:
+                if not results.get('documents'):
+                    # 기동 이후 추가된 문서: 해당 id만 다시 읽어옵니다.
+                    fetched = collection.get(ids=[doc_id], include=["documents", "metadatas"])
+                    stored = (fetched['documents'][0], fetched['metadatas'][0] or {})
+                else:
+                    stored = (results['documents'][0][i], results['metadatas'][0][i] or {})
+            distance = distances[i] if i < len(distances) else None
+            hits.append(SearchResult(doc_id, stored[0], stored[1], distance=distance))
+        return hits[:top_k]
+
+    def _is_keyword_query(self, collection_name: str, query: str) -> bool:
+        """
+        1~2 어절 질의의 명사가 모두 색인에 있으면 키워드 질의로 봅니다. '되나요' 같은 용언/어미 어절은
+        색인되지 않으므로 보지 않고, 명사가 없을 때만 태그처럼 색인된 어절('주말반')로 판단합니다.
+        """
+        index = self.bm25_indexes.get(collection_name)
+        words = query.split()
+        if index is None or not words or len(words) > 2:
+            return False
+        tokens = extract_noun_tokens(self.kiwi, query)
+        if not tokens:
+            tokens = [w for w in (word.strip('#.,!?') for word in words) if len(w) > 1]
+        return bool(tokens) and all(t in index for t in tokens)
+
+    def _resolve_mode(self, collection_name: str, query: str, mode: str = None,
+                      top_k: int = 10, allowed_ids: List[str] = None) -> str:
+        mode = mode or self.mode
+        if allowed_ids is not None and len(allowed_ids) <= top_k:
+            return "exact"
+        if mode == "hybrid" and self.keyword_shortcut and self._is_keyword_query(collection_name, query):
+            return "lexical"
+        return mode
+
+    def search(self, collection_name: str, query: str, top_k: int = 10, mode: str = None,
+               filters: Dict = None) -> List[SearchResult]:
+        """
+        관련도 순 SearchResult 리스트를 반환합니다. 오류 시 빈 리스트.
+        filters: timetable 구조화 조건 (timetable_filter.build_filters 결과)
+        """
+        try:
+            allowed_ids = self._filter_ids(collection_name, filters)
+            mode = self._resolve_mode(collection_name, query, mode, top_k, allowed_ids)
+            query_embedding = self.embed_query(query) if mode in ("hybrid", "vector") else None
+            self._remember_search_vector(query, query_embedding)
+            return self._search_with_embedding(collection_name, query, top_k, mode, query_embedding, filters, allowed_ids)
+        except Exception as e:
+            print(f"검색 중 오류 발생: {str(e)}")
+            return []
+
+    async def asearch(self, collection_name: str, query: str, top_k: int = 10, mode: str = None,
+                      filters: Dict = None) -> List[SearchResult]:
+        """search 의 비동기 버전. 임베딩은 async 클라이언트로, Kiwi/Chroma 는 스레드 풀에서 실행합니다."""
+        loop = asyncio.get_running_loop()
+        try:
+            allowed_ids = self._filter_ids(collection_name, filters)
+            mode = await loop.run_in_executor(
+                self.executor, self._resolve_mode, collection_name, query, mode, top_k, allowed_ids
+            )
+            query_embedding = await self.aembed_query(query) if mode in ("hybrid", "vector") else None
+            self._remember_search_vector(query, query_embedding)
+            return await loop.run_in_executor(
+                self.executor, self._search_with_embedding,
+                collection_name, query, top_k, mode, query_embedding, filters, allowed_ids
             )
+        except Exception as e:
+            print(f"검색 중 오류 발생: {str(e)}")
+            return []
 
-            formatted_results = ""
-            if not results['documents'] or not results['documents'][0]:
-                return "검색 결과가 없습니다."
+    def _search_with_embedding(self, collection_name: str, query: str, top_k: int, mode: str,
+                               query_embedding: List[float] = None, filters: Dict = None,
+                               allowed_ids: List[str] = None) -> List[SearchResult]:
+        if mode == "exact":
+            return self._exact_hits(collection_name, query, allowed_ids)
 
-            for i, doc in enumerate(results['documents'][0]):
-                meta = results['metadatas'][0][i]
-                formatted_results += f"[Result {i+1}]\nContent: {doc}\nSource: {meta.get('source', 'unknown')}\n\n"
-            
-            return formatted_results
+        lexical_hits = self._lexical_search(collection_name, query, top_k, allowed_ids) if mode != "vector" else []
+        vector_hits = self._vector_search(collection_name, query_embedding, top_k, filters, allowed_ids) if mode != "lexical" else []
+
+        if mode != "hybrid":
+            return lexical_hits or vector_hits
+
+        # 벡터 결과를 나중에 넣어 거리 정보가 있는 객체가 남도록 합니다.
+        by_id = {r.id: r for r in lexical_hits + vector_hits}
+        fused = reciprocal_rank_fusion([[r.id for r in vector_hits], [r.id for r in lexical_hits]])
+        hits = []
+        for doc_id, score in fused[:top_k]:
+            r = by_id[doc_id]
+            hits.append(SearchResult(r.id, r.document, r.metadata, distance=r.distance, score=score))
+        return hits
 
+
+
+    def _remember_search_vector(self, query: str, query_embedding: Optional[List[float]]):
+        if query_embedding is None:
+            return
+        with self._search_vectors_lock:
+            self._search_vectors.pop(query, None)
+            self._search_vectors[query] = query_embedding
+            while len(self._search_vectors) > SEARCH_VECTOR_MEMO_SIZE:
+                self._search_vectors.pop(next(iter(self._search_vectors)), None)
+
+    def fetch_embeddings(self, collection_name: str, ids: List[str]) -> Dict[str, List[float]]:
+        """Chroma 에 저장된 문서 임베딩 (없거나 실패하면 빈 dict)"""
+        if not ids:
+            return {}
+        try:
+            fetched = self._get_collection(collection_name).get(ids=ids, include=["embeddings"])
         except Exception as e:
-            return f"검색 중 오류 발생: {str(e)}"
+            print(f"⚠️ 문서 임베딩 조회 실패 ({collection_name}): {e}")
+            return {}
+        embeddings = fetched.get('embeddings')
+        if embeddings is None:
+            return {}
+        return {doc_id: vec for doc_id, vec in zip(fetched['ids'], embeddings) if vec is not None}
+
+    def diversify(self, collection_name: str, query: str, results: List[SearchResult], top_n: int,
+                  mmr_lambda: float = 0.7) -> List[SearchResult]:
+        """
+        중복을 접고 MMR 로 top_n 개를 고릅니다 (블로킹, 스레드 풀에서 호출).
+        관련도는 검색 때 계산한 쿼리 임베딩과 문서 임베딩의 코사인이며, 쿼리 임베딩이 없으면(키워드 검색 등) 검색 순위를 씁니다.
+        """
+        if len(results) <= 1:
+            return results
+        by_id = {r.id: r for r in results}
+        ids = list(by_id)
+        embeddings = self.fetch_embeddings(collection_name, ids)
+        query_embedding = self._search_vectors.get(query) if query else None
+        selected = diversify(ids, {d: by_id[d].document for d in ids}, embeddings, query_embedding,
+                             top_n, mmr_lambda, NEAR_DUPLICATE_SIMILARITY)
+        return [by_id[d] for d in selected]
 
 
+def compress_results(results: List[SearchResult], collection_name: str, max_chars: int) -> List[SearchResult]:
+    """전체 max_chars 를 문서 수로 나눠 각 본문을 압축합니다. 앞 문서가 남긴 예산은 뒤 문서로 넘어갑니다."""
+    compressed = []
+    remaining = max_chars
+    for i, r in enumerate(results):
+        share = remaining // (len(results) - i)
+        document = compress_document(r.document, collection_name, share)
+        remaining -= len(document)
+        compressed.append(SearchResult(r.id, document, r.metadata, distance=r.distance, score=r.score))
+    return compressed
 
 
 ROUTER_SYSTEM_PROMPT = """
@@ -109,7 +792,9 @@ Analyze the user's input based on the conversation history and user profile.
    - CHIT_CHAT: Greetings, small talk, insults, or off-topic.
 
 2. Slot Filling (Crucial for TIMETABLE):
-   - Extract info for: current_score, target_score, target_period, preferred_time.
+   - Extract info for: current_score, target_score, target_period, preferred_time, budget.
+   - preferred_time: keep the user's day/time words (e.g. "평일 저녁", "주말 오전", "19시 이후").
+   - budget: the user's maximum tuition if mentioned (e.g. "50만원").
    - If user provides info, fill 'slots_to_update'.
    - Identify 'missing_slots' ONLY IF intent is TIMETABLE.
 
@@ -121,20 +806,65 @@ Analyze the user's input based on the conversation history and user profile.
       "current_score": "...",
       "target_score": "...",
       "target_period": "...",
-      "preferred_time": "..."
+      "preferred_time": "...",
+      "budget": "..."
   },
   "missing_slots": ["current_score", "target_score", ...] (List missing critical info),
   "search_query": "Refined search query for DB"
 }
 """
 
+ROUTER_INTENT_PROMPT = """
+You are the 'Intent Classifier' for an IELTS Academy Chatbot.
+Classify the user's input using the conversation history. Slots are extracted locally; only fill the unknown slots listed below, if any.
+
+Intents:
+   - TIMETABLE: Questions about class schedules, curriculum, prices.
+   - REVIEW: Asking for success stories, student reviews, difficulty concerns.
+   - FAQ: Administrative questions (refund, location, parking, login).
+   - CHIT_CHAT: Greetings, small talk, insults, or off-topic.
+
+Output Format (JSON Only):
+{"intent": "TIMETABLE" | "REVIEW" | "FAQ" | "CHIT_CHAT", "reason": "Short explanation", "slots_to_update": {}, "search_query": "Refined search query for DB"}
+"""
+
+# intent_only 프롬프트에 붙입니다. 로컬 추출기가 못 채운 슬롯은 LLM 이 계속 채웁니다.
+ROUTER_OPEN_SLOTS_PROMPT = """
+Slot Filling (only these slots are still unknown: {open_slots}):
+   - If the user's input gives any of them, put them in 'slots_to_update'. Leave every other slot out.
+   - preferred_time: keep the user's day/time words (e.g. "평일 저녁", "주말 오전", "19시 이후").
+   - budget: the user's maximum tuition if mentioned (e.g. "50만원").
+"""
+
 class SemanticRouter:
-    def __init__(self):
+    def __init__(self, pre_router: LocalPreRouter = None):
         self.model_name = MODEL_NAME
+        # 확신할 수 있는 입력은 로컬에서 분류하고, 나머지만 LLM 으로 넘깁니다.
+        self.pre_router = pre_router
 
     def analyze(self, user_input: str, context: str) -> Dict:
-        prompt = f"""
-        {ROUTER_SYSTEM_PROMPT}
+        return self.analyze_local(user_input) or self.analyze_llm(user_input, context)
+
+    def analyze_local(self, user_input: str) -> Dict:
+        if self.pre_router is None:
+            return None
+        return self.pre_router.classify(user_input)
+
+    async def aanalyze_local(self, user_input: str, executor=None) -> Dict:
+        """centroid 단계는 동기 embed_query(네트워크 호출)를 쓰므로, 켜져 있으면 이벤트 루프 밖에서 분류합니다."""
+        if self.pre_router is None or not self.pre_router.config["use_centroid"]:
+            return self.analyze_local(user_input)
+        return await asyncio.get_running_loop().run_in_executor(executor, self.analyze_local, user_input)
+
+    def _build_prompt(self, user_input: str, context: str, intent_only: bool = False,
+                      open_slots: Optional[List[str]] = None) -> str:
+        instructions = ROUTER_SYSTEM_PROMPT
+        if intent_only:
+            instructions = ROUTER_INTENT_PROMPT
+            if open_slots:
+                instructions += ROUTER_OPEN_SLOTS_PROMPT.format(open_slots=", ".join(open_slots))
+        return f"""
+        {instructions}
 
         [Context]
         {context}
@@ -144,19 +874,43 @@ class SemanticRouter:
         
         Generate JSON response:
         """
-        
+
+    def _error_result(self, user_input: str) -> Dict:
+        return {"intent": "CHIT_CHAT", "reason": "Error", "slots_to_update": {}, "missing_slots": [], "search_query": user_input}
+
+    def analyze_llm(self, user_input: str, context: str, intent_only: bool = False,
+                    open_slots: Optional[List[str]] = None) -> Dict:
+        try:
+            response = get_client().models.generate_content(
+                model=self.model_name,
+                contents=self._build_prompt(user_input, context, intent_only, open_slots),
+                config=genai_types().GenerateContentConfig(
+                    response_mime_type="application/json"
+                )
+            )
+            return json.loads(response.text)
+        except Exception as e:
+            print(f"Router Error: {e}")
+            return self._error_result(user_input)
+
+    async def aanalyze_llm(self, user_input: str, context: str, intent_only: bool = False,
+                           open_slots: Optional[List[str]] = None) -> Dict:
+        """
+        intent_only=True 면 슬롯 추출 지시를 뺀 짧은 프롬프트를 씁니다 (슬롯은 로컬 추출기가 채운 경우).
+        open_slots 에 아직 비어 있는 슬롯을 넘기면 그 슬롯만 채우도록 지시를 덧붙입니다.
+        """
         try:
-            response = client.models.generate_content(
+            response = await get_client().aio.models.generate_content(
                 model=self.model_name,
-                contents=prompt,
-                config=types.GenerateContentConfig(
+                contents=self._build_prompt(user_input, context, intent_only, open_slots),
+                config=genai_types().GenerateContentConfig(
                     response_mime_type="application/json"
                 )
             )
             return json.loads(response.text)
         except Exception as e:
             print(f"Router Error: {e}")
-            return {"intent": "CHIT_CHAT", "reason": "Error", "slots_to_update": {}, "missing_slots": [], "search_query": user_input}
+            return self._error_result(user_input)
 
 
 
@@ -191,34 +945,180 @@ CONSULTANT_SYSTEM_PROMPT = """
 아래 제공된 정보를 기반으로 사실에 입각하여 답변하십시오.
 """
 
+def get_retriever() -> HybridRetriever:
+    return _shared_engine("retriever", HybridRetriever)
+
+
+def get_router() -> SemanticRouter:
+    return _shared_engine("router", lambda: SemanticRouter(
+        pre_router=LocalPreRouter(embed_fn=get_retriever().embed_query, config=PRE_ROUTER_CONFIG)
+    ))
+
+
+def get_llm():
+    return _shared_engine("llm", lambda: _timed_import("langchain_google_genai").ChatGoogleGenerativeAI(
+        model=MODEL_NAME,
+        google_api_key=get_api_key(),
+        temperature=0
+    ))
+
+
+def warmup(background: bool = True):
+    """
+    클라이언트, 컬렉션/색인, Kiwi 모델, LLM 을 미리 로드합니다.
+    background=True 면 데몬 스레드에서 실행하고 그 스레드를 반환합니다.
+    """
+    def _run():
+        try:
+            get_client()
+            get_retriever().kiwi
+            get_router()
+            get_llm()
+            _timed_import("langchain.schema")
+        except Exception as e:
+            print(f"⚠️ Warmup 실패: {e}")
+
+    if not background:
+        _run()
+        return None
+    thread = threading.Thread(target=_run, name="rag-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_report() -> str:
+    lines = ["--- [Startup Timings] ---"]
+    for name, seconds in sorted(STARTUP_TIMINGS.items(), key=lambda x: x[1], reverse=True):
+        lines.append(f"{seconds * 1000:9.1f} ms  {name}")
+    return "\n".join(lines)
+
+
 class ConsultantAgent:
-    def __init__(self):
-        self.memory = ChatMemory()
-        self.router = SemanticRouter()
-        self.retriever = HybridRetriever()
-        
-        
-        self.llm = ChatGoogleGenerativeAI(
-            model=MODEL_NAME,
-            google_api_key=GEMINI_API_KEY,
-            temperature=0
+    """
+    무거운 엔진은 프로세스 전역 싱글톤을 공유하고, 사용자별 상태(ChatMemory)만 세션 저장소에 둡니다.
+    에이전트 생성 비용은 세션 저장소 하나를 만드는 정도입니다.
+    """
+    def __init__(self, session_store: SessionStore = None, use_answer_cache: Optional[bool] = None):
+        """use_answer_cache 가 None 이면 ANSWER_CACHE 플래그를 따릅니다 (평가 스크립트는 False 로 끕니다)."""
+        self.retriever = get_retriever()
+        self.router = get_router()
+        self.llm = get_llm()
+        self.sessions = session_store or SessionStore(
+            factory=ChatMemory, size_fn=ChatMemory.approx_bytes, **SESSION_STORE_CONFIG
         )
 
-    def run(self, user_input: str) -> str:
-        self.memory.add_turn("user", user_input)
-        context = self.memory.get_context_string()
+        self.speculation_stats = {"launched": 0, "hits": 0, "discarded": 0}
+        self.slot_extractor = SlotExtractor(kiwi_fn=lambda: self.retriever.kiwi)
+        self.slot_stats = {"router_skipped": 0, "router_intent_only": 0, "router_full": 0}
+        if use_answer_cache is None:
+            use_answer_cache = env_flag("ANSWER_CACHE", ANSWER_CACHE_DEFAULT)
+        self.answer_cache = SemanticAnswerCache(**ANSWER_CACHE_CONFIG) if use_answer_cache else None
+        self.ask_more_llm_polish = env_flag("ASK_MORE_LLM_POLISH", ASK_MORE_LLM_POLISH_DEFAULT)
+        self.compression_stats = {"turns": 0, "docs_before": 0, "docs_after": 0, "chars_before": 0, "chars_after": 0}
+
+    def get_memory(self, session_id: str) -> ChatMemory:
+        return self.sessions.get(session_id).state
+
+    @property
+    def memory(self) -> ChatMemory:
+        return self.get_memory(DEFAULT_SESSION_ID)
+
+    async def _speculative_search(self, query: str) -> Dict[str, List[SearchResult]]:
+        """
+        실패하면 로그만 남기고 빈 dict 를 반환합니다. 호출부는 일반 검색 경로로 넘어가고,
+        취소된 투기 작업이 예외를 품은 채 버려지지도 않습니다.
+        """
+        try:
+            # 임베딩을 먼저 캐시에 올려 두면 컬렉션별 검색은 Chroma 질의만 병렬로 수행합니다.
+            await self.retriever.aembed_query(query)
+            results = await asyncio.gather(*(self.retriever.asearch(name, query, top_k=10) for name in SPECULATIVE_COLLECTIONS))
+        except Exception as e:
+            print(f"⚠️ 투기 검색 실패, 일반 검색으로 진행: {e}")
+            return {}
+        return dict(zip(SPECULATIVE_COLLECTIONS, results))
+
+    def speculation_hit_rate(self) -> float:
+        launched = self.speculation_stats["launched"]
+        return self.speculation_stats["hits"] / launched if launched else 0.0
+
+    def run(self, user_input: str, session_id: str = DEFAULT_SESSION_ID, with_context: bool = False):
+        """arun 의 동기 래퍼 (REPL, 평가 스크립트용). 모든 턴이 같은 이벤트 루프에서 돕니다 (run_sync)."""
+        return run_sync(self.arun(user_input, session_id, with_context=with_context))
+
+    async def arun(self, user_input: str, session_id: str = DEFAULT_SESSION_ID, with_context: bool = False):
+        """
+        답변 문자열을 반환합니다.
+        with_context=True 면 (답변, 프롬프트에 들어간 문서 본문 리스트) 튜플을 반환합니다 (RAGAS 평가용).
+        """
+        session = self.sessions.get(session_id)
+        async with session.lock:
+            try:
+                final_response, used_results = await self._run_turn(session.state, user_input)
+            finally:
+                # 이번 턴이 추가한 대화까지 크기에 반영합니다 (get 은 턴 시작 전 크기만 봅니다).
+                self.sessions.release(session)
+        if with_context:
+            return final_response, [r.document for r in used_results]
+        return final_response
+
+    async def _run_turn(self, memory: ChatMemory, user_input: str):
+        memory.add_turn("user", user_input)
+        # 점수/기간/시간/예산은 로컬 추출기로 먼저 뽑고, 프로필에는 라우팅 결과가 TIMETABLE 일 때만 씁니다
+        # ('8월까지 환불 되나요?' 같은 FAQ 의 날짜가 목표 기간으로 남지 않게).
+        # Kiwi 지연 로드/분석이 이벤트 루프를 막지 않도록 스레드풀에서 돌립니다.
+        loop = asyncio.get_running_loop()
+        extraction = await loop.run_in_executor(
+            self.retriever.executor, self.slot_extractor.extract, user_input, memory.pending_slots
+        )
+        local_slots = extraction.confident_slots(SLOT_CONFIDENCE_THRESHOLD)
+        context = memory.get_context_string()
 
         
-        analysis = self.router.analyze(user_input, context)
+        speculation = None
+        speculative_query = f"{user_input} {self._profile_to_string(memory)}".strip()
+        analysis = await self.router.aanalyze_local(user_input, self.retriever.executor)
+        if analysis is None and self._is_slot_reply(memory, user_input, extraction, local_slots):
+            analysis = self._slot_reply_result(memory, user_input)
+
+        # 답변 캐시용 질의 임베딩은 투기 검색/라우터와 동시에 받습니다. 캐시를 쓰는 첫 턴은 프로필이 비어 있어
+        # speculative_query 가 원문 질의와 같으므로 투기 검색과 같은 임베딩 요청 하나를 나눠 씁니다.
+        query_embedding = None
+        if self._answer_cache_applies(memory, analysis, local_slots):
+            query_embedding = asyncio.create_task(self._embed_for_cache(speculative_query))
+        if analysis is None:
+            # 라우터 LLM 호출과 동시에 원문 질의로 유력 컬렉션을 미리 검색합니다.
+            speculation = asyncio.create_task(self._speculative_search(speculative_query))
+            self.speculation_stats["launched"] += 1
+            intent_only = bool(local_slots) and extraction.min_confidence() >= SLOT_CONFIDENCE_THRESHOLD
+            self.slot_stats["router_intent_only" if intent_only else "router_full"] += 1
+            # 로컬에서 못 채운 슬롯은 짧은 프롬프트에서도 LLM 이 채웁니다 ('지금 5.5인데 7 목표로' 의 목표 점수 등).
+            open_slots = [slot for slot, value in memory.user_profile.items() if not value and slot not in local_slots]
+            analysis = await self.router.aanalyze_llm(user_input, context, intent_only=intent_only, open_slots=open_slots)
         intent = analysis.get("intent")
-        slots = analysis.get("slots_to_update", {})
+        slots = analysis.get("slots_to_update") or {}
         missing = analysis.get("missing_slots", [])
         search_query = analysis.get("search_query")
+        if search_query:
+            memory.last_search_query = search_query
+
+        print(f"🧐 [Analysis] Intent: {intent} | Missing: {missing} | Local slots: {local_slots}")
+
+        if intent == "TIMETABLE":
+            memory.update_profile(local_slots)
+        memory.update_profile(slots)
+        memory.pending_slots = []
 
-        print(f"🧐 [Analysis] Intent: {intent} | Missing: {missing}")
+        cache_vector, cached = await self._lookup_answer(memory, intent, query_embedding)
+        if cached is not None:
+            print(f"💾 [Answer Cache] 적중 ({cached.intent}, 적중 {cached.hits}회째)")
+            if speculation is not None:
+                speculation.cancel()
+                self.speculation_stats["discarded"] += 1
+            memory.add_turn("assistant", cached.answer)
+            return cached.answer, [SearchResult(doc_id, document, {}) for doc_id, document in cached.contexts]
 
-        self.memory.update_profile(slots)
         final_response = ""
+        used_results = []
 
         
         
@@ -240,70 +1140,173 @@ class ConsultantAgent:
             - 보안 관련 질문은 "권한이 없습니다"라고 일축할 것.
             """
     
-            response = self.llm.invoke([
-                SystemMessage(content=CONSULTANT_SYSTEM_PROMPT),
-                HumanMessage(content=steering_prompt)
+            schema = _timed_import("langchain.schema")
+            response = await self.llm.ainvoke([
+                schema.SystemMessage(content=CONSULTANT_SYSTEM_PROMPT),
+                schema.HumanMessage(content=steering_prompt)
             ])
             
             final_response = response.content
 
         
-        elif intent == "TIMETABLE" and (not self.memory.user_profile.get("preferred_time") or not self.memory.user_profile.get("current_score")):
+        elif intent == "TIMETABLE" and any(not memory.user_profile.get(slot) for slot in REQUIRED_TIMETABLE_SLOTS):
              print(f"🛑 필수 정보 누락! 되묻기 실행")
-             final_response = self._generate_ask_more(missing)
+             final_response = await self._generate_ask_more(memory, missing)
+             memory.pending_slots = slots_to_ask(missing, memory.user_profile)
         
         
         else:
-            collection_map = {
-                "TIMETABLE": "timetable",
-                "REVIEW": "review",
-                "FAQ": "faq"
-            }
-            collection_name = collection_map.get(intent, "faq")
+            collection_name = COLLECTION_MAP.get(intent, "faq")
             
-            enhanced_query = f"{search_query} {self._profile_to_string()}"
-            search_results = self.retriever.search(collection_name, enhanced_query, top_k=10)
+            search_results = None
+            if speculation is not None and collection_name in SPECULATIVE_COLLECTIONS:
+                search_results = (await speculation).get(collection_name)
+                speculation = None
+                if search_results is not None:
+                    self.speculation_stats["hits"] += 1
+                    used_query = speculative_query
+
+            if search_results is None:
+                used_query = f"{search_query} {self._profile_to_string(memory)}"
+                filters = build_filters(memory.user_profile) if collection_name == "timetable" else None
+                search_results = await self.retriever.asearch(collection_name, used_query, top_k=10, filters=filters)
             
-            if "검색 결과가 없습니다" in search_results:
-                fallback_query = "아이엘츠 온라인 강의 인강 추천"
-                search_results = self.retriever.search("timetable", fallback_query)
-                search_results = f"[알림: 원하시는 조건의 강의가 없어 온라인 강의 정보를 가져왔습니다.]\n{search_results}"
+            # 거리 임계값을 넘는 문서는 버리고, 남는 것이 없으면 온라인 강의로 대안 검색합니다.
+            used_results = filter_relevant(search_results)
+            notice = ""
+            if not used_results:
+                collection_name, used_query = "timetable", FALLBACK_QUERY
+                used_results = await self.retriever.asearch(collection_name, used_query)
+                notice = "[알림: 원하시는 조건의 강의가 없어 온라인 강의 정보를 가져왔습니다.]\n"
+            used_results = await self._compress_results(collection_name, used_query, used_results)
+
+            final_response = await self._generate_final_answer(memory, user_input, notice + format_search_results(used_results))
+            if cache_vector is not None and not notice and intent in ANSWER_CACHE_INTENTS:
+                self.answer_cache.put(cache_vector, intent, self._answer_cache_key(memory, intent), final_response,
+                                      [(r.id, r.document) for r in used_results], collection_name)
 
-            final_response = self._generate_final_answer(user_input, search_results)
+        if speculation is not None:
+            speculation.cancel()
+            self.speculation_stats["discarded"] += 1
 
         
-        self.memory.add_turn("assistant", final_response)
-        return final_response
+        memory.add_turn("assistant", final_response)
+        return final_response, used_results
+
+    def _is_slot_reply(self, memory: ChatMemory, user_input: str, extraction, local_slots: Dict) -> bool:
+        """직전 턴에 되물었고, 이번 발화가 짧으며 대부분 되물은 슬롯에 대한 답인지"""
+        return (bool(memory.pending_slots) and bool(local_slots)
+                and any(slot in local_slots for slot in memory.pending_slots)
+                and len(user_input.strip()) <= SLOT_REPLY_MAX_CHARS
+                and extraction.coverage >= SLOT_REPLY_MIN_COVERAGE)
+
+    def _slot_reply_result(self, memory: ChatMemory, user_input: str) -> Dict:
+        """되묻기에 대한 답은 라우터 LLM 없이 이전 TIMETABLE 질의를 이어갑니다."""
+        self.slot_stats["router_skipped"] += 1
+        return {
+            "intent": "TIMETABLE",
+            "reason": "local:slot-reply",
+            "slots_to_update": {},
+            "missing_slots": [],
+            "search_query": memory.last_search_query or user_input,
+            "router": "slots",
+        }
+
+    def _answer_cache_key(self, memory: ChatMemory, intent: str) -> Tuple:
+        fields = ANSWER_CACHE_INTENTS[intent]
+        # '직장인' 같은 답변 제약 키워드도 답을 바꾸므로 키에 넣습니다.
+        return tuple(str(memory.user_profile.get(f) or "") for f in fields) + tuple(sorted(memory.mentioned))
+
+    def _answer_cache_applies(self, memory: ChatMemory, analysis: Optional[Dict], local_slots: Dict) -> bool:
+        """
+        답변 캐시는 첫 턴(이전 대화/요약 없음)에만 씁니다. 답변 생성 프롬프트에 대화 기록이 들어가므로,
+        기록을 보고 만든 답을 다른 세션에 주거나 기록 없이 만든 답을 이어지는 대화에 주지 않습니다.
+        로컬에서 캐시 대상이 아닌 의도로 확정됐거나 슬롯이 담긴 발화(시간표 상담일 가능성)도 제외합니다.
+        """
+        if self.answer_cache is None or memory.pending_slots or local_slots:
+            return False
+        if len(memory.history) > 1 or memory.summary:
+            return False
+        return analysis is None or analysis.get("intent") in ANSWER_CACHE_INTENTS
+
+    async def _embed_for_cache(self, query: str) -> Optional[List[float]]:
+        try:
+            return await self.retriever.aembed_query(query)
+        except Exception as e:
+            print(f"⚠️ 답변 캐시 조회용 임베딩 실패: {e}")
+            return None
+
+    async def _lookup_answer(self, memory: ChatMemory, intent: str,
+                             query_embedding: Optional[asyncio.Task]) -> Tuple[Optional[List[float]], Optional[CachedAnswer]]:
+        """라우팅된 의도의 버킷에서 답변 캐시를 찾습니다. (질의 임베딩, 적중 항목) 을 반환합니다."""
+        if query_embedding is None:
+            return None, None
+        if intent not in ANSWER_CACHE_INTENTS:
+            query_embedding.cancel()
+            return None, None
+        vector = await query_embedding
+        if vector is None:
+            return None, None
+        return vector, self.answer_cache.lookup(vector, intent, self._answer_cache_key(memory, intent))
+
+    async def _compress_results(self, collection_name: str, query: str, results: List[SearchResult]) -> List[SearchResult]:
+        """MMR/중복 제거로 문서 수를 줄이고 본문을 컬렉션별 예산으로 압축합니다 (CONTEXT_BUDGETS)."""
+        budget = CONTEXT_BUDGETS.get(collection_name)
+        if budget is None or not results:
+            return results
+        loop = asyncio.get_running_loop()
+        selected = await loop.run_in_executor(
+            self.retriever.executor, self.retriever.diversify,
+            collection_name, query, results, budget["top_n"], budget["mmr_lambda"]
+        )
+        compressed = compress_results(selected, collection_name, budget["max_chars"])
+        self.compression_stats["turns"] += 1
+        self.compression_stats["docs_before"] += len(results)
+        self.compression_stats["docs_after"] += len(compressed)
+        self.compression_stats["chars_before"] += sum(len(r.document) for r in results)
+        self.compression_stats["chars_after"] += sum(len(r.document) for r in compressed)
+        return compressed
 
-    def _profile_to_string(self):
-        p = self.memory.user_profile
+    def _profile_to_string(self, memory: ChatMemory):
+        p = memory.user_profile
         text = ""
         if p['preferred_time']: text += f"{p['preferred_time']} "
         if p['target_score']: text += f"목표{p['target_score']} "
         return text
 
-    def _generate_ask_more(self, missing_slots):
+    async def _generate_ask_more(self, memory: ChatMemory, missing_slots):
+        draft = compose_ask_more(missing_slots, memory.user_profile, variant=len(memory.history))
+        if not self.ask_more_llm_polish:
+            return draft
+
         prompt = f"""
-        사용자가 아이엘츠 수업을 찾고 있는데, 다음 정보가 부족합니다: {missing_slots}.
-        AI 상담원으로서, 정확한 추천을 위해 이 정보들을 자연스럽게 물어보는 문장을 작성하세요.
-        (예: "목표 점수가 어떻게 되시나요?", "수업 가능한 시간대가 있으신가요?")
+        아래는 아이엘츠 학원 AI 상담원이 사용자에게 부족한 정보를 묻는 초안입니다.
+        질문 항목과 순서는 그대로 두고, '하십시오/합니다' 체를 유지한 채 문장만 자연스럽게 다듬으세요. 다듬은 문장만 출력하세요.
+
+        [초안]
+        {draft}
         """
-        resp = client.models.generate_content(model=MODEL_NAME, contents=prompt)
-        return resp.text
+        try:
+            resp = await get_client().aio.models.generate_content(model=MODEL_NAME, contents=prompt)
+            return resp.text or draft
+        except Exception as e:
+            print(f"⚠️ 되묻기 문장 다듬기 실패, 템플릿 사용: {e}")
+            return draft
 
-    def _generate_final_answer(self, user_input, search_results):
+    async def _generate_final_answer(self, memory: ChatMemory, user_input, search_results):
         constraints = ""
-        p = self.memory.user_profile
-        if p.get('preferred_time') == 'Weekend':
+        # preferred_time 은 사용자 표현 그대로('주말 오전', '토요일')이므로 요일 집합으로 풀어 판단합니다.
+        preferred_days = build_filters(memory.user_profile).get('days')
+        if preferred_days and preferred_days <= WEEKEND:
             constraints += "- 사용자 제약: 주말 선호 (평일 불가능 가능성 높음)\n"
-        if "직장인" in self.memory.get_context_string():
+        if memory.mentions("직장인"):
             constraints += "- 사용자 제약: 직장인 (효율적인 커리큘럼 선호)\n"
 
         prompt = f"""
         {CONSULTANT_SYSTEM_PROMPT}
 
         [User Profile & Constraints]
-        {self.memory.get_context_string()}
+        {memory.get_context_string()}
         {constraints}
 
         [User Question]
@@ -317,10 +1320,15 @@ class ConsultantAgent:
         온라인 강의는 사용자가 도저히 통학할 수 없는 상황일 때만 '참고용'으로 짧게 언급하십시오.
         """
         
-        resp = client.models.generate_content(model=MODEL_NAME, contents=prompt)
+        resp = await get_client().aio.models.generate_content(model=MODEL_NAME, contents=prompt)
         return resp.text
 
 if __name__ == "__main__":
+    if "--startup-report" in sys.argv:
+        warmup(background=False)
+        print(startup_report())
+        sys.exit(0)
+
     agent = ConsultantAgent()
     print(" 아이린 상담원과 연결되었습니다. (종료: q)")
     
@@ -328,6 +1336,14 @@ if __name__ == "__main__":
         try:
             user_text = input("\nUser: ")
             if user_text.lower() == 'q':
+                print(f"📊 [Pre-Router] {agent.router.pre_router.stats()}")
+                print(f"📊 [Speculation] {agent.speculation_stats} (hit rate: {agent.speculation_hit_rate():.0%})")
+                print(f"📊 [Sessions] {agent.sessions.stats()}")
+                print(f"📊 [Context Compression] {agent.compression_stats}")
+                if agent.answer_cache is not None:
+                    print(f"📊 [Answer Cache] {agent.answer_cache.stats()}")
+                print(f"📊 [Slot Extractor] {agent.slot_extractor.stats()} / {agent.slot_stats}")
+                agent.retriever.embedding_cache.flush()
                 break
             
             response = agent.run(user_text)
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def make_response_key(kind: str, *parts: Any) -> str:
+    """모델 / 프롬프트 템플릿 / 렌더링된 프롬프트 / 설정 등을 한데 묶은 내용 주소(content-addressed) 키"""
+    raw = json.dumps([kind, *parts], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    전처리 LLM 응답과 문서 임베딩을 저장하는 SQLite 캐시입니다.
+    값은 bytes 로 저장하고(LLM 응답: UTF-8 텍스트, 임베딩: float32 버퍼),
+    전체 크기가 max_bytes 를 넘으면 가장 오래 안 쓰인 항목부터 지웁니다.
+    """
+    def __init__(self, db_path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # 여러 스크립트(ingest.py 동시 실행 포함)가 같은 파일을 쓰므로 잠금 대기 시간을 넉넉히 둡니다.
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, kind TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def contains(self, key: str) -> bool:
+        """적중/미스 통계와 last_access 를 건드리지 않고 키가 있는지만 봅니다."""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, key: str, kind: str, value: bytes):
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, value, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, value, len(value), now, now)
+            )
+            self._total_bytes += len(value) - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # 한 번에 상한의 90% 까지 줄여 매 put 마다 삭제가 일어나지 않게 합니다.
+        target = int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            if self._total_bytes <= target:
+                break
+            victims.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def get_text(self, key: str) -> Optional[str]:
+        value = self.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def put_text(self, key: str, kind: str, text: str):
+        self.put(key, kind, text.encode("utf-8"))
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "total_bytes": self._total_bytes,
+        }
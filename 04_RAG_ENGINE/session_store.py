@@ -0,0 +1,133 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class Session:
+    def __init__(self, session_id: str, state: Any):
+        self.session_id = session_id
+        self.state = state
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.size = 0
+        # 같은 세션의 턴은 순서대로 처리합니다.
+        self.lock = asyncio.Lock()
+
+
+class SessionStore:
+    """
+    세션 id -> 세션 상태(ChatMemory 등) 저장소입니다.
+    - LRU: 세션 수가 max_sessions 를 넘으면 가장 오래 안 쓰인 세션부터 제거
+    - Idle TTL: idle_ttl_seconds 동안 접근이 없으면 제거
+    - 메모리 상한: size_fn 으로 추정한 총 바이트가 max_total_bytes 를 넘으면 LRU 순으로 제거
+    진행 중인 턴이 lock 을 잡고 있는 세션은 어떤 경우에도 제거하지 않습니다 (턴이 버려진 상태에 기록되지 않도록).
+    """
+    def __init__(self, factory: Callable[[], Any], max_sessions: int = 10000,
+                 idle_ttl_seconds: Optional[float] = 30 * 60, max_total_bytes: Optional[int] = 256 * 1024 * 1024,
+                 size_fn: Optional[Callable[[Any], int]] = None):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_total_bytes = max_total_bytes
+        self.size_fn = size_fn
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+
+        self.created = 0
+        self.evicted = {"lru": 0, "ttl": 0, "memory": 0}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> Session:
+        """세션을 반환합니다. 없으면 새로 만듭니다."""
+        with self._lock:
+            now = time.time()
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, self.factory())
+                self._sessions[session_id] = session
+                self.created += 1
+            session.last_access = now
+            self._sessions.move_to_end(session_id)
+            self._update_size(session)
+            self._evict_overflow(keep=session_id)
+            return session
+
+    def release(self, session: Session):
+        """턴이 끝난 뒤 부릅니다. 이번 턴에 늘어난 크기를 반영하고, 그 사이 미뤄 둔 제거를 수행합니다."""
+        with self._lock:
+            if self._sessions.get(session.session_id) is not session:
+                return
+            self._update_size(session)
+            self._evict_overflow(keep=session.session_id)
+
+    def _update_size(self, session: Session):
+        if self.size_fn is None:
+            return
+        # 세션 하나만 다시 재서 총량을 증분 갱신합니다 (전체 재계산 없음).
+        new_size = self.size_fn(session.state)
+        self._total_bytes += new_size - session.size
+        session.size = new_size
+
+    def drop(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._total_bytes -= session.size
+
+    def _evict_idle(self, now: float):
+        if self.idle_ttl_seconds is None:
+            return
+        # OrderedDict 는 접근 순서이므로 앞에서부터 만료된 세션만 확인하면 됩니다.
+        expired = []
+        for session in self._sessions.values():
+            if now - session.last_access <= self.idle_ttl_seconds:
+                break
+            if not session.lock.locked():
+                expired.append(session)
+        for session in expired:
+            del self._sessions[session.session_id]
+            self._total_bytes -= session.size
+            self.evicted["ttl"] += 1
+
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _evict_overflow(self, keep: str):
+        # 남은 세션이 모두 진행 중이면 상한을 잠시 넘기고, 턴이 끝날 때(release) 다시 정리합니다.
+        while len(self._sessions) > self.max_sessions:
+            if self._pop_oldest(keep, "lru") is None:
+                break
+
+        if self.max_total_bytes is None or self.size_fn is None:
+            return
+        while self._total_bytes > self.max_total_bytes and len(self._sessions) > 1:
+            if self._pop_oldest(keep, "memory") is None:
+                break
+
+    def _pop_oldest(self, keep: str, reason: str) -> Optional[Session]:
+        for session_id, session in self._sessions.items():
+            if session_id != keep and not session.lock.locked():
+                self.evicted[reason] += 1
+                del self._sessions[session_id]
+                self._total_bytes -= session.size
+                return session
+        return None
+
+    def stats(self) -> Dict:
+        evictions = sum(self.evicted.values())
+        return {
+            "sessions": len(self._sessions),
+            "created": self.created,
+            "evicted": dict(self.evicted),
+            "eviction_rate": evictions / self.created if self.created else 0.0,
+            "total_bytes": self.total_bytes(),
+        }
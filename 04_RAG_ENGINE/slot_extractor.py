@@ -0,0 +1,332 @@
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# 사용자 발화에서 상담 슬롯(current_score, target_score, target_period, preferred_time, budget)을
+# 정규식 + Kiwi 형태소 분석으로 뽑습니다. LLM 라우터의 slots_to_update 와 같은 값 형식을 씁니다.
+
+# 아이엘츠 점수 (1.0 ~ 9.0, 0.5 단위). 뒤에 시각/기간/금액 단위가 붙으면 점수가 아닙니다.
+_SCORE = r"(?<![\d.])([1-9](?:\.[05])?)(?![\d.])"
+_NOT_SCORE_UNIT = r"(?!\s*(?:시|개월|월|만(?!들|\s*넘)|주|일|년|명|회|%|:|번|살|세|분|원|개|달|교시|학년|차|시간|등|급))"
+SCORE_PATTERN = re.compile(_SCORE + _NOT_SCORE_UNIT + r"(\s*점(?:대)?)?")
+SCORE_PAIR_PATTERN = re.compile(
+    _SCORE + r"\s*점?\s*(?:에서|->|→|~|-|to)\s*(?:오버롤\s*)?" + _SCORE + _NOT_SCORE_UNIT + r"\s*점?"
+)
+# 점수 앞뒤 몇 글자 안에 있으면 목표/현재 점수로 봅니다. 단서는 다른 점수를 건너 적용하지 않습니다
+# ('지금 5.5이고 7 받아야' 의 '지금' 은 5.5 의 단서이고, 7 은 뒤의 '받아야' 로 목표입니다).
+TARGET_CUES = re.compile(r"목표|까지|안에|내로|내에|받고\s*싶|받아야|필요|이상|올리|따야|따고|만들|원해|넘겨|맞춰야|커트")
+CURRENT_CUES = re.compile(r"현재|지금|받았|나왔|였어|이었|이에요|예요|입니다|이고|맞았|받은|봤는데|모의|첫\s*시험|떴")
+CUE_WINDOW = 10
+# '목표는 7.0이에요' 처럼 앞에 명시한 단서는 뒤의 어미('이에요')보다 우선합니다.
+# '7 목표로' 처럼 바로 뒤에 붙은 명시 단서는 앞쪽 단서('지금 5.5인데 7 목표로')보다 가까우면 그쪽을 씁니다.
+EXPLICIT_CUES = re.compile(r"(목표|현재|지금)")
+EXPLICIT_AFTER_WINDOW = 2
+# '점' 이나 소수점 없이 정수만 쓴 점수('7 받아야')로 인정하는 범위. 1~3 은 IELTS 목표/현재 점수로 쓰이지 않습니다.
+BARE_SCORE_RANGE = (4, 9)
+
+# 기간: '3개월', '세 달', '반년', '8월까지', '내년 3월 말까지', '연말까지'
+NATIVE_NUMERALS = {"한": 1, "두": 2, "세": 3, "석": 3, "네": 4, "넉": 4, "다섯": 5, "여섯": 6,
+                   "일곱": 7, "여덟": 8, "아홉": 9, "열": 10}
+SINO_NUMERALS = {"일": 1, "이": 2, "삼": 3, "사": 4, "오": 5, "육": 6, "칠": 7, "팔": 8, "구": 9, "십": 10}
+PERIOD_UNITS = {"개월": "개월", "달": "개월", "주": "주", "주일": "주", "년": "년"}
+_NUMERAL = r"(\d{1,2}|" + "|".join(sorted(NATIVE_NUMERALS, key=len, reverse=True)) + r")"
+# '2025년'(연도)과 '24년 3월'(날짜)은 기간이 아닙니다. 수사 앞에 숫자가 붙어 있거나 뒤에 'N월' 이 오면 버립니다.
+DATE_AFTER_PATTERN = re.compile(r"\s*\d{1,2}\s*월")
+MAX_DURATION_NUMBER = 99
+DURATION_PATTERN = re.compile(r"(?<!\d)" + _NUMERAL + r"\s*(개월|달|주일|주|년)(?!\s*(?:전|째|차))(?!\s*\d{1,2}\s*월)")
+# 한자어 수사는 '이 주(this week)' 같은 오인이 많아 개월/년에만 씁니다. (Kiwi 경로도 같은 규칙)
+SINO_PERIOD_UNITS = ("개월", "년")
+SINO_DURATION_PATTERN = re.compile(r"(?<![가-힣])([일이삼사오육칠팔구십])\s*(개월|년)(?!\s*(?:전|째|차))")
+HALF_YEAR_PATTERN = re.compile(r"반\s*년")
+# 기간 단위가 없으면 Kiwi 분석을 건너뜁니다.
+PERIOD_HINT = re.compile(r"개월|달|주|년")
+DEADLINE_PATTERN = re.compile(
+    r"((?:올해|내년|다음\s*해)\s*)?(\d{1,2})\s*월\s*(초|중순|말)?\s*(까지|안에|내로|전까지|전에|전)"
+)
+RELATIVE_DEADLINE_PATTERN = re.compile(r"(다음\s*달|다다음\s*달|연말|연내|올해\s*안|내년\s*초|내년\s*상반기|이번\s*달)\s*(까지|안에|내로|중)?")
+
+# 선호 시간: 요일 + 시간대 + 시각
+DAY_PATTERN = re.compile(
+    r"평일|주말|주중|매일|[월화수목금토일]\s*[~\-]\s*[월화수목금토일]"
+    r"|(?<![가-힣\d])[월화수목금토일]{2,7}(?![가-힣])|(?<![가-힣\d])[월화수목금토일]요일"
+)
+TIME_WORD_PATTERN = re.compile(r"새벽|아침|오전|점심|오후|저녁|야간|밤|퇴근\s*(?:후|하고|이후)|출근\s*전")
+CLOCK_PATTERN = re.compile(r"((?:오전|오후|저녁|밤)\s*)?(\d{1,2})\s*(?::\d{2}|시)(?:\s*반)?\s*(이후|부터|넘어서|이전|전|쯤|정도)?")
+# 시간 표현이 수업 조건이라는 단서 ('주말에 상담 되나요?' 같은 FAQ 는 슬롯으로 확정하지 않습니다)
+# '반' 은 '저녁반', '주말반' 처럼 붙여 쓴 경우만 봅니다. '2시 반', '반년' 은 수업 단서가 아닙니다.
+TIME_CONTEXT_CUES = re.compile(r"수업|(?<![\d\s시])반(?!\s*년)|강의|수강|시간|들을|듣고|다닐|다니|통학|괜찮|좋아|선호|밖에|만\s*가능")
+
+# 예산: '50만원', '100만 원 이하', '380,000원'
+# '만' 뒤에는 '원' 이나 토큰 경계가 와야 합니다 ('6.5 만들어야', '7 만 넘기면' 은 점수입니다). 소수 만 단위는 받지 않습니다.
+BUDGET_PATTERN = re.compile(
+    r"(?<![\d.])(\d+)(?![\d.])\s*만(?:\s*원|(?![가-힣])(?!\s*넘))|(\d{1,3}(?:,\d{3})+|\d{5,})\s*원"
+)
+# '까지' 는 기간('12월 전까지')에도 쓰여 예산 단서로 보지 않습니다.
+BUDGET_CUES = re.compile(r"예산|이하|이내|정도|내외|선에서|넘지|수강료|가격|비용|학원비|안쪽")
+
+# 할부/환불 기간, 다른 수강생의 점수처럼 사용자 본인 조건이 아닌 문맥 ('카드 3개월 할부', '6.5 받은 사람 후기')
+NOT_PROFILE_CUES = re.compile(
+    r"할부|환불|연기|휴강|이월|후기|사례|합격자|(?:받은|받으신|나온|딴)\s*(?:사람|분|학생|케이스)"
+)
+
+STRONG = 0.95
+MEDIUM = 0.85
+WEAK = 0.5
+
+
+def _format_score(value: str) -> str:
+    return f"{float(value):.1f}"
+
+
+def _numeral_value(word: str) -> Optional[int]:
+    if word.isdigit():
+        return int(word)
+    return NATIVE_NUMERALS.get(word, SINO_NUMERALS.get(word))
+
+
+class SlotExtraction:
+    """
+    extract() 결과. slots 는 슬롯 -> 값, confidence 는 슬롯 -> 0~1 확신도,
+    coverage 는 발화(공백 제외) 중 슬롯 표현이 차지하는 비율입니다.
+    """
+    __slots__ = ("slots", "confidence", "coverage")
+
+    def __init__(self):
+        self.slots = {}
+        self.confidence = {}
+        self.coverage = 0.0
+
+    def set(self, slot: str, value: str, confidence: float):
+        if confidence > self.confidence.get(slot, 0.0):
+            self.slots[slot] = value
+            self.confidence[slot] = confidence
+
+    def confident_slots(self, threshold: float) -> Dict[str, str]:
+        return {k: v for k, v in self.slots.items() if self.confidence[k] >= threshold}
+
+    def min_confidence(self) -> float:
+        return min(self.confidence.values()) if self.confidence else 0.0
+
+    def __repr__(self):
+        return f"SlotExtraction(slots={self.slots}, confidence={self.confidence}, coverage={self.coverage:.2f})"
+
+
+class SlotExtractor:
+    """
+    LLM 라우터 앞단의 규칙 기반 슬롯 추출기입니다.
+    - 점수/예산/시각은 정규식으로, 기간의 수사+단위('세 달', '삼 개월', '3개월')는 Kiwi 형태소로 정규화합니다.
+    - kiwi_fn 이 없거나 Kiwi 로드에 실패하면 같은 규칙의 정규식 경로를 씁니다.
+    - expected 에 직전에 되물은 슬롯을 넘기면, 단서 없이 숫자만 답한 경우('5.5요')도 그 슬롯으로 확정합니다.
+    """
+    def __init__(self, kiwi_fn: Optional[Callable[[], Any]] = None):
+        self.kiwi_fn = kiwi_fn
+        self._kiwi = None
+        self._kiwi_failed = False
+
+        self.total = 0
+        self.extracted = {}
+
+    def _get_kiwi(self):
+        if self._kiwi is None and self.kiwi_fn is not None and not self._kiwi_failed:
+            try:
+                self._kiwi = self.kiwi_fn()
+            except Exception as e:
+                self._kiwi_failed = True
+                print(f"⚠️ Slot extractor Kiwi 로드 실패, 정규식만 사용: {e}")
+        return self._kiwi
+
+    def extract(self, text: str, expected: Optional[List[str]] = None) -> SlotExtraction:
+        self.total += 1
+        text = str(text or "")
+        expected = set(expected or [])
+        result = SlotExtraction()
+        spans = []
+
+        spans += self._extract_scores(text, expected, result)
+        spans += self._extract_period(text, result)
+        spans += self._extract_time(text, expected, result)
+        spans += self._extract_budget(text, expected, result)
+
+        covered = set()
+        for start, end in spans:
+            covered.update(i for i in range(start, end) if not text[i].isspace())
+        non_space = sum(1 for c in text if not c.isspace())
+        result.coverage = len(covered) / non_space if non_space else 0.0
+
+        # 되물은 슬롯이 아니면 본인 조건이 아닌 문맥에서 나온 값은 확정하지 않습니다.
+        if NOT_PROFILE_CUES.search(text):
+            for slot in result.slots:
+                if slot not in expected:
+                    result.confidence[slot] = min(result.confidence[slot], WEAK)
+
+        for slot in result.slots:
+            self.extracted[slot] = self.extracted.get(slot, 0) + 1
+        return result
+
+    # --- 점수 ---
+    def _score_role(self, text: str, start: int, end: int, lower: int = 0,
+                    upper: Optional[int] = None) -> Tuple[Optional[str], int]:
+        """
+        가장 가까운 단서로 (target_score | current_score, 거리) 를 정합니다.
+        lower/upper 는 앞뒤 점수의 경계로, 단서를 찾는 창이 다른 점수를 넘지 않게 합니다.
+        """
+        upper = len(text) if upper is None else upper
+        before = text[max(lower, start - CUE_WINDOW):start]
+        after = text[end:min(upper, end + CUE_WINDOW)]
+        explicit = [(len(before) - m.end(), m.group(1)) for m in EXPLICIT_CUES.finditer(before)][-1:]
+        m = EXPLICIT_CUES.search(after)
+        # 거리가 같으면('현재 5.5 목표 6.5') 앞 단서를 씁니다.
+        if m and m.start() <= EXPLICIT_AFTER_WINDOW and (not explicit or m.start() < explicit[0][0]):
+            explicit = [(m.start(), m.group(1))]
+        if explicit:
+            dist, cue = explicit[0]
+            return ("target_score" if cue == "목표" else "current_score"), dist
+
+        best, best_dist = None, CUE_WINDOW + 1
+        for slot, cues in (("target_score", TARGET_CUES), ("current_score", CURRENT_CUES)):
+            for m in cues.finditer(before):
+                dist = len(before) - m.end()
+                if dist < best_dist:
+                    best, best_dist = slot, dist
+            m = cues.search(after)
+            if m and m.start() < best_dist:
+                best, best_dist = slot, m.start()
+        return best, best_dist
+
+    def _extract_scores(self, text: str, expected: set, result: SlotExtraction) -> List[Tuple[int, int]]:
+        spans = []
+        pair = SCORE_PAIR_PATTERN.search(text)
+        if pair:
+            low, high = float(pair.group(1)), float(pair.group(2))
+            if low < high:
+                result.set("current_score", _format_score(pair.group(1)), STRONG)
+                result.set("target_score", _format_score(pair.group(2)), STRONG)
+                return [pair.span()]
+
+        matches = list(SCORE_PATTERN.finditer(text))
+        for i, m in enumerate(matches):
+            value, has_unit = m.group(1), bool(m.group(2))
+            lower = matches[i - 1].end() if i > 0 else 0
+            upper = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            role, dist = self._score_role(text, m.start(), m.end(), lower, upper)
+            # 정수만 있는 숫자는 '점' 이 붙거나, 4~9 이고 단서가 있을 때만 점수로 봅니다.
+            if "." not in value and not has_unit and (
+                    role is None or not BARE_SCORE_RANGE[0] <= int(value) <= BARE_SCORE_RANGE[1]):
+                continue
+            if role is not None:
+                confidence = STRONG if dist <= 3 else MEDIUM
+            elif len(expected & {"current_score", "target_score"}) == 1:
+                role, confidence = next(iter(expected & {"current_score", "target_score"})), MEDIUM
+            else:
+                role, confidence = "current_score", WEAK
+            result.set(role, _format_score(value), confidence)
+            spans.append(m.span())
+        return spans
+
+    # --- 기간 ---
+    def _kiwi_durations(self, text: str) -> List[Tuple[int, int, str]]:
+        """Kiwi 토큰에서 (수사, 단위) 연쇄를 찾아 '3개월' 형태로 정규화합니다. '세달' 처럼 붙여 쓴 경우도 잡힙니다."""
+        kiwi = self._get_kiwi()
+        if kiwi is None:
+            return []
+        try:
+            tokens = kiwi.tokenize(text)
+        except Exception:
+            return []
+        found = []
+        for prev, token in zip(tokens, tokens[1:]):
+            if prev.tag not in ("SN", "NR", "MM") or token.form not in PERIOD_UNITS:
+                continue
+            number = _numeral_value(prev.form)
+            if number is None:
+                continue
+            # '이 주', '이 달' 의 '이' 는 관형사(this)입니다. 정규식 경로처럼 한자어 수사는 개월/년에만 씁니다.
+            if prev.form in SINO_NUMERALS and token.form not in SINO_PERIOD_UNITS:
+                continue
+            end = token.start + token.len
+            if re.match(r"\s*(?:전|째|차)", text[end:]) or DATE_AFTER_PATTERN.match(text, end):
+                continue
+            if number > MAX_DURATION_NUMBER or (prev.start > 0 and text[prev.start - 1].isdigit()):
+                continue
+            found.append((prev.start, end, f"{number}{PERIOD_UNITS[token.form]}"))
+        return found
+
+    def _regex_durations(self, text: str) -> List[Tuple[int, int, str]]:
+        found = []
+        for pattern in (DURATION_PATTERN, SINO_DURATION_PATTERN):
+            for m in pattern.finditer(text):
+                number = _numeral_value(m.group(1))
+                if number is not None:
+                    found.append((m.start(), m.end(), f"{number}{PERIOD_UNITS[m.group(2)]}"))
+        for m in HALF_YEAR_PATTERN.finditer(text):
+            found.append((m.start(), m.end(), "6개월"))
+        return found
+
+    def _extract_period(self, text: str, result: SlotExtraction) -> List[Tuple[int, int]]:
+        # 마감 시점('8월까지')이 있으면 기간('3개월')보다 우선합니다.
+        m = DEADLINE_PATTERN.search(text)
+        if m:
+            prefix = " ".join(m.group(1).split()) + " " if m.group(1) else ""
+            part = f" {m.group(3)}" if m.group(3) else ""
+            result.set("target_period", f"{prefix}{int(m.group(2))}월{part}까지", STRONG)
+            return [m.span()]
+        m = RELATIVE_DEADLINE_PATTERN.search(text)
+        if m:
+            result.set("target_period", " ".join(m.group(1).split()) + "까지", MEDIUM if m.group(2) else WEAK)
+            return [m.span()]
+
+        if not PERIOD_HINT.search(text):
+            return []
+        durations = self._kiwi_durations(text) or self._regex_durations(text)
+        if not durations:
+            return []
+        start, end, value = min(durations)
+        result.set("target_period", value, MEDIUM)
+        return [(start, end)]
+
+    # --- 선호 시간 ---
+    def _extract_time(self, text: str, expected: set, result: SlotExtraction) -> List[Tuple[int, int]]:
+        matches = []
+        for pattern in (DAY_PATTERN, TIME_WORD_PATTERN):
+            matches += [(m.start(), m.end(), m.group(0)) for m in pattern.finditer(text)]
+        for m in CLOCK_PATTERN.finditer(text):
+            if not (m.group(1) or m.group(3)):
+                continue  # '7시' 만으로는 수업 시각인지 알 수 없습니다.
+            matches.append((m.start(), m.end(), m.group(0)))
+        if not matches:
+            return []
+
+        # 시간대 단어와 시각이 겹치면('저녁 7시 이후') 긴 쪽만 남깁니다.
+        matches.sort(key=lambda x: (x[0], -(x[1] - x[0])))
+        words, spans, last_end = [], [], -1
+        for start, end, word in matches:
+            if start < last_end:
+                continue
+            word = re.sub(r"퇴근\s*(?:하고|이후)", "퇴근 후", " ".join(word.split()))
+            if word not in words:
+                words.append(word)
+            spans.append((start, end))
+            last_end = end
+
+        if "preferred_time" in expected or TIME_CONTEXT_CUES.search(text):
+            confidence = STRONG
+        else:
+            confidence = WEAK
+        result.set("preferred_time", " ".join(words), confidence)
+        return spans
+
+    # --- 예산 ---
+    def _extract_budget(self, text: str, expected: set, result: SlotExtraction) -> List[Tuple[int, int]]:
+        m = BUDGET_PATTERN.search(text)
+        if not m:
+            return []
+        if m.group(1):
+            value = f"{m.group(1)}만원"
+        else:
+            value = f"{int(m.group(2).replace(',', '')):,}원"
+        confidence = STRONG if ("budget" in expected or BUDGET_CUES.search(text)) else WEAK
+        result.set("budget", value, confidence)
+        return [m.span()]
+
+    def stats(self) -> Dict:
+        return {"total": self.total, "extracted_by_slot": dict(self.extracted)}
@@ -0,0 +1,90 @@
+import zlib
+from typing import Dict, List, Optional
+
+
+# TIMETABLE 추천 전에 반드시 알아야 하는 슬롯 (없으면 검색 대신 되묻습니다)
+REQUIRED_TIMETABLE_SLOTS = ("preferred_time", "current_score")
+
+# 한 번에 묻는 슬롯 수 상한 (너무 많이 물으면 이탈이 늘어납니다)
+MAX_QUESTIONS = 3
+
+# 슬롯별 질문 문장. 같은 세션에서 되묻기가 반복되면 다른 표현을 고릅니다.
+# CONSULTANT_SYSTEM_PROMPT 와 같은 '하십시오/합니다' 체로 씁니다 (LLM 답변 턴과 말투를 맞춤).
+SLOT_QUESTIONS = {
+    "current_score": [
+        "현재 아이엘츠 점수(또는 예상 점수)는 어느 정도입니까?",
+        "현재 실력은 오버롤 기준 몇 점 정도로 보십니까? 시험을 본 적이 없으시면 '처음'이라고 알려 주십시오.",
+        "최근에 받으신 아이엘츠 점수가 있습니까? 없으시면 대략적인 영어 실력을 알려 주십시오.",
+    ],
+    "target_score": [
+        "목표 점수는 몇 점입니까?",
+        "최종적으로 받으셔야 하는 점수(오버롤/영역별)가 있습니까?",
+    ],
+    "target_period": [
+        "목표 점수는 언제까지 필요하십니까?",
+        "준비 기간은 어느 정도로 생각하고 계십니까? (예: 3개월, 8월까지)",
+    ],
+    "preferred_time": [
+        "수업 가능한 요일과 시간대를 알려 주십시오. (예: 평일 저녁, 주말 오전)",
+        "평일과 주말 중 언제, 몇 시쯤 수업을 들으실 수 있습니까?",
+        "주로 어느 시간대에 통학이 가능하십니까? (예: 퇴근 후 7시 이후, 토요일 오전)",
+    ],
+    "budget": [
+        "생각하고 계신 수강료 예산이 있습니까?",
+        "월 수강료는 어느 정도까지 가능하십니까?",
+    ],
+}
+
+# 이미 알고 있는 프로필을 짚어 주는 문장 (첫 번째로 값이 있는 슬롯 하나만 씁니다)
+KNOWN_SLOT_LEADS = [
+    ("target_score", "목표 {value}점에 맞는 수업을 찾아 드리겠습니다."),
+    ("preferred_time", "{value} 수업 위주로 찾아보겠습니다."),
+    ("target_period", "{value} 일정에 맞춰 추천해 드리겠습니다."),
+    ("current_score", "현재 {value}점 기준으로 반을 골라 드리겠습니다."),
+]
+
+OPENERS = [
+    "정확한 수업 추천을 위해 몇 가지 여쭙겠습니다.",
+    "적합한 반을 찾아 드리려면 추가 정보가 필요합니다.",
+]
+
+
+def slots_to_ask(missing_slots: Optional[List[str]], profile: Dict) -> List[str]:
+    """필수 슬롯을 먼저, 그 다음 라우터가 알려준 누락 슬롯 순으로 (이미 아는 값과 모르는 슬롯 이름은 제외)"""
+    ordered = list(REQUIRED_TIMETABLE_SLOTS) + list(missing_slots or [])
+    slots = []
+    for slot in ordered:
+        if slot in SLOT_QUESTIONS and not profile.get(slot) and slot not in slots:
+            slots.append(slot)
+    return slots[:MAX_QUESTIONS]
+
+
+def _pick(options: List[str], seed: int) -> str:
+    return options[seed % len(options)]
+
+
+def compose_ask_more(missing_slots: Optional[List[str]], profile: Dict, variant: int = 0) -> str:
+    """
+    누락 슬롯을 묻는 상담원 문장을 템플릿으로 만듭니다 (API 호출 없음).
+    variant 는 같은 세션에서 문장을 바꾸기 위한 값(예: 대화 턴 수)이며, 같은 입력이면 항상 같은 문장입니다.
+    """
+    slots = slots_to_ask(missing_slots, profile)
+    seed = zlib.crc32(repr((tuple(slots), variant)).encode("utf-8"))
+
+    lead = ""
+    for slot, template in KNOWN_SLOT_LEADS:
+        if profile.get(slot):
+            # '7.0점' 처럼 단위까지 들어온 값이 '7.0점점' 이 되지 않게 합니다.
+            lead = template.format(value=str(profile[slot]).strip().rstrip("점"))
+            break
+
+    if not slots:
+        return " ".join(filter(None, [lead, "추가로 원하시는 조건이 있으면 말씀해 주십시오."]))
+
+    questions = [_pick(SLOT_QUESTIONS[slot], seed + i) for i, slot in enumerate(slots)]
+    if len(questions) == 1:
+        return " ".join(filter(None, [lead, questions[0]]))
+
+    lines = [" ".join(filter(None, [lead, _pick(OPENERS, seed)]))]
+    lines += [f"{i}. {q}" for i, q in enumerate(questions, 1)]
+    return "\n".join(lines)
@@ -0,0 +1,270 @@
+import re
+import json
+from typing import Dict, List, Optional, Set, Tuple
+
+
+DAY_KEYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+KOR_DAYS = ["월", "화", "수", "목", "금", "토", "일"]
+WEEKDAYS = set(DAY_KEYS[:5])
+WEEKEND = set(DAY_KEYS[5:])
+
+# 사용자 선호 시간 표현 -> 수업 시작 시각 범위(분)
+TIME_WINDOWS = {
+    "새벽": (5 * 60, 9 * 60),
+    "아침": (6 * 60, 10 * 60),
+    "오전": (6 * 60, 12 * 60),
+    "점심": (11 * 60, 14 * 60),
+    "오후": (12 * 60, 18 * 60),
+    "저녁": (18 * 60, 23 * 60),
+    "퇴근": (18 * 60, 23 * 60),
+    "야간": (19 * 60, 24 * 60),
+    "morning": (6 * 60, 12 * 60),
+    "afternoon": (12 * 60, 18 * 60),
+    "evening": (18 * 60, 23 * 60),
+    "night": (19 * 60, 24 * 60),
+}
+
+UNKNOWN = -1
+
+# '월요일에', '토요일만' 처럼 요일 뒤에 붙는 조사
+DAY_PARTICLES = r"(?:에는|에|은|는|도|만|마다|이나|이랑|부터|까지)?"
+
+
+
+
+def parse_days(value) -> Set[str]:
+    """
+    ['월','수','금'], '월~금', '토, 일', '평일', 'Weekend' 등을 요일 키 집합으로 변환합니다.
+
+    >>> sorted(parse_days("월요일에 가능"))
+    ['mon']
+    >>> sorted(parse_days("주 3일 저녁"))
+    []
+    """
+    if not value:
+        return set()
+    if isinstance(value, (list, tuple)):
+        days = set()
+        for v in value:
+            days |= parse_days(v)
+        return days
+
+    text = str(value).strip().lower()
+    days = set()
+    if "평일" in text or "weekday" in text:
+        days |= WEEKDAYS
+    if "주말" in text or "weekend" in text:
+        days |= WEEKEND
+    if "매일" in text or "everyday" in text or "daily" in text:
+        days |= set(DAY_KEYS)
+
+    for start, end in re.findall(r"([월화수목금토일])\s*[~\-]\s*([월화수목금토일])", text):
+        i, j = KOR_DAYS.index(start), KOR_DAYS.index(end)
+        days |= set(DAY_KEYS[i:j + 1])
+    # '월', '토요일', '월수금' 처럼 요일 글자만으로 된 어절 ('평일', '매일', '수업'의 한 글자, '3일' 은 제외)
+    # '요일' 뒤에는 조사가 올 수 있습니다 ('월요일에', '토요일만').
+    for run in re.findall(r"(?<![가-힣\d])([월화수목금토일]+)(?:요일" + DAY_PARTICLES + r")?(?![가-힣])", text):
+        days |= {DAY_KEYS[KOR_DAYS.index(c)] for c in run}
+    for key in DAY_KEYS:
+        if re.search(r"\b" + key + r"(?:day|\.)?\b", text):
+            days.add(key)
+    return days
+
+
+def parse_hhmm(value) -> int:
+    """'19:00' -> 1140 (분). 파싱 불가 시 -1"""
+    if not value:
+        return UNKNOWN
+    m = re.search(r"(\d{1,2})\s*[:시]\s*(\d{2})?", str(value))
+    if not m:
+        return UNKNOWN
+    return int(m.group(1)) * 60 + int(m.group(2) or 0)
+
+
+def parse_amount(value) -> int:
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = re.sub(r"[^\d]", "", str(value or ""))
+    return int(digits) if digits else UNKNOWN
+
+
+
+
+def extract_timetable_filters(schedule: Dict, price_options: List, branch: str, course_type: str) -> Dict:
+    """
+    시간표 문서의 course_spec 에서 Chroma 에 필터 가능한 타입 메타데이터를 뽑습니다.
+    요일은 리스트를 메타데이터로 넣을 수 없으므로 day_mon ~ day_sun 불리언으로 펼칩니다.
+    """
+    schedule = schedule or {}
+    days = parse_days(schedule.get('days_exact'))
+    time_exact = schedule.get('time_exact') or {}
+    amounts = [parse_amount(p.get('amount')) for p in (price_options or []) if isinstance(p, dict)]
+    amounts = [a for a in amounts if a > 0]
+
+    fields = {f"day_{k}": k in days for k in DAY_KEYS}
+    fields.update({
+        "day": ",".join(KOR_DAYS[i] for i, k in enumerate(DAY_KEYS) if k in days) or "Unknown",
+        "start_min": parse_hhmm(time_exact.get('start')),
+        "end_min": parse_hhmm(time_exact.get('end')),
+        "branch": str(branch or ""),
+        "is_online": str(course_type or "").lower() == "online" or str(branch or "").upper() == "ON",
+        "price_min": min(amounts) if amounts else UNKNOWN,
+        "price_max": max(amounts) if amounts else UNKNOWN,
+    })
+    return fields
+
+
+
+
+def parse_time_preference(text) -> Tuple[Optional[Set[str]], Optional[Tuple[int, int]]]:
+    """사용자 preferred_time 문자열을 (허용 요일 집합, 시작 시각 범위) 로 변환합니다."""
+    if not text:
+        return None, None
+    lowered = str(text).lower()
+    days = parse_days(lowered) or None
+
+    window = None
+    for word, w in TIME_WINDOWS.items():
+        if word in lowered:
+            window = w if window is None else (min(window[0], w[0]), max(window[1], w[1]))
+    m = re.search(r"(\d{1,2})\s*(?::\d{2}|시)\s*(이후|부터|넘어서)", lowered)
+    if m:
+        hour = int(m.group(1))
+        if hour < 12 and re.search(r"오후|저녁|퇴근|pm", lowered):
+            hour += 12
+        window = (hour * 60, 24 * 60)
+    return days, window
+
+
+def parse_budget(text) -> Optional[int]:
+    """'50만원', '100만 원 이하', '380000' -> 원 단위 정수"""
+    if text is None or text == "":
+        return None
+    if isinstance(text, (int, float)):
+        return int(text)
+    t = str(text).replace(",", "")
+    m = re.search(r"(\d+(?:\.\d+)?)\s*만", t)
+    if m:
+        return int(float(m.group(1)) * 10000)
+    m = re.search(r"\d{4,}", t)
+    return int(m.group(0)) if m else None
+
+
+def build_filters(profile: Dict) -> Dict:
+    """ChatMemory.user_profile 에서 시간표 필터 조건을 만듭니다. 조건이 없으면 빈 dict."""
+    filters = {}
+    days, window = parse_time_preference(profile.get('preferred_time'))
+    if days:
+        filters['days'] = days
+    if window:
+        filters['start_window'] = window
+    budget = parse_budget(profile.get('budget'))
+    if budget:
+        filters['max_price'] = budget
+    return filters
+
+
+def build_where(filters: Dict) -> Optional[Dict]:
+    """filters -> Chroma where 절. 요일/시간/가격 정보가 없는(-1, 모든 요일 False) 문서는 통과시킵니다."""
+    clauses = []
+    if filters.get('days'):
+        for key in DAY_KEYS:
+            if key not in filters['days']:
+                clauses.append({f"day_{key}": False})
+    if filters.get('start_window'):
+        start, end = filters['start_window']
+        clauses.append({"$or": [
+            {"start_min": UNKNOWN},
+            {"$and": [{"start_min": {"$gte": start}}, {"start_min": {"$lt": end}}]},
+        ]})
+    if filters.get('max_price'):
+        clauses.append({"$or": [{"price_min": UNKNOWN}, {"price_min": {"$lte": filters['max_price']}}]})
+    if filters.get('online') is not None:
+        clauses.append({"is_online": bool(filters['online'])})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+
+
+class TimetableFilterIndex:
+    """
+    시간표 문서의 타입 필드를 열(column) 단위 리스트로 보관하는 인메모리 색인입니다.
+    요일은 비트마스크(월=1 ... 일=64)로 저장해 부분집합 검사를 정수 연산 한 번으로 처리합니다.
+    """
+    def __init__(self):
+        self.ids = []
+        self.day_mask = []
+        self.start_min = []
+        self.end_min = []
+        self.branch = []
+        self.is_online = []
+        self.price_min = []
+        self.price_max = []
+
+    @staticmethod
+    def _mask(days) -> int:
+        return sum(1 << i for i, k in enumerate(DAY_KEYS) if k in days)
+
+    @classmethod
+    def from_metadatas(cls, ids: List[str], metadatas: List[Dict]) -> "TimetableFilterIndex":
+        index = cls()
+        for doc_id, meta in zip(ids, metadatas):
+            if "start_min" not in meta:
+                # 예전 방식으로 적재된 문서: full_json 에서 직접 추출
+                try:
+                    item = json.loads(meta.get('full_json') or "{}")
+                except (TypeError, ValueError):
+                    item = {}
+                spec = item.get('course_spec', {}) or {}
+                info = item.get('meta_data', {}) or {}
+                meta = extract_timetable_filters(spec.get('schedule'), spec.get('price_options'),
+                                                 info.get('branch', meta.get('branch')),
+                                                 info.get('course_type', meta.get('course_type')))
+            index.add(doc_id, meta)
+        return index
+
+    def add(self, doc_id: str, meta: Dict):
+        self.ids.append(doc_id)
+        self.day_mask.append(self._mask({k for k in DAY_KEYS if meta.get(f"day_{k}")}))
+        self.start_min.append(int(meta.get('start_min', UNKNOWN)))
+        self.end_min.append(int(meta.get('end_min', UNKNOWN)))
+        self.branch.append(str(meta.get('branch', '')))
+        self.is_online.append(bool(meta.get('is_online', False)))
+        self.price_min.append(int(meta.get('price_min', UNKNOWN)))
+        self.price_max.append(int(meta.get('price_max', UNKNOWN)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def filter(self, filters: Dict) -> List[str]:
+        """조건을 모두 만족하는 문서 id 리스트 (정보가 없는 필드는 통과)"""
+        allowed = self._mask(filters['days']) if filters.get('days') else None
+        window = filters.get('start_window')
+        max_price = filters.get('max_price')
+        online = filters.get('online')
+        branch = filters.get('branch')
+
+        matched = []
+        for i, doc_id in enumerate(self.ids):
+            if allowed is not None and self.day_mask[i] & ~allowed:
+                continue
+            if window and self.start_min[i] != UNKNOWN and not (window[0] <= self.start_min[i] < window[1]):
+                continue
+            if max_price and self.price_min[i] != UNKNOWN and self.price_min[i] > max_price:
+                continue
+            if online is not None and self.is_online[i] != bool(online):
+                continue
+            if branch and self.branch[i] != branch:
+                continue
+            matched.append(doc_id)
+        return matched
+
+    def stats(self) -> Dict:
+        return {
+            "documents": len(self.ids),
+            "with_schedule": sum(1 for m in self.day_mask if m),
+            "with_price": sum(1 for p in self.price_min if p != UNKNOWN),
+        }
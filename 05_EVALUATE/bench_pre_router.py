@@ -0,0 +1,75 @@
+"""
+로컬 pre-router(04_RAG_ENGINE/pre_router.py)의 정밀도와 LLM 우회율을 측정합니다.
+
+사용법:
+    python 05_EVALUATE/bench_pre_router.py
+    python 05_EVALUATE/bench_pre_router.py --show-errors
+
+로컬에서 확정한 발화 중 정답 의도와 일치한 비율(정밀도)이 핵심 지표입니다. 로컬 결과는 슬롯이 비어 있으므로
+오분류는 사용자 프로필 손실로 이어집니다. 코퍼스에서 "regression": true 인 행(리뷰에서 잡힌 오라우팅)이
+로컬에서 잘못된 의도로 확정되면 종료 코드 1 로 끝납니다.
+"""
+import os
+import sys
+import json
+import argparse
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(project_root, '04_RAG_ENGINE'))
+
+from pre_router import LocalPreRouter
+
+CORPUS_PATH = os.path.join(project_root, '05_EVALUATE', 'pre_router_corpus.jsonl')
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pre-router 정밀도/우회율 벤치마크")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    router = LocalPreRouter()
+    print(f"📂 코퍼스 {len(corpus)}건 / 설정 {router.config}")
+
+    per_intent = {}
+    misroutes = []
+    for row in corpus:
+        result = router.classify(row['text'])
+        if result is None:
+            continue
+        c = per_intent.setdefault(result['intent'], {"local": 0, "correct": 0})
+        c["local"] += 1
+        if result['intent'] == row['intent']:
+            c["correct"] += 1
+        else:
+            misroutes.append((row['text'], row['intent'], result['intent'], result['reason'], bool(row.get('regression'))))
+
+    local = sum(c["local"] for c in per_intent.values())
+    correct = sum(c["correct"] for c in per_intent.values())
+    stats = router.stats()
+    print("\n📊 로컬 분류 정밀도")
+    print(f"   {'intent':<12}{'local':>8}{'correct':>10}{'precision':>11}")
+    for intent, c in sorted(per_intent.items()):
+        print(f"   {intent:<12}{c['local']:>8}{c['correct']:>10}{c['correct'] / c['local']:>11.2f}")
+    print(f"   전체 정밀도: {correct}/{local} ({correct / local if local else 0.0:.0%})")
+    print(f"   LLM 우회율: {stats['local']}/{stats['total']} (fall-through {stats['fallthrough_rate']:.0%})")
+
+    if args.show_errors and misroutes:
+        print("\n❌ 오라우팅")
+        for text, gold, predicted, reason, _ in misroutes:
+            print(f"   {text}\n      정답: {gold} / 로컬: {predicted} ({reason})")
+
+    regressions = [text for text, _, _, _, regression in misroutes if regression]
+    if regressions:
+        print(f"\n🚨 회귀 케이스 {len(regressions)}건 실패: {regressions}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
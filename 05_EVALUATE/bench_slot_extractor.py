@@ -0,0 +1,138 @@
+"""
+규칙 기반 슬롯 추출기(04_RAG_ENGINE/slot_extractor.py)의 정확도와 처리량을 측정합니다.
+
+사용법:
+    python 05_EVALUATE/bench_slot_extractor.py            # 정규식 경로
+    python 05_EVALUATE/bench_slot_extractor.py --kiwi     # Kiwi 기간 정규화 포함
+    python 05_EVALUATE/bench_slot_extractor.py --repeat 500 --show-errors
+
+코퍼스에서 "regression": true 인 행(리뷰에서 잡힌 오추출)이 하나라도 틀리면 종료 코드 1 로 끝납니다.
+slot_corpus.jsonl 은 규칙을 만들면서 함께 쓴 개발용 코퍼스라 정확도가 높게 나옵니다. 규칙 튜닝에 쓰지 않은
+slot_heldout.jsonl 의 정확도를 따로 보고하며, 이 파일의 행으로 규칙을 맞추지 않습니다.
+held-out 발화 단위 완전 일치율이 HELDOUT_MIN_ACCURACY 보다 낮아도 종료 코드 1 로 끝납니다.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(project_root, '04_RAG_ENGINE'))
+
+from slot_extractor import SlotExtractor
+
+# rag_modules.SLOT_CONFIDENCE_THRESHOLD 와 같은 값 (rag_modules 를 import 하지 않으려고 따로 둡니다)
+CONFIDENCE_THRESHOLD = 0.8
+CORPUS_PATH = os.path.join(project_root, '05_EVALUATE', 'slot_corpus.jsonl')
+HELDOUT_PATH = os.path.join(project_root, '05_EVALUATE', 'slot_heldout.jsonl')
+HELDOUT_MIN_ACCURACY = 0.95
+SLOTS = ["current_score", "target_score", "target_period", "preferred_time", "budget"]
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(extractor, corpus, threshold):
+    counts = {slot: {"tp": 0, "fp": 0, "fn": 0} for slot in SLOTS}
+    exact = 0
+    errors = []
+    for row in corpus:
+        predicted = extractor.extract(row['text'], expected=row.get('expected')).confident_slots(threshold)
+        gold = row['slots']
+        for slot in SLOTS:
+            p, g = predicted.get(slot), gold.get(slot)
+            if p is not None and p == g:
+                counts[slot]["tp"] += 1
+            else:
+                if p is not None:
+                    counts[slot]["fp"] += 1
+                if g is not None:
+                    counts[slot]["fn"] += 1
+        if predicted == gold:
+            exact += 1
+        else:
+            errors.append((row['text'], gold, predicted, bool(row.get('regression'))))
+    return counts, exact, errors
+
+
+def report(title, extractor, corpus, threshold, show_errors):
+    counts, exact, errors = evaluate(extractor, corpus, threshold)
+    print(f"\n📊 {title} 슬롯별 정확도 ({len(corpus)}건)")
+    print(f"   {'slot':<16}{'precision':>10}{'recall':>10}{'f1':>8}")
+    for slot in SLOTS:
+        c = counts[slot]
+        precision = c["tp"] / (c["tp"] + c["fp"]) if c["tp"] + c["fp"] else 0.0
+        recall = c["tp"] / (c["tp"] + c["fn"]) if c["tp"] + c["fn"] else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        print(f"   {slot:<16}{precision:>10.2f}{recall:>10.2f}{f1:>8.2f}")
+    print(f"   발화 단위 완전 일치: {exact}/{len(corpus)} ({exact / len(corpus):.0%})")
+
+    if show_errors and errors:
+        print(f"\n❌ {title} 불일치")
+        for text, gold, predicted, _ in errors:
+            print(f"   {text}\n      정답: {gold}\n      추출: {predicted}")
+    return errors
+
+
+def benchmark(extractor, corpus, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for row in corpus:
+            start = time.perf_counter()
+            extractor.extract(row['text'], expected=row.get('expected'))
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "utterances": len(latencies),
+        "per_sec": len(latencies) / total if total else 0.0,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="슬롯 추출기 정확도/처리량 벤치마크")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--heldout", default=HELDOUT_PATH, help="규칙 튜닝에 쓰지 않은 평가용 코퍼스")
+    parser.add_argument("--kiwi", action="store_true", help="Kiwi 형태소 기반 기간 정규화 사용")
+    parser.add_argument("--repeat", type=int, default=200, help="처리량 측정 반복 횟수")
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    kiwi_fn = None
+    if args.kiwi:
+        from kiwipiepy import Kiwi
+        kiwi = Kiwi()
+        kiwi_fn = lambda: kiwi
+
+    corpus = load_corpus(args.corpus)
+    extractor = SlotExtractor(kiwi_fn=kiwi_fn)
+    print(f"📂 코퍼스 {len(corpus)}건 / 확신도 임계값 {args.threshold} / Kiwi {'사용' if args.kiwi else '미사용'}")
+
+    errors = report("개발 코퍼스", extractor, corpus, args.threshold, args.show_errors)
+    heldout_accuracy = None
+    if os.path.exists(args.heldout):
+        heldout = load_corpus(args.heldout)
+        heldout_errors = report("held-out", extractor, heldout, args.threshold, args.show_errors)
+        heldout_accuracy = 1 - len(heldout_errors) / len(heldout)
+
+    result = benchmark(extractor, corpus, args.repeat)
+    print(f"\n⏱️ 처리량: {result['per_sec']:,.0f} 발화/초 "
+          f"(p50 {result['p50_us']:.1f}µs, p99 {result['p99_us']:.1f}µs, {result['utterances']:,}회)")
+
+    regressions = [text for text, _, _, regression in errors if regression]
+    if regressions:
+        print(f"\n🚨 회귀 케이스 {len(regressions)}건 실패: {regressions}")
+        sys.exit(1)
+    if heldout_accuracy is not None and heldout_accuracy < HELDOUT_MIN_ACCURACY:
+        print(f"\n🚨 held-out 완전 일치율 {heldout_accuracy:.0%} < {HELDOUT_MIN_ACCURACY:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
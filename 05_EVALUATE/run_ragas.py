@@ -35,16 +35,17 @@ def run_evaluation():
     ground_truths = []
 
     print("🚀 평가 데이터 생성 중...")
+
+    # 엔진(Retriever/Router/LLM)은 한 번만 만들고, 질문마다 새 세션을 사용
+    # 답변 캐시를 켜면 비슷한 질문에 이전 답이 재사용되어 점수가 실제 생성 품질을 반영하지 않으므로 끕니다.
+    agent = ConsultantAgent(use_answer_cache=False)
     
-    for item in raw_data:
+    for idx, item in enumerate(raw_data):
         q = item['question']
         print(f"Processing: {q}")
         
-        # 매번 새로운 세션으로 평가하기 위해 Agent 재생성
-        agent = ConsultantAgent()
-        
         # with_context=True로 설정하여 검색된 문서 리스트까지 받음
-        response, retrieved_docs = agent.run(q, with_context=True)
+        response, retrieved_docs = agent.run(q, session_id=f"eval_{idx}", with_context=True)
         
         questions.append(q)
         answers.append(response)